@@ -55,6 +55,10 @@ FALLBACK_DURATION = 90  # 90 minutes
 WEEKEND_HOUR_ADJUSTMENT = 0.5
 WEEKEND_DURATION_ADJUSTMENT = 10
 
+# Holiday calendar region for this site ('IN' = national calendar,
+# otherwise the name of a data/raw/regions/<REGION>.csv calendar)
+HOLIDAY_REGION = 'IN'
+
 def get_project_root():
     """Get the project root directory"""
     # Go up from config/ to project root
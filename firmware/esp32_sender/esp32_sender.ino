@@ -9,6 +9,23 @@
 #define DIO0_PIN 26
 #define BAND     433E6
 
+// Radio payload CRC-16: the Pi drops corrupted frames in its driver
+// before parsing. Must match LORA_CRC in src/controller/tank_config.py
+#define LORA_CRC 1
+
+// Must match the tank's 'device' in TANKS (src/controller/tank_config.py)
+#define DEVICE_ID "esp32"
+
+// ==========================================
+// PAYLOAD FORMAT (see src/controller/lora_codec.py)
+// ==========================================
+// 1 = compact 11-byte binary frame (~41 ms airtime at SF7),
+// 0 = legacy JSON text (~90 bytes, ~154 ms). The Pi accepts both.
+#define PAYLOAD_BINARY    1
+#define PAYLOAD_CRC       1       // append CRC-8 to binary frames
+// Must map to DEVICE_ID in LORA_NODE_IDS (tank_config.py)
+#define NODE_ID           1
+
 // ==========================================
 // PRESSURE SENSOR (PR12 P210)
 // ==========================================
@@ -53,6 +70,34 @@ float readSensorVoltage() {
   return vSensor;
 }
 
+// CRC-8, poly 0x07, init 0 — same as lora_codec.crc8()
+uint8_t crc8(const uint8_t *data, size_t len) {
+  uint8_t crc = 0;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (int b = 0; b < 8; b++)
+      crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+  }
+  return crc;
+}
+
+// Binary v1 frame, little-endian; returns its length
+size_t encodeBinary(uint8_t *buf, bool healthy, float vSensor, float pressure) {
+  uint16_t pkt = (uint16_t)packetCount;
+  uint16_t mv  = (uint16_t)(vSensor * 1000.0f + 0.5f);
+  int16_t  ckp = healthy ? (int16_t)(pressure * 100.0f + 0.5f) : -100;
+  buf[0]  = 0xC0 | (PAYLOAD_CRC ? 0x08 : 0x00) | 0x01;
+  buf[1]  = NODE_ID;
+  buf[2]  = pkt & 0xFF;  buf[3] = pkt >> 8;
+  buf[4]  = healthy ? 0 : 1;          // 0 = ok, 1 = fault
+  buf[5]  = 1;                        // PR12P210
+  buf[6]  = mv & 0xFF;   buf[7] = mv >> 8;
+  buf[8]  = (uint16_t)ckp & 0xFF;  buf[9] = (uint16_t)ckp >> 8;
+  if (!PAYLOAD_CRC) return 10;
+  buf[10] = crc8(buf, 10);
+  return 11;
+}
+
 bool isSensorHealthy(float vSensor) {
   return (vSensor >= V_FAULT_LOW && vSensor <= V_FAULT_HIGH);
 }
@@ -83,7 +128,11 @@ void setup() {
   LoRa.setSpreadingFactor(7);
   LoRa.setSignalBandwidth(125E3);
   LoRa.setCodingRate4(5);
+#if LORA_CRC
+  LoRa.enableCrc();
+#else
   LoRa.disableCrc();
+#endif
   LoRa.setPreambleLength(8);
   LoRa.setSyncWord(0xF3);
   Serial.println("LoRa OK. Starting readings...\n");
@@ -113,8 +162,16 @@ void loop() {
   Serial.println("---");
 
   // ---- Build LoRa payload ----
+#if PAYLOAD_BINARY
+  uint8_t buf[11];
+  size_t  len = encodeBinary(buf, healthy, vSensor, pressure);
+
+  LoRa.beginPacket();
+  LoRa.write(buf, len);
+  LoRa.endPacket();
+#else
   String status  = healthy ? "ok" : "fault";
-  String payload = "{\"device\":\"esp32\","
+  String payload = "{\"device\":\"" DEVICE_ID "\","
                    "\"sensor\":\"PR12P210\","
                    "\"status\":\"" + status + "\","
                    "\"voltage\":" + String(vSensor, 3) + ","
@@ -124,6 +181,7 @@ void loop() {
   LoRa.beginPacket();
   LoRa.print(payload);
   LoRa.endPacket();
+#endif
 
   Serial.print("LoRa sent #");
   Serial.println(packetCount);
@@ -0,0 +1,100 @@
+"""
+Controller Clock
+=================
+Single source of wall-clock and monotonic time for the controller
+modules (pump logic, data logger, sensor sampler, buttons). Normally
+this is just the system clock; the simulator installs a VirtualClock
+and runs the controller on a VirtualTimeLoop, so asyncio sleeps and
+timestamps advance instantly and days of operation run in seconds.
+"""
+
+import time
+import asyncio
+import selectors
+from datetime import datetime, timedelta
+
+
+class SystemClock:
+    """Real time."""
+
+    def now(self):
+        return datetime.now()
+
+    def monotonic(self):
+        return time.monotonic()
+
+
+class VirtualClock:
+    """Manually advanced time, starting at ``start`` (wall) / 0.0 (monotonic)."""
+
+    def __init__(self, start=None):
+        self.start = start or datetime.now().replace(microsecond=0)
+        self.t     = 0.0
+
+    def now(self):
+        return self.start + timedelta(seconds=self.t)
+
+    def monotonic(self):
+        return self.t
+
+    def advance(self, seconds):
+        if seconds > 0:
+            self.t += seconds
+
+
+_clock = SystemClock()
+
+
+def install(clock):
+    """Route now()/monotonic() through ``clock`` (None restores real time)."""
+    global _clock
+    _clock = clock or SystemClock()
+
+
+def get():
+    return _clock
+
+
+def now():
+    return _clock.now()
+
+
+def monotonic():
+    return _clock.monotonic()
+
+
+# ── Virtual-time event loop ─────────────────────────────────
+
+class _VirtualSelector:
+    """
+    Wraps a real selector. Ready I/O (e.g. call_soon_threadsafe wake-ups)
+    is still polled, but instead of blocking until the next timer the
+    virtual clock jumps straight to it.
+    """
+
+    def __init__(self, clock):
+        self._sel   = selectors.DefaultSelector()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        events = self._sel.select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:                 # nothing scheduled — wait for I/O
+            return self._sel.select(None)
+        self._clock.advance(timeout)
+        return []
+
+    def __getattr__(self, name):
+        return getattr(self._sel, name)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """asyncio loop whose time() is a VirtualClock and never sleeps for real."""
+
+    def __init__(self, clock):
+        super().__init__(_VirtualSelector(clock))
+        self._vclock = clock
+
+    def time(self):
+        return self._vclock.monotonic()
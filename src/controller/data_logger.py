@@ -7,13 +7,15 @@ Logs all sensor readings, pump decisions, and state changes to CSV.
 import os
 import csv
 import logging
-from datetime import datetime
+import clock
 
 logger = logging.getLogger('wilo.logger')
 
 CSV_HEADER = [
     'timestamp',
+    'tank',
     'upper_tank_pct',
+    'upper_tank_l',
     'pressure_kpa',
     'sensor_voltage',
     'sensor_status',
@@ -21,6 +23,10 @@ CSV_HEADER = [
     'lora_snr',
     'pump_current_a',
     'mains_voltage_v',
+    'real_power_w',
+    'power_factor',
+    'energy_kwh',
+    'run_energy_kwh',
     'pump_relay',
     'decision_action',
     'decision_state',
@@ -28,6 +34,10 @@ CSV_HEADER = [
 ]
 
 
+def _fmt(value, spec):
+    return format(value, spec) if value is not None else ''
+
+
 class DataLogger:
     """Append-only CSV logger with periodic flush."""
 
@@ -41,6 +51,7 @@ class DataLogger:
 
     def initialize(self):
         os.makedirs(os.path.dirname(os.path.abspath(self.csv_path)), exist_ok=True)
+        self._rotate_if_header_changed()
         write_header = (not os.path.exists(self.csv_path)
                         or os.path.getsize(self.csv_path) == 0)
         self._file = open(self.csv_path, 'a', newline='')
@@ -48,18 +59,37 @@ class DataLogger:
         if write_header:
             self._writer.writerow(CSV_HEADER)
             self._file.flush()
-        self._last_flush = datetime.now()
+        self._last_flush = clock.now()
         logger.info(f"CSV logger → {os.path.abspath(self.csv_path)}")
 
+    def _rotate_if_header_changed(self):
+        """Move an existing log with an older column layout aside."""
+        if not os.path.exists(self.csv_path) or os.path.getsize(self.csv_path) == 0:
+            return
+        with open(self.csv_path, newline='') as f:
+            header = next(csv.reader(f), None)
+        if header != CSV_HEADER:
+            base, ext = os.path.splitext(self.csv_path)
+            old = f"{base}.{clock.now():%Y%m%dT%H%M%S}{ext}"
+            os.replace(self.csv_path, old)
+            logger.warning(f"CSV columns changed — previous log moved to {old}")
+
     def log(self, upper_pct, pressure_kpa, sensor_v, sensor_status,
             rssi, snr, current_a, voltage_v,
-            pump_relay, decision):
-        """Write one row."""
+            pump_relay, decision, power=None, tank='', upper_l=None):
+        """
+        Write one row. ``power`` is SensorReader.read_all() output (optional);
+        ``tank`` names the tank/pump pair the row belongs to; ``upper_l`` is
+        the tank volume in litres from its geometry.
+        """
+        power = power or {}
         if self._writer is None:
             return
         self._writer.writerow([
-            datetime.now().isoformat(),
+            clock.now().isoformat(),
+            tank or '',
             f"{upper_pct:.1f}" if upper_pct is not None else '',
+            _fmt(upper_l, '.0f'),
             f"{pressure_kpa:.2f}" if pressure_kpa is not None else '',
             f"{sensor_v:.3f}" if sensor_v is not None else '',
             sensor_status or '',
@@ -67,6 +97,10 @@ class DataLogger:
             f"{snr:.2f}" if snr is not None else '',
             f"{current_a:.2f}" if current_a is not None else '',
             f"{voltage_v:.1f}" if voltage_v is not None else '',
+            _fmt(power.get('real_power_w'), '.1f'),
+            _fmt(power.get('power_factor'), '.3f'),
+            _fmt(power.get('energy_kwh'), '.4f'),
+            _fmt(power.get('run_energy_kwh'), '.4f'),
             'ON' if pump_relay else 'OFF',
             decision.action if decision else '',
             decision.state.value if decision else '',
@@ -75,7 +109,7 @@ class DataLogger:
         self._count += 1
 
         # Periodic flush
-        now = datetime.now()
+        now = clock.now()
         if (now - self._last_flush).total_seconds() >= self.interval:
             self._file.flush()
             self._last_flush = now
@@ -0,0 +1,101 @@
+"""
+Decision Trace Ring Buffer
+===========================
+Opt-in, in-memory record of HybridPumpLogic.decide() calls: the inputs,
+every rule evaluated (with its time in nanoseconds), the winning rule and
+the resulting decision. Aggregate counters are kept per PumpState and per
+rule. When tracing is disabled the logic never touches this module.
+
+Dump a running controller's trace with SIGUSR1:
+    sudo systemctl kill -s USR1 wilo-pump
+"""
+
+import json
+import time
+import logging
+from collections import deque, Counter
+
+logger = logging.getLogger('wilo.trace')
+
+
+class DecisionTracer:
+    """Fixed-size ring buffer of decision traces plus aggregate counters."""
+
+    def __init__(self, capacity=2048):
+        self.capacity     = capacity
+        self._buf         = deque(maxlen=capacity)
+        self.decisions    = 0
+        self.state_counts = Counter()     # PumpState value → decisions
+        self.rule_wins    = Counter()     # rule name → times it fired
+        self.rule_evals   = Counter()     # rule name → times evaluated
+        self.rule_ns      = Counter()     # rule name → total evaluation ns
+
+    def run(self, rules, hold, now, upper_pct, pump_is_on, current_amps):
+        """Evaluate ``rules`` in order like decide(), recording a trace."""
+        clock = time.perf_counter_ns
+        evaluated = []
+        decision = None
+        winner = None
+        for name, rule in rules:
+            t0 = clock()
+            decision = rule(now, upper_pct, pump_is_on, current_amps)
+            evaluated.append((name, clock() - t0))
+            if decision is not None:
+                winner = name
+                break
+        if decision is None:
+            decision = hold()
+            winner = 'HOLD'
+
+        self.decisions += 1
+        self.state_counts[decision.state.value] += 1
+        self.rule_wins[winner] += 1
+        for name, ns in evaluated:
+            self.rule_evals[name] += 1
+            self.rule_ns[name] += ns
+        self._buf.append((now, upper_pct, pump_is_on, current_amps,
+                          evaluated, winner, decision))
+        return decision
+
+    # ── Reporting ────────────────────────────────────────────
+
+    def __len__(self):
+        return len(self._buf)
+
+    def records(self):
+        """Buffered traces as dicts, oldest first."""
+        for now, upper_pct, pump_is_on, current_amps, evaluated, winner, d in self._buf:
+            yield {
+                'ts':           now.isoformat(),
+                'upper_pct':    upper_pct,
+                'pump_is_on':   pump_is_on,
+                'current_amps': current_amps,
+                'rules':        [{'rule': n, 'ns': ns} for n, ns in evaluated],
+                'winner':       winner,
+                'action':       d.action,
+                'state':        d.state.value,
+                'reason':       d.reason,
+            }
+
+    def summary(self):
+        return {
+            'decisions': self.decisions,
+            'states':    dict(self.state_counts),
+            'rules': {
+                name: {
+                    'evaluated': self.rule_evals[name],
+                    'fired':     self.rule_wins.get(name, 0),
+                    'mean_ns':   self.rule_ns[name] // self.rule_evals[name],
+                }
+                for name in self.rule_evals
+            },
+            'hold': self.rule_wins.get('HOLD', 0),
+        }
+
+    def dump(self, path):
+        """Write a summary line followed by one JSON line per buffered trace."""
+        with open(path, 'w') as f:
+            f.write(json.dumps({'summary': self.summary()}) + '\n')
+            for rec in self.records():
+                f.write(json.dumps(rec) + '\n')
+        logger.info(f"Decision trace dumped ({len(self._buf)} records) → {path}")
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Multi-Gateway Merge
+====================
+With several receivers in range of one ESP32, each hears (and logs)
+the same (device, pkt). This module turns their streams into one:
+copies of a frame that arrive within LORA_DEDUP_WINDOW_S of the first
+are merged, the best-RSSI copy is kept, and frames come out in
+arrival order.
+
+Live — MergedRadio subscribes to every radio mux in LORA_GATEWAYS and
+behaves like one SX127x for the controller / CSV receiver. Each frame
+is held LORA_MERGE_HOLD_S for copies from the other gateways, then
+released; copies later than that (up to the window) are dropped.
+
+Files — a streaming k-way merge of packet CSVs (lora_csv_receiver
+format), each already in time order. Memory is bounded by the frames
+inside one window, whatever the file sizes:
+
+    python3 gateway_merge.py gw1=logs/lora/gw1.csv gw2=logs/lora/gw2.csv \\
+        -o logs/lora/merged.csv
+
+Frames are keyed by (device, pkt mod 65536); a frame that did not
+parse is keyed by its raw payload.
+"""
+
+import os
+import sys
+import csv
+import time
+import heapq
+import logging
+import argparse
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _HERE)
+
+import lora_codec
+import tank_config as CFG
+from radio_mux import RadioMuxClient
+
+logger = logging.getLogger('wilo.merge')
+
+
+def frame_key(device, pkt, raw=''):
+    """Dedup key: (device, pkt mod 65536), or the raw payload if unparsed."""
+    if device and pkt not in (None, ''):
+        return device, int(pkt) & 0xFFFF
+    return 'raw', raw
+
+
+class Deduplicator:
+    """
+    Time-ordered duplicate suppression. push() frames in (roughly)
+    time order; a frame is released ``hold_s`` after its first copy
+    with the best-RSSI copy seen so far, and its key is remembered for
+    ``window_s`` so later copies are dropped.
+    """
+
+    def __init__(self, window_s=None, hold_s=None):
+        self.window_s = window_s if window_s is not None else CFG.LORA_DEDUP_WINDOW_S
+        self.hold_s   = min(hold_s if hold_s is not None else self.window_s, self.window_s)
+        self._pending = OrderedDict()   # key → [t_first, best_rssi, item, copies]
+        self._recent  = OrderedDict()   # released key → t_first
+        self.received   = 0
+        self.released   = 0
+        self.duplicates = 0
+        self.late       = 0         # copies that came after the frame was released
+
+    def push(self, t, key, rssi, item):
+        """Add one copy; returns the [(item, copies)] released up to ``t``."""
+        out = self.expire(t)
+        self.received += 1
+        entry = self._pending.get(key)
+        if entry is not None:
+            self.duplicates += 1
+            entry[3] += 1
+            if rssi is not None and (entry[1] is None or rssi > entry[1]):
+                entry[1], entry[2] = rssi, item
+        elif key in self._recent and t - self._recent[key] <= self.window_s:
+            self.duplicates += 1
+            self.late += 1
+        else:
+            self._pending[key] = [t, rssi, item, 1]
+        return out
+
+    def expire(self, now):
+        out = []
+        while self._pending:
+            key, entry = next(iter(self._pending.items()))
+            if now - entry[0] < self.hold_s:
+                break
+            del self._pending[key]
+            self._recent[key] = entry[0]
+            out.append((entry[2], entry[3]))
+        while self._recent:
+            key, t = next(iter(self._recent.items()))
+            if now - t <= self.window_s:
+                break
+            del self._recent[key]
+        self.released += len(out)
+        return out
+
+    def drain(self):
+        """Release everything still held (end of input)."""
+        out = [(e[2], e[3]) for e in self._pending.values()]
+        self._pending.clear()
+        self._recent.clear()
+        self.released += len(out)
+        return out
+
+    def next_deadline(self):
+        """Time the oldest held frame is due, or None."""
+        if not self._pending:
+            return None
+        return next(iter(self._pending.values()))[0] + self.hold_s
+
+    def summary(self):
+        return {'received': self.received, 'released': self.released,
+                'duplicates': self.duplicates, 'late': self.late}
+
+
+# ── Live: several radio muxes as one radio ──────────────────
+
+class MergedRadio(RadioMuxClient):
+    """
+    SX127x receive API over several gateway subscriptions (name →
+    radio with the same API, normally a RadioMuxClient each). A merge
+    thread deduplicates their frames into ``rx_queue``.
+    """
+
+    def __init__(self, sources, window_s=None, hold_s=None, queue_size=None):
+        super().__init__(path='', queue_size=queue_size)
+        self.sources = dict(sources)
+        self.dedup   = Deduplicator(window_s, hold_s if hold_s is not None
+                                    else CFG.LORA_MERGE_HOLD_S)
+        self.best    = {name: 0 for name in self.sources}   # releases per gateway
+        self._wake   = threading.Event()
+
+    def receive(self):
+        if self._thread is None:
+            for radio in self.sources.values():
+                radio.start_rx_interrupt(notify=self._wake.set)
+            self._running = True
+            self._thread = threading.Thread(target=self._reader, name='lora-merge', daemon=True)
+            self._thread.start()
+            self.connected = True
+            logger.info(f"Merging gateways: {', '.join(self.sources)}")
+
+    def _reader(self):
+        while self._running:
+            due = self.dedup.next_deadline()
+            self._wake.wait(1.0 if due is None else max(0.0, due - time.time()))
+            self._wake.clear()
+            for name, radio in self.sources.items():
+                while True:
+                    item = radio.get_packet()
+                    if item is None:
+                        break
+                    self._release(self.dedup.push(item[3], self._key(item[0]),
+                                                  item[1], (item, name)))
+            self._release(self.dedup.expire(time.time()))
+
+    @staticmethod
+    def _key(payload):
+        try:
+            pkt = lora_codec.decode(payload)
+        except (ValueError, TypeError):
+            return frame_key('', None, bytes(payload))
+        return frame_key(pkt['device'], pkt['pkt'])
+
+    def _release(self, out):
+        for (item, name), _copies in out:
+            self.best[name] += 1
+            self._enqueue(item)
+
+    def log_stats(self):
+        d = self.dedup.summary()
+        logger.info(f"Merge: received={d['received']} released={d['released']} "
+                    f"duplicates={d['duplicates']} late={d['late']}  best copy: "
+                    + "  ".join(f"{n}={c}" for n, c in self.best.items()))
+
+    def close(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        self._release(self.dedup.drain())
+        for radio in self.sources.values():
+            radio.close()
+        self.log_stats()
+
+
+def mux_radio():
+    """Radio for --radio-mux: one mux subscription, or a merge of LORA_GATEWAYS."""
+    if CFG.LORA_GATEWAYS:
+        return MergedRadio({name: RadioMuxClient(path)
+                            for name, path in CFG.LORA_GATEWAYS.items()})
+    return RadioMuxClient(CFG.LORA_MUX_SOCKET)
+
+
+# ── Files: streaming k-way merge of packet CSVs ─────────────
+
+def _read_rows(name, path):
+    """(t, order, name, row) per data row of one packet CSV."""
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        for n, row in enumerate(reader):
+            try:
+                t = datetime.fromisoformat(row['timestamp']).timestamp()
+            except (KeyError, TypeError, ValueError):
+                continue
+            yield t, n, name, row
+
+
+def _rssi(row):
+    try:
+        return float(row.get('rssi_dbm') or '')
+    except ValueError:
+        return None
+
+
+def merge_files(sources, out_path, window_s=None):
+    """
+    Merge packet CSVs (name → path) into one deduplicated CSV with
+    'gateway' (best copy's source) and 'copies' columns. Returns the
+    Deduplicator for its counters.
+    """
+    dedup = Deduplicator(window_s)
+    streams = [_read_rows(name, path) for name, path in sources.items()]
+    header = None
+    rows = 0
+    with open(out_path, 'w', newline='') as f:
+        writer = None
+        for t, _n, name, row in heapq.merge(*streams, key=lambda r: (r[0], r[1])):
+            if writer is None:
+                header = list(row.keys()) + ['gateway', 'copies']
+                writer = csv.DictWriter(f, fieldnames=header, extrasaction='ignore')
+                writer.writeheader()
+            key = frame_key(row.get('device'), row.get('pkt'), row.get('raw_payload', ''))
+            for (best, gw), copies in dedup.push(t, key, _rssi(row), (row, name)):
+                writer.writerow(dict(best, gateway=gw, copies=copies))
+                rows += 1
+        for (best, gw), copies in dedup.drain():
+            if writer is not None:
+                writer.writerow(dict(best, gateway=gw, copies=copies))
+                rows += 1
+    logger.info(f"{rows} rows → {out_path}")
+    return dedup
+
+
+def _parse_source(arg):
+    name, sep, path = arg.partition('=')
+    if not sep:
+        path = arg
+        name = os.path.splitext(os.path.basename(arg))[0]
+    return name, path
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Merge and deduplicate packet CSVs '
+                                             'from several LoRa gateways')
+    ap.add_argument('sources', nargs='+', metavar='[NAME=]CSV',
+                    help='packet CSV per gateway (name defaults to the file name)')
+    ap.add_argument('-o', '--output', required=True, help='merged CSV')
+    ap.add_argument('--window', type=float, default=CFG.LORA_DEDUP_WINDOW_S,
+                    help='copies within this many seconds are one frame '
+                         '(default: %(default)s)')
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    sources = dict(_parse_source(a) for a in args.sources)
+    d = merge_files(sources, args.output, args.window).summary()
+    print(f"received={d['received']} released={d['released']} "
+          f"duplicates={d['duplicates']}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Upper-Tank Level Filters
+=========================
+Streaming filter stage between the LoRa packet parser and
+HybridPumpLogic.decide(), so one noisy reading near a threshold cannot
+flip the pump. Each filter is O(1) per sample (median: O(N) for a small
+fixed N) and reports its output latency — how far, in samples and
+seconds, its output trails a step in the true level.
+
+  median   Median of the last N readings. Rejects isolated spikes;
+           lag (N-1)/2 samples.
+  ema      Exponential moving average. Lag (1-α)/α samples.
+  kalman   1-D Kalman filter whose prediction uses the known pump state
+           (level rises at the pump's fill rate while it runs), so it
+           smooths hard without lagging behind a filling tank.
+
+A sensor fault (None) passes straight through and resets the filter, as
+does a gap longer than LEVEL_FILTER_RESET_S, so stale readings never
+mix with fresh ones.
+"""
+
+import bisect
+from collections import deque
+
+import tank_config as CFG
+
+
+class LevelFilter:
+    """Base class: pass-through, fault/gap reset and sample-interval tracking."""
+
+    name = 'none'
+
+    def __init__(self, reset_s=None):
+        self.reset_s = reset_s if reset_s is not None else CFG.LEVEL_FILTER_RESET_S
+        self.last_t  = None
+        self.dt      = None         # smoothed sample interval (s)
+
+    def update(self, value, now, pump_on=False):
+        """Feed one reading (level %, None = fault) at monotonic ``now``."""
+        if value is None:
+            self.reset()
+            return None
+        dt = None
+        if self.last_t is not None:
+            dt = now - self.last_t
+            if dt > self.reset_s:
+                self.reset()
+                dt = None
+            elif dt > 0:
+                self.dt = dt if self.dt is None else self.dt + 0.1 * (dt - self.dt)
+        self.last_t = now
+        return self._step(value, dt, pump_on)
+
+    def _step(self, value, dt, pump_on):
+        return value
+
+    def reset(self):
+        self.last_t = None
+
+    # ── Latency ──
+
+    @property
+    def latency_samples(self):
+        return 0.0
+
+    @property
+    def latency_s(self):
+        """Output lag in seconds at the observed sample rate (None until known)."""
+        if self.dt is None:
+            return None
+        return self.latency_samples * self.dt
+
+    def label(self):
+        return self.name
+
+    def describe(self):
+        lag = self.latency_s
+        lag_str = f"{lag:.1f} s" if lag is not None else "? s"
+        return f"{self.label()} — lag {self.latency_samples:.1f} samples / {lag_str}"
+
+
+class MedianFilter(LevelFilter):
+    """Median of the last ``n`` readings (odd n recommended)."""
+
+    name = 'median'
+
+    def __init__(self, n=5, reset_s=None):
+        super().__init__(reset_s)
+        self.n       = max(1, int(n))
+        self._window = deque()
+        self._sorted = []
+
+    def _step(self, value, dt, pump_on):
+        if len(self._window) == self.n:
+            old = self._window.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+        self._window.append(value)
+        bisect.insort(self._sorted, value)
+        k = len(self._sorted)
+        if k % 2:
+            return self._sorted[k // 2]
+        return (self._sorted[k // 2 - 1] + self._sorted[k // 2]) / 2.0
+
+    def reset(self):
+        super().reset()
+        self._window.clear()
+        self._sorted = []
+
+    @property
+    def latency_samples(self):
+        return (self.n - 1) / 2.0
+
+    def label(self):
+        return f"median(n={self.n})"
+
+
+class EmaFilter(LevelFilter):
+    """y += α (x − y)."""
+
+    name = 'ema'
+
+    def __init__(self, alpha=0.3, reset_s=None):
+        super().__init__(reset_s)
+        if not 0 < alpha <= 1:
+            raise ValueError(f"EMA alpha must be in (0, 1], got {alpha}")
+        self.alpha = alpha
+        self.y     = None
+
+    def _step(self, value, dt, pump_on):
+        if self.y is None:
+            self.y = value
+        else:
+            self.y += self.alpha * (value - self.y)
+        return self.y
+
+    def reset(self):
+        super().reset()
+        self.y = None
+
+    @property
+    def latency_samples(self):
+        return (1.0 - self.alpha) / self.alpha
+
+    def label(self):
+        return f"ema(α={self.alpha})"
+
+
+class KalmanLevelFilter(LevelFilter):
+    """
+    Scalar Kalman filter on level %. Predict: x += fill_rate·dt while the
+    pump runs (household draw is left to the process noise q, in %²/s);
+    update with measurement noise r (%²).
+    """
+
+    name = 'kalman'
+
+    def __init__(self, q=1e-4, r=0.04, fill_rate_pct_s=0.0, reset_s=None):
+        super().__init__(reset_s)
+        self.q    = q
+        self.r    = r
+        self.fill = fill_rate_pct_s
+        self.x    = None
+        self.p    = None
+        self.k    = None            # last Kalman gain
+
+    def _step(self, value, dt, pump_on):
+        if self.x is None:
+            self.x, self.p = value, self.r
+            return self.x
+        dt = dt if dt and dt > 0 else (self.dt or 1.0)
+        if pump_on:
+            self.x += self.fill * dt
+        self.p += self.q * dt
+        self.k  = self.p / (self.p + self.r)
+        self.x += self.k * (value - self.x)
+        self.p *= (1.0 - self.k)
+        return self.x
+
+    def reset(self):
+        super().reset()
+        self.x = self.p = None
+
+    @property
+    def latency_samples(self):
+        """Steady-state lag (1-K)/K for an unmodelled step."""
+        k = self.k
+        if k is None:
+            # Steady-state posterior variance: P² + qP − qr = 0
+            q = self.q * (self.dt or 1.0)
+            p = (-q + (q * q + 4 * q * self.r) ** 0.5) / 2.0
+            k = (p + q) / (p + q + self.r)
+        return (1.0 - k) / k
+
+    def label(self):
+        return f"kalman(q={self.q:g}, r={self.r:g}, fill={self.fill * 60:.2f}%/min)"
+
+
+def make_filter(kind, capacity_l=None):
+    """LevelFilter for a LEVEL_FILTER name ('median' | 'ema' | 'kalman' | None)."""
+    kind = (kind or 'none').lower()
+    if kind == 'none':
+        return LevelFilter()
+    if kind == 'median':
+        return MedianFilter(CFG.LEVEL_FILTER_MEDIAN_N)
+    if kind == 'ema':
+        return EmaFilter(CFG.LEVEL_FILTER_EMA_ALPHA)
+    if kind == 'kalman':
+        capacity_l = capacity_l or CFG.UPPER_TANK_CAPACITY_L
+        fill = CFG.PUMP_FLOW_RATE_LPM / capacity_l * 100.0 / 60.0
+        return KalmanLevelFilter(CFG.LEVEL_FILTER_KALMAN_Q, CFG.LEVEL_FILTER_KALMAN_R, fill)
+    raise ValueError(f"Unknown LEVEL_FILTER '{kind}' (median | ema | kalman | none)")
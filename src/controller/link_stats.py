@@ -0,0 +1,259 @@
+"""
+LoRa Link Statistics
+=====================
+Per-device tracking of the ``pkt`` sequence number and radio quality,
+in O(1) memory per device:
+
+  • gaps (lost packets), duplicates, late (reordered) packets and
+    sender resets (ESP32 reboot → pkt restarts at 0);
+  • packet-delivery ratio, cumulative and over the last
+    LORA_LINK_WINDOW sequence numbers (a bitmap of which were heard);
+  • inter-arrival time, RSSI and SNR as exponentially weighted
+    mean / std with min / max.
+
+A falling delivery ratio shows a marginal link well before the sender
+goes silent for LORA_TIMEOUT_S and the pump is switched off.
+
+Sequence numbers are compared modulo 65536 (the binary frame's uint16).
+A backward step inside the window is a duplicate if that number was
+already heard, else a late packet — unless, judging by the sender's
+period, the packet would have been delayed longer than
+LORA_SEQ_REORDER_S, in which case the sender restarted. A forward jump
+larger than the elapsed time can explain is also a restart, not loss.
+"""
+
+import logging
+
+import tank_config as CFG
+
+logger = logging.getLogger('wilo.link')
+
+SEQ_MOD = 1 << 16
+
+
+class EwStat:
+    """Exponentially weighted mean / variance plus min / max."""
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.n     = 0
+        self.mean  = None
+        self.var   = 0.0
+        self.min   = None
+        self.max   = None
+
+    def add(self, x):
+        self.n += 1
+        if self.mean is None:
+            self.mean = self.min = self.max = x
+            return
+        d = x - self.mean
+        self.mean += self.alpha * d
+        self.var   = (1.0 - self.alpha) * (self.var + self.alpha * d * d)
+        self.min   = min(self.min, x)
+        self.max   = max(self.max, x)
+
+    @property
+    def std(self):
+        return self.var ** 0.5
+
+    def summary(self, nd=1):
+        if self.mean is None:
+            return {}
+        return {'mean': round(self.mean, nd), 'std': round(self.std, nd),
+                'min': round(self.min, nd), 'max': round(self.max, nd)}
+
+
+class LinkTracker:
+    """Sequence and radio statistics for one sending device."""
+
+    # update() results
+    NEW, DUPLICATE, LATE, RESET = 'new', 'duplicate', 'late', 'reset'
+
+    def __init__(self, device, window=None, alpha=None, reorder_s=None, pdr_warn=None):
+        self.device    = device
+        self.window    = window or CFG.LORA_LINK_WINDOW
+        self.reorder_s = reorder_s if reorder_s is not None else CFG.LORA_SEQ_REORDER_S
+        self.pdr_warn  = pdr_warn if pdr_warn is not None else CFG.LORA_PDR_WARN
+        alpha = alpha or CFG.LORA_LINK_ALPHA
+
+        self.received   = 0         # distinct sequence numbers heard
+        self.lost       = 0         # skipped numbers not (yet) heard late
+        self.duplicates = 0
+        self.late       = 0
+        self.resets     = 0
+        self.unsequenced = 0        # packets without a pkt field
+
+        self.last_seq  = None       # highest sequence number heard
+        self.last_t    = None       # arrival time of the previous packet
+        self._seen     = 0          # bit k: last_seq - k was heard
+        self._span     = 0          # sequence numbers covered by _seen (≤ window)
+        self._warned   = False
+
+        self.period      = EwStat(alpha)    # sender period estimate, s / seq step
+        self.inter_arrival = EwStat(alpha)
+        self.rssi        = EwStat(alpha)
+        self.snr         = EwStat(alpha)
+
+    # ── Update ──
+
+    def update(self, seq, now, rssi=None, snr=None):
+        """Account for one packet (``now`` in seconds, any monotonic base)."""
+        elapsed = now - self.last_t if self.last_t is not None else None
+        if elapsed is not None and elapsed >= 0:
+            self.inter_arrival.add(elapsed)
+        self.last_t = now
+        if rssi is not None:
+            self.rssi.add(rssi)
+        if snr is not None:
+            self.snr.add(snr)
+
+        if seq is None or seq < 0:
+            self.unsequenced += 1
+            return self.NEW
+        seq %= SEQ_MOD
+        if self.last_seq is None:
+            self._restart(seq)
+            return self.NEW
+
+        step = (seq - self.last_seq) % SEQ_MOD
+        if step and step < SEQ_MOD // 2:
+            result = self._forward(seq, step, elapsed)
+        else:
+            result = self._backward(seq, (self.last_seq - seq) % SEQ_MOD, elapsed)
+        self._check_pdr()
+        return result
+
+    def _restart(self, seq):
+        self.received += 1
+        self.last_seq  = seq
+        self._seen     = 1
+        self._span     = 1
+
+    def _forward(self, seq, step, elapsed):
+        period = self.period.mean
+        if (elapsed is not None and period and step > self.window
+                and step * period > 2.0 * elapsed + self.reorder_s):
+            # Counter jumped further than the sender could have counted
+            logger.info(f"{self.device}: sequence reset {self.last_seq} → {seq}")
+            self.resets += 1
+            self._restart(seq)
+            return self.RESET
+        if elapsed is not None and elapsed > 0:
+            self.period.add(elapsed / step)
+        self.received += 1
+        self.lost     += step - 1
+        self.last_seq  = seq
+        self._seen     = ((self._seen << step) | 1) & ((1 << self.window) - 1)
+        self._span     = min(self.window, self._span + step)
+        return self.NEW
+
+    def _backward(self, seq, back, elapsed):
+        # Time since this number was sent, from the sender's period
+        delay = (elapsed or 0.0) + back * (self.period.mean or 0.0)
+        if back >= self.window or delay > self.reorder_s:
+            logger.info(f"{self.device}: sequence reset {self.last_seq} → {seq}")
+            self.resets += 1
+            self._restart(seq)
+            return self.RESET
+        bit = 1 << back
+        if self._seen & bit:
+            self.duplicates += 1
+            return self.DUPLICATE
+        if back >= self._span:
+            self._span = back + 1
+        else:
+            self.lost -= 1
+        self._seen |= bit
+        self.received += 1
+        self.late     += 1
+        return self.LATE
+
+    def _check_pdr(self):
+        pdr = self.pdr_window
+        if pdr is None or self._span < self.window // 2:
+            return
+        if not self._warned and pdr < self.pdr_warn:
+            self._warned = True
+            logger.warning(f"{self.device}: delivery ratio {pdr:.0%} over the last "
+                           f"{self._span} packets — {self._radio_str()}")
+        elif self._warned and pdr >= self.pdr_warn + 0.05:
+            self._warned = False
+            logger.info(f"{self.device}: delivery ratio recovered to {pdr:.0%}")
+
+    # ── Results ──
+
+    @property
+    def pdr(self):
+        """Cumulative delivery ratio (None before any sequenced packet)."""
+        total = self.received + self.lost
+        return self.received / total if total else None
+
+    @property
+    def pdr_window(self):
+        """Delivery ratio over the last ``window`` sequence numbers."""
+        if not self._span:
+            return None
+        return bin(self._seen).count('1') / self._span
+
+    def silent_s(self, now):
+        return now - self.last_t if self.last_t is not None else None
+
+    def summary(self):
+        pdr, pdr_w = self.pdr, self.pdr_window
+        return {
+            'device':        self.device,
+            'received':      self.received,
+            'lost':          self.lost,
+            'duplicates':    self.duplicates,
+            'late':          self.late,
+            'resets':        self.resets,
+            'pdr':           round(pdr, 4) if pdr is not None else None,
+            'pdr_window':    round(pdr_w, 4) if pdr_w is not None else None,
+            'last_seq':      self.last_seq,
+            'inter_arrival_s': self.inter_arrival.summary(2),
+            'rssi_dbm':      self.rssi.summary(1),
+            'snr_db':        self.snr.summary(1),
+        }
+
+    def describe(self):
+        pdr, pdr_w = self.pdr, self.pdr_window
+        pdr_str = (f"pdr={pdr:.1%} last{self._span}={pdr_w:.1%}"
+                   if pdr is not None else "pdr=?")
+        ia = self.inter_arrival
+        ia_str = f"Δt={ia.mean:.2f}±{ia.std:.2f}s max={ia.max:.1f}s" if ia.mean is not None else "Δt=?"
+        return (f"{self.device}: rx={self.received} lost={self.lost} dup={self.duplicates} "
+                f"late={self.late} resets={self.resets} {pdr_str}  {ia_str}  "
+                f"{self._radio_str()}")
+
+    def _radio_str(self):
+        if self.rssi.mean is None or self.snr.mean is None:
+            return "RSSI=?"
+        return (f"RSSI={self.rssi.mean:.0f}±{self.rssi.std:.0f}dBm "
+                f"SNR={self.snr.mean:.1f}±{self.snr.std:.1f}dB")
+
+
+class LinkStats:
+    """LinkTracker per device, created on first packet."""
+
+    def __init__(self, **kwargs):
+        self._kwargs  = kwargs
+        self.trackers = {}
+
+    def get(self, device):
+        tracker = self.trackers.get(device)
+        if tracker is None:
+            tracker = self.trackers[device] = LinkTracker(device, **self._kwargs)
+        return tracker
+
+    def update(self, device, seq, now, rssi=None, snr=None):
+        """Feed one packet; returns (tracker, LinkTracker.NEW | DUPLICATE | LATE | RESET)."""
+        tracker = self.get(device)
+        return tracker, tracker.update(seq, now, rssi, snr)
+
+    def __iter__(self):
+        return iter(self.trackers.values())
+
+    def log_summary(self, log=None):
+        for tracker in self:
+            (log or logger).info(f"Link {tracker.describe()}")
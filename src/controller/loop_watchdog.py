@@ -0,0 +1,239 @@
+"""
+Control-Loop Latency Watchdog
+==============================
+Monotonic-clock timing for the controller's event loop:
+
+  * per-stage latency histograms (lora_read, filter, sensor_read, buttons,
+    decide, relay, csv_log, ml_refresh)
+  * per-reaction ("cycle") histograms: input arrival → relay driven
+  * tick jitter: how late the periodic tick wakes up
+  * an overrun counter + warning when a cycle exceeds the budget
+
+Optionally pets the systemd watchdog (sd_notify WATCHDOG=1) so a hung
+event loop gets the service restarted — and the ExecStopPost relay
+cleanup run. No external dependencies; sd_notify is a datagram on the
+socket systemd passes in $NOTIFY_SOCKET.
+"""
+
+import os
+import time
+import socket
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger('wilo.watchdog')
+
+# Histogram bucket upper bounds in milliseconds (last bucket = overflow)
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with count / mean / max."""
+
+    def __init__(self, bounds_ms=BUCKETS_MS):
+        self.bounds_ns = [int(b * 1e6) for b in bounds_ms]
+        self.bounds_ms = bounds_ms
+        self.counts    = [0] * (len(bounds_ms) + 1)
+        self.n         = 0
+        self.total_ns  = 0
+        self.max_ns    = 0
+
+    def add(self, ns):
+        i = 0
+        for bound in self.bounds_ns:
+            if ns <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.n += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, q):
+        """Upper bound (ms) of the bucket holding the q-th percentile."""
+        if not self.n:
+            return None
+        target = q / 100.0 * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                if i < len(self.bounds_ms):
+                    return min(self.bounds_ms[i], round(self.max_ns / 1e6, 3))
+                return self.max_ns / 1e6
+        return self.max_ns / 1e6
+
+    def summary(self):
+        if not self.n:
+            return {'n': 0}
+        return {
+            'n':       self.n,
+            'mean_ms': round(self.total_ns / self.n / 1e6, 3),
+            'p50_ms':  self.percentile(50),
+            'p99_ms':  self.percentile(99),
+            'max_ms':  round(self.max_ns / 1e6, 3),
+        }
+
+
+class SystemdNotifier:
+    """Minimal sd_notify(); a no-op when not started by systemd."""
+
+    def __init__(self):
+        addr = os.environ.get('NOTIFY_SOCKET')
+        self.sock = None
+        self.addr = None
+        usec = os.environ.get('WATCHDOG_USEC')
+        self.watchdog_s = int(usec) / 1e6 if usec and usec.isdigit() else None
+        if not addr:
+            return
+        if addr.startswith('@'):            # abstract namespace
+            addr = '\0' + addr[1:]
+        try:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.addr = addr
+        except (AttributeError, OSError) as e:
+            logger.warning(f"sd_notify unavailable: {e}")
+
+    @property
+    def enabled(self):
+        return self.sock is not None
+
+    def notify(self, state):
+        if self.sock is None:
+            return
+        try:
+            self.sock.sendto(state.encode(), self.addr)
+        except OSError as e:
+            logger.debug(f"sd_notify failed: {e}")
+
+    def ready(self):
+        self.notify('READY=1')
+
+    def ping(self):
+        self.notify('WATCHDOG=1')
+
+    def stopping(self):
+        self.notify('STOPPING=1')
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class LoopWatchdog:
+    """Stage / cycle latency tracking with an overrun budget."""
+
+    def __init__(self, budget_ms=100, systemd=False):
+        self.budget_ns  = int(budget_ms * 1e6)
+        self.budget_ms  = budget_ms
+        self.stages     = {}                 # stage name → LatencyHistogram
+        self.cycles     = {}                 # trigger name → LatencyHistogram
+        self.jitter     = LatencyHistogram()
+        self.overruns   = 0
+        self.last_overrun = None             # (trigger, ms, slowest stage)
+        self._cycle     = None               # [trigger, t0, {stage: ns}]
+        self.notifier   = SystemdNotifier() if systemd else None
+
+    # ── Timing ────────────────────────────────────────────────
+
+    @contextmanager
+    def stage(self, name):
+        """Time one stage; also attributed to the enclosing cycle, if any."""
+        t0 = time.monotonic_ns()
+        try:
+            yield
+        finally:
+            ns = time.monotonic_ns() - t0
+            self._hist(self.stages, name).add(ns)
+            if self._cycle is not None:
+                spent = self._cycle[2]
+                spent[name] = spent.get(name, 0) + ns
+
+    @contextmanager
+    def cycle(self, trigger):
+        """
+        Time a whole reaction (input → decision → relay). Nested cycles
+        are folded into the outermost one.
+        """
+        if self._cycle is not None:
+            yield
+            return
+        self._cycle = [trigger, time.monotonic_ns(), {}]
+        try:
+            yield
+        finally:
+            trigger, t0, spent = self._cycle
+            self._cycle = None
+            ns = time.monotonic_ns() - t0
+            self._hist(self.cycles, trigger).add(ns)
+            if ns > self.budget_ns:
+                self._overrun(trigger, ns, spent)
+
+    def tick_late(self, late_ns):
+        """Record how late the periodic tick woke up."""
+        self.jitter.add(max(0, late_ns))
+        if late_ns > self.budget_ns:
+            self.overruns += 1
+            self.last_overrun = ('tick', late_ns / 1e6, 'event-loop')
+            logger.warning(f"Event loop stalled: tick {late_ns / 1e6:.1f} ms late "
+                           f"(budget {self.budget_ms} ms)")
+
+    def _overrun(self, trigger, ns, spent):
+        self.overruns += 1
+        slowest = max(spent, key=spent.get) if spent else '?'
+        self.last_overrun = (trigger, ns / 1e6, slowest)
+        detail = '  '.join(f"{k}={v / 1e6:.1f}" for k, v in spent.items())
+        logger.warning(f"Cycle overrun #{self.overruns}: {trigger} took {ns / 1e6:.1f} ms "
+                       f"> {self.budget_ms} ms  [{detail}]")
+
+    @staticmethod
+    def _hist(table, name):
+        h = table.get(name)
+        if h is None:
+            h = table[name] = LatencyHistogram()
+        return h
+
+    # ── systemd ───────────────────────────────────────────────
+
+    def ready(self):
+        if self.notifier:
+            self.notifier.ready()
+            if self.notifier.enabled:
+                wd = self.notifier.watchdog_s
+                logger.info(f"systemd notify enabled (watchdog "
+                            f"{f'{wd:.0f}s' if wd else 'off'})")
+
+    def pet(self):
+        """Tell systemd the event loop is alive."""
+        if self.notifier:
+            self.notifier.ping()
+
+    def close(self):
+        if self.notifier:
+            self.notifier.stopping()
+            self.notifier.close()
+
+    # ── Reporting ─────────────────────────────────────────────
+
+    def summary(self):
+        return {
+            'budget_ms': self.budget_ms,
+            'overruns':  self.overruns,
+            'jitter':    self.jitter.summary(),
+            'stages':    {k: h.summary() for k, h in self.stages.items()},
+            'cycles':    {k: h.summary() for k, h in self.cycles.items()},
+        }
+
+    def log_summary(self):
+        def fmt(h):
+            s = h.summary()
+            if not s['n']:
+                return 'n=0'
+            return f"n={s['n']} p50≤{s['p50_ms']} p99≤{s['p99_ms']} max={s['max_ms']}ms"
+        logger.info(f"Latency: overruns={self.overruns}  tick jitter {fmt(self.jitter)}")
+        for name, h in sorted(self.cycles.items()):
+            logger.info(f"  cycle  {name:<12} {fmt(h)}")
+        for name, h in sorted(self.stages.items()):
+            logger.info(f"  stage  {name:<12} {fmt(h)}")
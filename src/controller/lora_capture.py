@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+LoRa Raw Capture / Replay
+==========================
+Records every frame the SX127x hands over, with its radio metadata, so
+field problems can be reproduced off-Pi and the packet path
+benchmarked.
+
+Capture file (append-only, little-endian):
+
+    header   b'WLORACAP' + uint16 version (1)
+    record   float64 t_rx (epoch s), int16 RSSI (dBm), float32 SNR (dB),
+             uint8 flags (bit 0 = CRC error), uint8 length, payload
+
+The receivers write one with --capture PATH (pump_controller.py,
+lora_csv_receiver.py, radio_mux.py — whichever owns the radio). A
+record cut short by a crash is ignored on reading.
+
+Replay feeds a capture through FakeSX127xSpi into the real driver and
+on into one of the packet paths, at the recorded pace (--speed 1),
+N× faster, or as fast as the consumer keeps up (--speed max):
+
+    python3 lora_capture.py info logs/lora/field.wlc
+    python3 lora_capture.py replay logs/lora/field.wlc --target parse
+    python3 lora_capture.py replay field.wlc --target receiver --speed max
+    python3 lora_capture.py replay field.wlc --target controller --speed 10
+
+Replayed frames get a fresh t_rx from the driver; the recorded times
+only set the pace.
+"""
+
+import os
+import sys
+import time
+import struct
+import logging
+import argparse
+import threading
+from collections import namedtuple
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_PROJECT = os.path.abspath(os.path.join(_HERE, '..', '..'))
+sys.path.insert(0, _PROJECT)
+sys.path.insert(0, _HERE)
+
+import tank_config as CFG
+
+logger = logging.getLogger('wilo.capture')
+
+MAGIC     = b'WLORACAP'
+VERSION   = 1
+_FILE_HDR = struct.Struct('<8sH')
+_RECORD   = struct.Struct('<dhfBB')
+FLAG_CRC_ERROR = 0x01
+
+CaptureRecord = namedtuple('CaptureRecord', 't rssi snr crc_error payload')
+
+
+# ── Writing ─────────────────────────────────────────────────
+
+class CaptureWriter:
+    """Append frames to a capture file (thread-safe; flushed every flush_s)."""
+
+    def __init__(self, path, flush_s=None):
+        self.path    = path
+        self.flush_s = flush_s if flush_s is not None else CFG.LORA_CAPTURE_FLUSH_S
+        self.records = 0
+        self._lock   = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        fresh = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not fresh:
+            with open(path, 'rb') as f:
+                magic, version = _FILE_HDR.unpack(f.read(_FILE_HDR.size).ljust(_FILE_HDR.size, b'\0'))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a v{VERSION} LoRa capture")
+        self._file = open(path, 'ab', buffering=1 << 16)
+        if fresh:
+            self._file.write(_FILE_HDR.pack(MAGIC, VERSION))
+        self._last_flush = time.monotonic()
+        logger.info(f"Capturing raw LoRa frames to {os.path.abspath(path)}")
+
+    def write(self, payload, rssi, snr, t_rx, crc_error=False):
+        payload = bytes(payload)[:255]
+        rec = _RECORD.pack(t_rx, int(rssi or 0), float(snr or 0.0),
+                           FLAG_CRC_ERROR if crc_error else 0, len(payload))
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(rec + payload)
+            self.records += 1
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_s:
+                self._file.flush()
+                self._last_flush = now
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                logger.info(f"Capture closed — {self.records} frames")
+
+
+def attach(lora, path):
+    """Start capturing on ``lora`` if it is a driver that supports it."""
+    if not path:
+        return None
+    if not hasattr(lora, 'capture'):
+        logger.warning("Capture needs the process that owns the SX127x "
+                       "(e.g. radio_mux.py --capture); not capturing")
+        return None
+    lora.capture = CaptureWriter(path)
+    return lora.capture
+
+
+# ── Reading ─────────────────────────────────────────────────
+
+def read_capture(path):
+    """Yield CaptureRecord for each complete record in the file."""
+    with open(path, 'rb') as f:
+        head = f.read(_FILE_HDR.size)
+        if len(head) < _FILE_HDR.size or _FILE_HDR.unpack(head) != (MAGIC, VERSION):
+            raise ValueError(f"{path} is not a v{VERSION} LoRa capture")
+        while True:
+            rec = f.read(_RECORD.size)
+            if len(rec) < _RECORD.size:
+                return
+            t, rssi, snr, flags, length = _RECORD.unpack(rec)
+            payload = f.read(length)
+            if len(payload) < length:
+                return                      # truncated tail
+            yield CaptureRecord(t, rssi, round(snr, 2), bool(flags & FLAG_CRC_ERROR), payload)
+
+
+def capture_info(path):
+    n = crc = 0
+    first = last = None
+    rssi_min = rssi_max = None
+    for r in read_capture(path):
+        n += 1
+        crc += r.crc_error
+        first = r.t if first is None else first
+        last = r.t
+        rssi_min = r.rssi if rssi_min is None else min(rssi_min, r.rssi)
+        rssi_max = r.rssi if rssi_max is None else max(rssi_max, r.rssi)
+    return {'frames': n, 'crc_errors': crc,
+            'span_s': round(last - first, 1) if n else 0.0,
+            'rssi_min': rssi_min, 'rssi_max': rssi_max}
+
+
+# ── Replay ──────────────────────────────────────────────────
+
+def fake_radio():
+    """Real SX127x driver on FakeSX127xSpi / FakeGPIO; returns (driver, spi)."""
+    from relay_control import FakeGPIO
+    from sx127x import SX127x, FakeSX127xSpi
+    gpio = FakeGPIO()
+    spi = FakeSX127xSpi(gpio, CFG.LORA_DIO0_PIN)
+    lora = SX127x(reset_pin=CFG.LORA_RESET_PIN, dio0_pin=CFG.LORA_DIO0_PIN,
+                  frequency=CFG.LORA_FREQUENCY, spi=spi, gpio=gpio,
+                  queue_size=CFG.LORA_RX_QUEUE_SIZE, crc=CFG.LORA_CRC)
+    return lora, spi
+
+
+class Feeder(threading.Thread):
+    """
+    Inject capture records into a FakeSX127xSpi. ``speed`` 1 keeps the
+    recorded pace, N compresses it N×, None (max) sends as soon as the
+    driver queue has room, so nothing is dropped and the consumer sets
+    the rate.
+    """
+
+    def __init__(self, records, spi, lora, speed=None, on_done=None):
+        super().__init__(name='capture-replay', daemon=True)
+        self.records = records
+        self.spi     = spi
+        self.lora    = lora
+        self.speed   = speed
+        self.on_done = on_done
+        self.sent    = 0
+        self.elapsed = None
+        self.stop_flag = False
+
+    def run(self):
+        t0 = time.perf_counter()
+        first = None
+        q = self.lora.rx_queue
+        for r in self.records:
+            if self.stop_flag:
+                break
+            if self.speed:
+                first = r.t if first is None else first
+                delay = t0 + (r.t - first) / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                while q.maxsize and q.qsize() >= q.maxsize - 1 and not self.stop_flag:
+                    time.sleep(0.0005)
+            # inject() refuses until the consumer has put the radio in RX
+            while not self.spi.inject(r.payload, r.rssi, r.snr, crc_error=r.crc_error):
+                if self.stop_flag:
+                    return
+                time.sleep(0.001)
+            self.sent += 1
+        # Let the consumer drain what is queued
+        while q.qsize() and not self.stop_flag:
+            time.sleep(0.001)
+        self.elapsed = time.perf_counter() - t0
+        if self.on_done:
+            self.on_done()
+
+
+def replay_parse(path):
+    """
+    Decode every frame with pump_controller.parse_lora_packet (no radio,
+    no pacing). Frames recorded with a CRC error are skipped and counted,
+    as the driver drops them before parsing.
+    """
+    from pump_controller import parse_lora_packet
+    records = list(read_capture(path))
+    ok = crc_errors = 0
+    logging.getLogger('wilo.main').setLevel(logging.ERROR)     # per-frame parse warnings
+    t0 = time.perf_counter()
+    for r in records:
+        if r.crc_error:
+            crc_errors += 1
+            continue
+        ok += parse_lora_packet(r.payload) is not None
+    dt = time.perf_counter() - t0
+    return {'frames': len(records), 'crc_errors': crc_errors, 'parsed': ok,
+            'failed': len(records) - crc_errors - ok,
+            'elapsed_s': round(dt, 3), 'frames_per_s': round(len(records) / dt) if dt else None}
+
+
+def replay_receiver(path, csv_path, speed=None):
+    """Run LoRaCsvReceiver on the fake radio until the capture is exhausted."""
+    from lora_csv_receiver import LoRaCsvReceiver
+    lora, spi = fake_radio()
+    receiver = LoRaCsvReceiver(csv_path, lora=lora)
+
+    def done():
+        receiver.running = False
+    feeder = Feeder(read_capture(path), spi, lora, speed, on_done=done)
+    feeder.start()
+    receiver.run()
+    feeder.stop_flag = True
+    feeder.join()
+    s = receiver.stats
+    return _result(feeder, lora, received=s.received, parse_errors=s.parse_errors,
+                   latency=s.latency.summary())
+
+
+def replay_controller(path, speed=None):
+    """Run PumpController (dry-run, outputs under LORA_REPLAY_DIR) on the fake radio."""
+    from pump_controller import PumpController
+    from tanks import scratch_specs
+    replay_dir = CFG.LORA_REPLAY_DIR
+    CFG.LOG_DIR             = replay_dir
+    CFG.CSV_LOG_PATH        = os.path.join(replay_dir, 'replay_pump_log.csv')
+    CFG.STATE_FILE          = os.path.join(replay_dir, 'pump_state.json')
+    CFG.DECISION_TRACE_PATH = os.path.join(replay_dir, 'decision_trace.jsonl')
+    CFG.ML_ENABLED          = False
+    CFG.SYSTEMD_WATCHDOG    = False
+    specs = scratch_specs(replay_dir)      # state files only under replay_dir
+
+    lora, spi = fake_radio()
+    ctrl = PumpController(dry_run=True, lora=lora, specs=specs)
+    ctrl.initialize()
+    feeder = Feeder(read_capture(path), spi, lora, speed, on_done=ctrl.stop)
+    feeder.start()
+    try:
+        ctrl.run()
+    finally:
+        feeder.stop_flag = True
+        feeder.join()
+        ctrl.shutdown()
+    links = {t.summary()['device']: t.summary() for t in ctrl.links}
+    return _result(feeder, lora, links=links)
+
+
+def _result(feeder, lora, **extra):
+    dt = feeder.elapsed or 0.0
+    out = {'frames': feeder.sent, 'elapsed_s': round(dt, 3),
+           'frames_per_s': round(feeder.sent / dt) if dt else None,
+           'driver_dropped': lora.rx_dropped, 'queue_peak': lora.rx_queue_peak,
+           'crc_errors': lora.crc_errors}
+    out.update(extra)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Inspect or replay a raw LoRa capture')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('info', help='frame count, time span, CRC errors')
+    p.add_argument('capture')
+    p = sub.add_parser('replay', help='feed a capture through a packet path')
+    p.add_argument('capture')
+    p.add_argument('--target', choices=('parse', 'receiver', 'controller'), default='parse')
+    p.add_argument('--speed', default='max',
+                   help="1 = recorded pace, N = N× faster, 'max' = as fast as consumed")
+    p.add_argument('--csv', default=os.path.join(CFG.LORA_REPLAY_DIR, 'replay_packets.csv'),
+                   help='packet CSV for --target receiver (default: %(default)s)')
+    p.add_argument('--verbose', '-v', action='store_true')
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if getattr(args, 'verbose', False) else logging.INFO,
+                        format='%(asctime)s [%(name)-12s] %(levelname)-7s %(message)s',
+                        datefmt='%H:%M:%S')
+    if args.cmd == 'info':
+        result = capture_info(args.capture)
+    else:
+        speed = None if args.speed == 'max' else float(args.speed)
+        if args.target == 'parse':
+            result = replay_parse(args.capture)
+        elif args.target == 'receiver':
+            result = replay_receiver(args.capture, args.csv, speed)
+        else:
+            result = replay_controller(args.capture, speed)
+    for k, v in result.items():
+        print(f"{k:>16}: {v}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
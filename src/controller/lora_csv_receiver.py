@@ -2,23 +2,30 @@
 """
 ESP32 LoRa pressure packet receiver for Raspberry Pi.
 
-Listens for JSON packets from the ESP32 sender, decodes the payload,
-and appends each packet to a CSV file. The CSV file is created with
-headers automatically if it does not already exist.
-
-Expected ESP32 payload:
+Listens for packets from the ESP32 sender (compact binary or JSON, see
+lora_codec.py), decodes the payload, and appends each packet to a CSV
+file. The CSV file is created with headers automatically if it does not
+already exist.
+
+Reception and persistence are decoupled: the radio stage (the DIO0
+edge callback, or a poll thread) only drains the FIFO into the driver's
+bounded queue, and the main thread parses, writes and logs. A slow
+SD-card flush then delays rows, not reception; if the queue overflows
+the oldest packets are dropped and counted.
+
+Binary frames are stored in raw_payload as hex. Legacy JSON payload:
     {"device":"esp32","sensor":"PR12P210","status":"ok",
      "voltage":1.234,"pressure_kpa":12.50,"pkt":42}
 """
 
 import argparse
 import csv
-import json
 import logging
 import os
 import signal
 import sys
 import time
+import threading
 from datetime import datetime
 
 _HERE = os.path.dirname(os.path.abspath(__file__))
@@ -26,8 +33,13 @@ _PROJECT = os.path.abspath(os.path.join(_HERE, '..', '..'))
 sys.path.insert(0, _PROJECT)
 sys.path.insert(0, _HERE)
 
+import lora_capture
+import lora_codec
 import tank_config as CFG
 from sx127x import SX127x
+from gateway_merge import mux_radio
+from loop_watchdog import LatencyHistogram
+from link_stats import LinkStats
 
 logger = logging.getLogger("wilo.lora_csv")
 
@@ -52,51 +64,84 @@ def setup_logging(verbose=False):
     logging.basicConfig(level=level, format=fmt, datefmt="%H:%M:%S")
 
 
-def parse_lora_packet(raw_str):
+def parse_lora_packet(raw):
     """
-    Parse the ESP32 JSON payload.
+    Decode an ESP32 frame (binary v1 or JSON, see lora_codec).
     Returns a dictionary with normalized fields.
     """
-    payload = raw_str.strip()
-    if not payload:
+    text = raw if isinstance(raw, str) else lora_codec.describe(raw)
+    if not text.strip():
         raise ValueError("empty payload")
 
-    data = json.loads(payload)
+    data = lora_codec.decode(raw)
     return {
-        "device": data.get("device", ""),
-        "sensor": data.get("sensor", ""),
-        "status": data.get("status", "unknown"),
-        "voltage_v": data.get("voltage", None),
-        "pressure_kpa": data.get("pressure_kpa", None),
-        "pkt": data.get("pkt", None),
+        "device": data["device"],
+        "sensor": data["sensor"],
+        "status": data["status"],
+        "voltage_v": data["voltage"],
+        "pressure_kpa": data["pressure_kpa"],
+        "pkt": data["pkt"],
     }
 
 
 class PacketCsvLogger:
-    """Append-only CSV logger for LoRa packets."""
+    """
+    Append-only CSV logger for LoRa packets with group commit: rows are
+    buffered and written together once ``flush_rows`` are pending or the
+    oldest is ``flush_s`` old. ``durability`` sets what a commit does:
+
+        row    write + flush every row (no batching)
+        os     write the batch to the kernel (survives a crash of this process)
+        fsync  write the batch and fsync it (survives power loss)
+
+    ``raw_payload`` is 'always', 'errors' (only rows that failed to
+    parse) or 'never'.
+    """
 
-    def __init__(self, csv_path):
+    DURABILITY = ("row", "os", "fsync")
+    RAW_PAYLOAD = ("always", "errors", "never")
+
+    def __init__(self, csv_path, flush_rows=None, flush_s=None, durability=None, raw_payload=None):
         self.csv_path = csv_path
+        self.flush_rows = flush_rows or CFG.LORA_CSV_FLUSH_ROWS
+        self.flush_s = flush_s if flush_s is not None else CFG.LORA_CSV_FLUSH_S
+        self.durability = durability or CFG.LORA_CSV_DURABILITY
+        self.raw_payload = raw_payload or CFG.LORA_CSV_RAW_PAYLOAD
+        if self.durability not in self.DURABILITY:
+            raise ValueError("durability must be one of %s, got %r" % (self.DURABILITY, self.durability))
+        if self.raw_payload not in self.RAW_PAYLOAD:
+            raise ValueError("raw_payload must be one of %s, got %r" % (self.RAW_PAYLOAD, self.raw_payload))
         self._file = None
         self._writer = None
         self._rows = 0
+        self._pending = []
+        self._first_pending = None  # monotonic time of the oldest buffered row
+        self.commits = 0
 
     def initialize(self):
         os.makedirs(os.path.dirname(os.path.abspath(self.csv_path)), exist_ok=True)
         write_header = (not os.path.exists(self.csv_path) or os.path.getsize(self.csv_path) == 0)
-        self._file = open(self.csv_path, "a", newline="")
+        # Buffer large enough that one commit is one write()
+        self._file = open(self.csv_path, "a", newline="", buffering=1 << 16)
         self._writer = csv.writer(self._file)
         if write_header:
             self._writer.writerow(CSV_HEADER)
             self._file.flush()
-        logger.info("CSV logging to %s", os.path.abspath(self.csv_path))
+        logger.info(
+            "CSV logging to %s (commit every %d rows / %.1f s, durability=%s, raw_payload=%s)",
+            os.path.abspath(self.csv_path), self.flush_rows, self.flush_s,
+            self.durability, self.raw_payload,
+        )
 
-    def write_packet(self, packet, rssi=None, snr=None, raw_payload="", parse_error=""):
+    def write_packet(self, packet, rssi=None, snr=None, raw_payload="", parse_error="", ts=None):
         if self._writer is None:
             raise RuntimeError("CSV logger not initialized")
 
-        self._writer.writerow([
-            datetime.now().isoformat(timespec="seconds"),
+        if self.raw_payload == "never" or (self.raw_payload == "errors" and not parse_error):
+            raw_payload = ""
+        when = datetime.fromtimestamp(ts) if ts is not None else datetime.now()
+        self._pending.append([
+            when.isoformat(timespec="seconds"),
             packet.get("device", "") if packet else "",
             packet.get("sensor", "") if packet else "",
             packet.get("status", "") if packet else "",
@@ -109,33 +154,90 @@ class PacketCsvLogger:
             parse_error,
         ])
         self._rows += 1
+        if self._first_pending is None:
+            self._first_pending = time.monotonic()
+        if self.durability == "row" or len(self._pending) >= self.flush_rows:
+            self.commit()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """Commit when the oldest buffered row has waited ``flush_s``; call when idle too."""
+        if self._first_pending is not None and time.monotonic() - self._first_pending >= self.flush_s:
+            self.commit()
+
+    def commit(self):
+        """Write the buffered rows out at the configured durability."""
+        if not self._pending:
+            return
+        self._writer.writerows(self._pending)
+        self._pending = []
+        self._first_pending = None
         self._file.flush()
+        if self.durability == "fsync":
+            os.fsync(self._file.fileno())
+        self.commits += 1
 
     def close(self):
         if self._file:
-            self._file.flush()
+            self.commit()
             self._file.close()
-            logger.info("CSV closed after %d rows", self._rows)
+            self._file = None
+            logger.info("CSV closed after %d rows (%d commits)", self._rows, self.commits)
+
+
+class ReceiverStats:
+    """Worker-side counters: packets, parse errors, radio→row latency and per-device link stats."""
+
+    def __init__(self):
+        self.received = 0
+        self.parse_errors = 0
+        self.latency = LatencyHistogram()   # FIFO drained → row written
+        self.links = LinkStats()
+        self.last_report = time.monotonic()
+
+    def log(self, lora):
+        lat = self.latency.summary()
+        logger.info(
+            "RX stats: packets=%d crc_errors=%d parse_errors=%d queue=%d peak=%d dropped=%d "
+            "latency p50<=%s p99<=%s max=%s ms",
+            self.received, getattr(lora, "crc_errors", 0), self.parse_errors,
+            lora.rx_queue.qsize(), lora.rx_queue_peak,
+            lora.rx_dropped, lat.get("p50_ms"), lat.get("p99_ms"), lat.get("max_ms"),
+        )
+        if hasattr(lora, "stats"):
+            logger.info("Driver stats: %s", "  ".join("%s=%s" % kv for kv in lora.stats().items()))
+        self.links.log_summary(logger)
+        self.last_report = time.monotonic()
 
 
 class LoRaCsvReceiver:
     """Receive LoRa packets and append them to CSV."""
 
-    def __init__(self, csv_path):
-        self.csv_logger = PacketCsvLogger(csv_path)
-        self.lora = None
+    def __init__(self, csv_path, lora=None, durability=None, capture=None):
+        self.csv_logger = PacketCsvLogger(csv_path, durability=durability)
+        self.lora = lora            # SX127x (or a fake); created by initialize() if None
+        self.capture = capture or CFG.LORA_CAPTURE_PATH
         self.running = True
+        self.stats = ReceiverStats()
 
     def initialize(self):
         logger.info("Initializing LoRa receiver on 433 MHz")
-        self.lora = SX127x(
-            spi_bus=CFG.LORA_SPI_BUS,
-            spi_cs=CFG.LORA_SPI_CS,
-            reset_pin=CFG.LORA_RESET_PIN,
-            dio0_pin=CFG.LORA_DIO0_PIN,
-            frequency=CFG.LORA_FREQUENCY,
-        )
+        if self.lora is None and CFG.LORA_USE_MUX:
+            self.lora = mux_radio()
+            logger.info("Subscribing to radio mux %s", ", ".join(CFG.LORA_GATEWAYS) or CFG.LORA_MUX_SOCKET)
+        elif self.lora is None:
+            self.lora = SX127x(
+                spi_bus=CFG.LORA_SPI_BUS,
+                spi_cs=CFG.LORA_SPI_CS,
+                reset_pin=CFG.LORA_RESET_PIN,
+                dio0_pin=CFG.LORA_DIO0_PIN,
+                frequency=CFG.LORA_FREQUENCY,
+                queue_size=CFG.LORA_RX_QUEUE_SIZE,
+                crc=CFG.LORA_CRC,
+            )
         self.lora.receive()
+        lora_capture.attach(self.lora, self.capture)
         self.csv_logger.initialize()
         logger.info("Listening for ESP32 pressure packets...")
 
@@ -147,50 +249,92 @@ class LoRaCsvReceiver:
         signal.signal(signal.SIGTERM, self.handle_signal)
 
         self.initialize()
+        drain = None
         try:
+            irq = CFG.LORA_DIO0_IRQ and self.lora.start_rx_interrupt()
+            if irq:
+                logger.info("RxDone via DIO0 interrupt")
+            else:
+                logger.info("RxDone polled every 10 ms")
+                drain = threading.Thread(target=self._poll_loop, name="lora-drain", daemon=True)
+                drain.start()
             while self.running:
-                if self.lora.available():
-                    raw = self.lora.read_payload()
-                    raw_str = "".join(chr(c) for c in raw).replace("\x00", "").strip()
-                    rssi = self.lora.get_packet_rssi()
-                    snr = self.lora.get_packet_snr()
-
-                    try:
-                        packet = parse_lora_packet(raw_str)
-                        self.csv_logger.write_packet(
-                            packet=packet,
-                            rssi=rssi,
-                            snr=snr,
-                            raw_payload=raw_str,
-                            parse_error="",
-                        )
-                        logger.info(
-                            "RX pkt=%s device=%s pressure=%s kPa voltage=%s V RSSI=%s dBm SNR=%.2f dB",
-                            packet.get("pkt", ""),
-                            packet.get("device", ""),
-                            packet.get("pressure_kpa", ""),
-                            packet.get("voltage_v", ""),
-                            rssi,
-                            snr,
-                        )
-                    except Exception as exc:
-                        logger.warning("Packet parse failed: %s | raw=%r", exc, raw_str)
-                        self.csv_logger.write_packet(
-                            packet=None,
-                            rssi=rssi,
-                            snr=snr,
-                            raw_payload=raw_str,
-                            parse_error=str(exc),
-                        )
-
-                time.sleep(0.01)
+                item = self.lora.get_packet(timeout=CFG.LORA_FALLBACK_POLL_S)
+                if item is not None:
+                    self.handle_frame(*item)
+                else:
+                    if irq:
+                        self.lora.poll()    # missed edge: DIO0 stuck high
+                    self.csv_logger.flush_if_due()
+                if time.monotonic() - self.stats.last_report >= CFG.LORA_STATS_INTERVAL_S:
+                    self.stats.log(self.lora)
         finally:
+            self.running = False
+            if drain:
+                drain.join(timeout=1.0)
             try:
+                # Persist whatever the radio stage already queued
+                while True:
+                    item = self.lora.get_packet()
+                    if item is None:
+                        break
+                    self.handle_frame(*item)
+                self.stats.log(self.lora)
                 self.csv_logger.close()
             finally:
                 if self.lora:
                     self.lora.close()
 
+    def _poll_loop(self):
+        """Radio stage without DIO0 edges: drain RxDone into the queue only."""
+        while self.running:
+            try:
+                if not self.lora.poll():
+                    time.sleep(0.01)
+            except Exception as exc:
+                logger.error("LoRa poll failed: %s", exc)
+                time.sleep(1.0)
+
+    def handle_frame(self, raw, rssi, snr, t_rx=None):
+        """Worker stage: parse, write and log one drained frame."""
+        self.stats.received += 1
+        raw_str = lora_codec.describe(raw)
+        try:
+            packet = parse_lora_packet(raw)
+            self.stats.links.update(
+                packet["device"], packet["pkt"], t_rx if t_rx is not None else time.time(), rssi, snr
+            )
+            self.csv_logger.write_packet(
+                packet=packet,
+                rssi=rssi,
+                snr=snr,
+                raw_payload=raw_str,
+                parse_error="",
+                ts=t_rx,
+            )
+            logger.info(
+                "RX pkt=%s device=%s pressure=%s kPa voltage=%s V RSSI=%s dBm SNR=%.2f dB",
+                packet.get("pkt", ""),
+                packet.get("device", ""),
+                packet.get("pressure_kpa", ""),
+                packet.get("voltage_v", ""),
+                rssi,
+                snr,
+            )
+        except Exception as exc:
+            self.stats.parse_errors += 1
+            logger.warning("Packet parse failed: %s | raw=%r", exc, raw_str)
+            self.csv_logger.write_packet(
+                packet=None,
+                rssi=rssi,
+                snr=snr,
+                raw_payload=raw_str,
+                parse_error=str(exc),
+                ts=t_rx,
+            )
+        if t_rx is not None:
+            self.stats.latency.add(int((time.time() - t_rx) * 1e9))
+
 
 def main():
     parser = argparse.ArgumentParser(description="Receive ESP32 LoRa pressure packets and append them to CSV.")
@@ -199,11 +343,25 @@ def main():
         default=CFG.LORA_PACKET_CSV_PATH,
         help="Path to the CSV file (default: tank_config.LORA_PACKET_CSV_PATH)",
     )
+    parser.add_argument(
+        "--radio-mux",
+        action="store_true",
+        help="Subscribe to radio_mux.py instead of opening the SX127x",
+    )
+    parser.add_argument(
+        "--durability",
+        choices=PacketCsvLogger.DURABILITY,
+        default=CFG.LORA_CSV_DURABILITY,
+        help="What a CSV group commit guarantees (default: %(default)s)",
+    )
+    parser.add_argument("--capture", metavar="PATH", help="Record raw LoRa frames (see lora_capture.py)")
     parser.add_argument("--verbose", action="store_true", help="Enable debug logging")
     args = parser.parse_args()
+    if args.radio_mux:
+        CFG.LORA_USE_MUX = True
 
     setup_logging(verbose=args.verbose)
-    receiver = LoRaCsvReceiver(csv_path=args.csv)
+    receiver = LoRaCsvReceiver(csv_path=args.csv, durability=args.durability, capture=args.capture)
     receiver.run()
 
 
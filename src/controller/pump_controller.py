@@ -6,20 +6,28 @@ Runs on Raspberry Pi. Receives LoRa data from ESP32 (upper tank pressure),
 reads local current/voltage sensors (main tank estimation),
 and controls the pump relay using hybrid logic.
 
+The controller is an asyncio event loop: LoRa receive, sensor sampling,
+override buttons, CSV logging and ML refresh are independent tasks, and
+the decision engine runs as soon as any of them delivers new input
+(plus a 1 s tick for time-based rules).
+
 Usage:
     python3 pump_controller.py                # normal operation
     python3 pump_controller.py --dry-run      # no GPIO, for testing
     python3 pump_controller.py --verbose       # extra debug output
+    python3 pump_controller.py --trace         # keep a decision trace
+    python3 pump_controller.py --simulate --sim-hours 72   # fake hardware, virtual time
+
+With tracing on, `kill -USR1 <pid>` (or `systemctl kill -s USR1 wilo-pump`)
+dumps the recent decisions to logs/pump/decision_trace.jsonl.
 """
 
 import sys
 import os
-import json
-import time
 import signal
+import asyncio
 import logging
 import argparse
-from datetime import datetime
 
 # ── Add project root to path for ML imports ──────────────────
 _HERE = os.path.dirname(os.path.abspath(__file__))
@@ -27,9 +35,15 @@ _PROJECT = os.path.abspath(os.path.join(_HERE, '..', '..'))
 sys.path.insert(0, _PROJECT)
 sys.path.insert(0, _HERE)
 
+import clock
+import lora_codec
+import lora_capture
 import tank_config as CFG
 from pump_logic import HybridPumpLogic, PumpDecision
 from data_logger import DataLogger
+from loop_watchdog import LoopWatchdog
+from link_stats import LinkStats
+from tanks import Tank, tank_specs
 
 # ── Logging setup ────────────────────────────────────────────
 
@@ -49,10 +63,12 @@ logger = logging.getLogger('wilo.main')
 
 # ── Pressure → water level conversion ───────────────────────
 
-def pressure_to_level_pct(pressure_kpa):
+def pressure_to_level_pct(pressure_kpa, height_cm=None):
     """
     Convert pressure at bottom of upper tank to water level percentage.
     P = ρ × g × h  →  h = P / (ρ × g)
+    Plain vertical cylinder only; the controller uses each tank's
+    TankGeometry (calibration profile, precomputed lookup).
     """
     if pressure_kpa is None or pressure_kpa < 0:
         return None
@@ -63,71 +79,96 @@ def pressure_to_level_pct(pressure_kpa):
     # Height in cm
     h_cm = h_m * 100.0
     # Percentage of tank height
-    pct = (h_cm / CFG.UPPER_TANK_HEIGHT_CM) * 100.0
+    pct = (h_cm / (height_cm or CFG.UPPER_TANK_HEIGHT_CM)) * 100.0
     return max(0.0, min(100.0, pct))
 
 
 # ── LoRa packet parser ──────────────────────────────────────
 
-def parse_lora_packet(raw_str):
+def parse_lora_packet(raw):
     """
-    Parse JSON payload from ESP32.
-    Expected: {"device":"esp32","sensor":"PR12P210","status":"ok",
-               "voltage":1.234,"pressure_kpa":12.50,"pkt":42}
+    Decode an ESP32 frame — binary v1 or JSON (see lora_codec).
+    Expected JSON: {"device":"esp32","sensor":"PR12P210","status":"ok",
+                    "voltage":1.234,"pressure_kpa":12.50,"pkt":42}
     Returns dict or None on failure.
     """
     try:
-        data = json.loads(raw_str)
-        return {
-            'device':       data.get('device', ''),
-            'sensor':       data.get('sensor', ''),
-            'status':       data.get('status', 'unknown'),
-            'voltage':      float(data.get('voltage', 0)),
-            'pressure_kpa': float(data.get('pressure_kpa', -1)),
-            'pkt':          int(data.get('pkt', -1)),
-        }
-    except (json.JSONDecodeError, ValueError, TypeError) as e:
-        logger.warning(f"Packet parse error: {e}  raw='{raw_str[:80]}'")
+        return lora_codec.decode(raw)
+    except (ValueError, TypeError) as e:
+        shown = raw[:80] if isinstance(raw, str) else lora_codec.describe(raw[:80])
+        logger.warning(f"Packet parse error: {e}  raw='{shown}'")
         return None
 
 
 # ── Main controller class ───────────────────────────────────
 
 class PumpController:
-    """Top-level controller tying all subsystems together."""
+    """
+    Top-level controller tying all subsystems together. Serves every
+    tank/pump pair in TANKS: one radio, ADC sampler, CSV log and event
+    loop; a relay, current reader and HybridPumpLogic per tank.
+    """
 
-    def __init__(self, dry_run=False):
+    def __init__(self, dry_run=False, trace=False, sim=None, lora=None, capture=None,
+                 specs=None):
         self.dry_run = dry_run
+        self.sim     = sim          # simulator.Simulation → fake hardware
+        self.trace   = trace or CFG.DECISION_TRACE_ENABLED
+        self.capture = capture or CFG.LORA_CAPTURE_PATH     # raw frame capture file
         self.running = True
-
-        # ── Subsystems ──
-        self.lora   = None
-        self.relay  = None
-        self.sensor = None
-        self.csv    = None
-        self.logic  = None
-
-        # ── Latest data ──
-        self.last_packet = None
-        self.upper_pct   = None
+        self.specs   = specs        # tank specs; tank_specs() if None
+
+        # ── Shared subsystems ──
+        self.lora    = lora         # SX127x (or a fake); created by initialize() if None
+        self.csv     = None
+        self.sampler = None
+        self.tanks   = []
+        self._by_device = {}        # LoRa "device" → Tank
+        self.unrouted   = 0         # packets from unknown devices
+        self.links      = LinkStats()   # per-device sequence / radio stats
+
+        self.cycle       = 0
+        self._stop       = None
+        self._loop       = None
+        self.watchdog    = LoopWatchdog(CFG.CYCLE_BUDGET_MS, systemd=CFG.SYSTEMD_WATCHDOG)
 
     def initialize(self):
+        specs = self.specs or tank_specs()
+        multi = len(specs) > 1
+        self.tanks = [Tank(s, label=f"[{s['name']}] " if multi else '') for s in specs]
+        self._by_device = {t.device: t for t in self.tanks}
+        for tank in self.tanks:
+            tank.link = self.links.get(tank.device)
+
         logger.info("=" * 60)
         logger.info("  WILO WATER PUMP CONTROLLER")
-        logger.info(f"  Mode: {'DRY-RUN (no GPIO)' if self.dry_run else 'LIVE'}")
-        logger.info(f"  Time: {datetime.now()}")
+        mode = 'SIMULATED' if self.sim else 'DRY-RUN (no GPIO)' if self.dry_run else 'LIVE'
+        logger.info(f"  Mode: {mode}")
+        logger.info(f"  Tanks: {', '.join(f'{t.name} ({t.device})' for t in self.tanks)}")
+        logger.info(f"  Time: {clock.now()}")
         logger.info("=" * 60)
 
-        # ── 1. LoRa receiver ──
+        # ── 1. LoRa receiver (shared) ──
         try:
-            from sx127x import SX127x
-            self.lora = SX127x(
-                spi_bus=CFG.LORA_SPI_BUS, spi_cs=CFG.LORA_SPI_CS,
-                reset_pin=CFG.LORA_RESET_PIN, dio0_pin=CFG.LORA_DIO0_PIN,
-                frequency=CFG.LORA_FREQUENCY
-            )
+            if self.lora is not None:
+                pass
+            elif self.sim:
+                self.lora = self.sim.radio
+            elif CFG.LORA_USE_MUX:
+                from gateway_merge import mux_radio
+                self.lora = mux_radio()
+            else:
+                from sx127x import SX127x
+                self.lora = SX127x(
+                    spi_bus=CFG.LORA_SPI_BUS, spi_cs=CFG.LORA_SPI_CS,
+                    reset_pin=CFG.LORA_RESET_PIN, dio0_pin=CFG.LORA_DIO0_PIN,
+                    frequency=CFG.LORA_FREQUENCY, crc=CFG.LORA_CRC
+                )
             self.lora.receive()
-            logger.info("LoRa receiver initialised — listening on 433 MHz")
+            lora_capture.attach(self.lora, self.capture)
+            logger.info("LoRa receiver initialised — listening on 433 MHz"
+                        + (f" via radio mux {', '.join(CFG.LORA_GATEWAYS) or CFG.LORA_MUX_SOCKET}"
+                           if CFG.LORA_USE_MUX and not self.sim else ""))
         except Exception as e:
             if self.dry_run:
                 logger.warning(f"LoRa init skipped (dry-run): {e}")
@@ -136,189 +177,450 @@ class PumpController:
                 logger.critical(f"LoRa init FAILED: {e}")
                 raise
 
-        # ── 2. Relay controller ──
-        if not self.dry_run:
-            import RPi.GPIO as GPIO
+        # ── 2. Relay controllers ──
+        if self.sim or not self.dry_run:
+            if self.sim:
+                GPIO = self.sim.gpio
+            else:
+                import RPi.GPIO as GPIO
             GPIO.setmode(GPIO.BCM)
             GPIO.setwarnings(False)
             from relay_control import RelayController
-            self.relay = RelayController(
-                pump_pin=CFG.RELAY_PUMP_PIN, valve_pin=CFG.RELAY_VALVE_PIN,
-                active_low=CFG.RELAY_ACTIVE_LOW,
-                btn_on_pin=CFG.BUTTON_FORCE_ON, btn_off_pin=CFG.BUTTON_FORCE_OFF,
-                led_pin=CFG.LED_STATUS_PIN, debounce_ms=CFG.OVERRIDE_DEBOUNCE_MS
-            )
-            self.relay.initialize()
+            for tank in self.tanks:
+                s = tank.spec
+                tank.relay = RelayController(
+                    pump_pin=s['relay_pin'], valve_pin=s['valve_pin'],
+                    active_low=CFG.RELAY_ACTIVE_LOW,
+                    btn_on_pin=s['btn_on'], btn_off_pin=s['btn_off'],
+                    led_pin=s['led_pin'], debounce_ms=CFG.OVERRIDE_DEBOUNCE_MS,
+                    long_press_ms=CFG.OVERRIDE_LONG_PRESS_MS,
+                    gpio=GPIO, clock=clock.monotonic
+                )
+                tank.relay.initialize()
         else:
             logger.info("Relay control SKIPPED (dry-run)")
 
-        # ── 3. Current / voltage sensors ──
-        from sensor_reader import SensorReader
-        self.sensor = SensorReader(
-            acs_model=CFG.ACS712_MODEL, acs_zero_v=CFG.ACS712_ZERO_V,
-            acs_divider=CFG.ACS712_DIVIDER_RATIO,
-            zmpt_cal=CFG.ZMPT101B_CAL_FACTOR, zmpt_zero_v=CFG.ZMPT101B_ZERO_V,
-            zmpt_divider=CFG.ZMPT101B_DIVIDER_RATIO,
-            adc_addr=CFG.ADS1115_ADDRESS,
-            ch_current=CFG.ADC_CH_CURRENT, ch_voltage=CFG.ADC_CH_VOLTAGE
-        )
-        self.sensor.initialize()
-
-        # ── 4. Data logger ──
+        # ── 3. Current / voltage sensors (one ADC, one sampler thread) ──
+        from sensor_reader import SensorReader, SamplerGroup
+        backend = self.sim.adc if self.sim else None
+        for tank in self.tanks:
+            tank.sensor = SensorReader(
+                acs_model=CFG.ACS712_MODEL, acs_zero_v=CFG.ACS712_ZERO_V,
+                acs_divider=CFG.ACS712_DIVIDER_RATIO,
+                zmpt_cal=CFG.ZMPT101B_CAL_FACTOR, zmpt_zero_v=CFG.ZMPT101B_ZERO_V,
+                zmpt_divider=CFG.ZMPT101B_DIVIDER_RATIO,
+                adc_addr=CFG.ADS1115_ADDRESS,
+                ch_current=tank.spec['ch_current'], ch_voltage=tank.spec['ch_voltage'],
+                data_rate=CFG.ADS1115_DATA_RATE, mains_hz=CFG.MAINS_FREQUENCY_HZ,
+                continuous=CFG.ADC_CONTINUOUS, interleaved=CFG.ADC_INTERLEAVED,
+                active_cycles=CFG.SENSOR_ACTIVE_CYCLES, idle_cycles=CFG.SENSOR_IDLE_CYCLES,
+                idle_interval_s=CFG.SENSOR_IDLE_INTERVAL_S, max_samples=CFG.SENSOR_MAX_WINDOW,
+                backend=backend
+            )
+            tank.sensor.initialize()
+            backend = tank.sensor.backend       # later tanks reuse the opened ADC
+        if not self.sim:
+            # Simulated ADC is read synchronously on the virtual clock
+            self.sampler = SamplerGroup([t.sensor for t in self.tanks])
+            self.sampler.start()
+
+        # ── 4. Data logger (shared) ──
         self.csv = DataLogger(CFG.CSV_LOG_PATH, CFG.LOG_INTERVAL_S)
         self.csv.initialize()
 
-        # ── 5. Hybrid pump logic ──
-        self.logic = HybridPumpLogic(
-            state_file=CFG.STATE_FILE,
-            critical_low=CFG.UPPER_CRITICAL_LOW, low=CFG.UPPER_LOW,
-            high=CFG.UPPER_HIGH, critical_high=CFG.UPPER_CRITICAL_HIGH,
-            lora_timeout_s=CFG.LORA_TIMEOUT_S, max_run_min=CFG.MAX_CONTINUOUS_RUN_MIN,
-            dry_run_a=CFG.PUMP_DRY_RUN_CURRENT_A, dry_run_enabled=CFG.DRY_RUN_PROTECTION,
-            power_delay_s=CFG.POWER_RESTORE_DELAY_S,
-            override_timeout_min=CFG.OVERRIDE_TIMEOUT_MIN,
-            ml_enabled=CFG.ML_ENABLED, ml_window_min=CFG.ML_ACTIVATION_WINDOW_MIN
-        )
+        # ── 5. Hybrid pump logic (per tank state file) ──
+        for tank in self.tanks:
+            s = tank.spec
+            tank.logic = HybridPumpLogic(
+                state_file=s['state_file'],
+                critical_low=s['critical_low'], low=s['low'],
+                high=s['high'], critical_high=s['critical_high'],
+                lora_timeout_s=CFG.LORA_TIMEOUT_S, max_run_min=s['max_run_min'],
+                dry_run_a=s['dry_run_a'], dry_run_enabled=CFG.DRY_RUN_PROTECTION,
+                power_delay_s=CFG.POWER_RESTORE_DELAY_S,
+                override_timeout_min=CFG.OVERRIDE_TIMEOUT_MIN,
+                ml_enabled=CFG.ML_ENABLED, ml_window_min=CFG.ML_ACTIVATION_WINDOW_MIN
+            )
+            logger.info(f"{tank.label}Level filter: {tank.filter.describe()}")
+        if self.trace:
+            from decision_trace import DecisionTracer
+            for tank in self.tanks:
+                tank.logic.enable_trace(DecisionTracer(CFG.DECISION_TRACE_SIZE))
+            logger.info(f"Decision trace enabled ({CFG.DECISION_TRACE_SIZE} entries, SIGUSR1 to dump)")
 
         # ── 6. Try loading ML prediction ──
-        self._update_ml_prediction()
+        self._apply_ml_prediction(self._fetch_ml_prediction())
 
         logger.info("All subsystems initialised ✓")
 
     # ── ML prediction (optional) ──────────────────────────────
 
-    def _update_ml_prediction(self):
+    def _fetch_ml_prediction(self):
+        """Run the model (slow; called from an executor thread). Returns None if unavailable."""
         if not CFG.ML_ENABLED:
-            return
+            return None
         try:
             from src.models.prediction import get_comprehensive_prediction
             from src.utils.sensors import get_fallback_sensor_data
             sensor_data = get_fallback_sensor_data()
             result = get_comprehensive_prediction(sensor_data)
-            self.logic.set_ml_prediction({
+            return {
                 'start_hour': result['start_hour'],
                 'duration':   result['duration'],
-            })
+            }
         except Exception as e:
             logger.warning(f"ML prediction unavailable: {e}")
+            return None
 
-    # ── Main loop ─────────────────────────────────────────────
+    def _apply_ml_prediction(self, prediction):
+        """Hand a prediction to every tank's logic (event loop thread only)."""
+        if prediction is None:
+            return
+        for tank in self.tanks:
+            tank.logic.set_ml_prediction(dict(prediction))
 
-    def run(self):
-        logger.info("Main loop started — Ctrl+C to stop")
-        cycle = 0
-        ml_last = datetime.now()
+    # ── Event handlers (run on the event loop thread) ─────────
+
+    def _on_packet(self, raw, rssi, snr):
+        """Route one LoRa frame to its tank and re-evaluate that tank."""
+        pkt_data = parse_lora_packet(raw)
+        if not pkt_data:
+            return
+        link, seq = self.links.update(pkt_data['device'], pkt_data['pkt'],
+                                      clock.monotonic(), rssi, snr)
+        if seq in (link.DUPLICATE, link.LATE):
+            # Same or older reading than one already applied
+            logger.debug(f"LoRa #{pkt_data['pkt']} from '{pkt_data['device']}' "
+                         f"ignored ({seq})")
+            return
+        tank = self._by_device.get(pkt_data['device'])
+        if tank is None:
+            self.unrouted += 1
+            logger.debug(f"LoRa #{pkt_data['pkt']} from unknown device "
+                         f"'{pkt_data['device']}' ignored")
+            return
 
+        tank.rssi, tank.snr = rssi, snr
+        tank.last_packet = pkt_data
+        if pkt_data['status'] == 'fault':
+            tank.logic.signal_lora_fault()
+            tank.raw_pct = tank.upper_pct = tank.upper_l = None
+            tank.filter.update(None, clock.monotonic())
+            logger.debug(f"{tank.label}LoRa #{pkt_data['pkt']}  SENSOR FAULT  RSSI={rssi}")
+        else:
+            tank.logic.signal_lora_ok()
+            tank.raw_pct, _ = tank.geometry.convert(pkt_data['pressure_kpa'])
+            with self.watchdog.stage('filter'):
+                tank.upper_pct = tank.filter.update(tank.raw_pct, clock.monotonic(),
+                                                    tank.pump_on)
+            tank.upper_l = tank.geometry.litres_at(tank.upper_pct)
+            level_str = (f"{tank.raw_pct:.1f}% → {tank.upper_pct:.1f}% ({tank.upper_l:.0f} L)"
+                         if tank.upper_pct is not None else "?")
+            logger.debug(
+                f"{tank.label}LoRa #{pkt_data['pkt']}  "
+                f"{pkt_data['pressure_kpa']:.2f}kPa → {level_str}  "
+                f"RSSI={rssi}  SNR={snr:.1f}"
+            )
+        self._evaluate(tank)
+
+    def _on_override(self, tank, btn):
+        """'ON' / 'OFF' force the pump; 'AUTO' releases the override."""
+        tank.logic.set_override(None if btn == 'AUTO' else btn)
+        self._evaluate(tank)
+
+    def _evaluate(self, tank):
+        """Run the tank's decision engine on its latest inputs and drive its relay."""
+        try:
+            pump_is_on = tank.pump_on
+            with self.watchdog.stage('decide'):
+                decision = tank.logic.decide(
+                    upper_pct=tank.upper_pct,
+                    pump_is_on=pump_is_on,
+                    current_amps=tank.current_a
+                )
+
+            if decision.action == 'ON' and not pump_is_on:
+                if tank.relay:
+                    with self.watchdog.stage('relay'):
+                        tank.relay.pump_start()
+                    tank.current_a = None       # unknown until sampled running
+                logger.info(f"{tank.label}▶ PUMP ON  — {decision.reason}")
+            elif decision.action == 'OFF' and pump_is_on:
+                if tank.relay:
+                    with self.watchdog.stage('relay'):
+                        tank.relay.pump_stop()
+                logger.info(f"{tank.label}⏹ PUMP OFF — {decision.reason}")
+                if tank.power and tank.power.get('run_energy_kwh') is not None:
+                    logger.info(f"{tank.label}Run energy: {tank.power['run_energy_kwh']:.3f} kWh")
+
+            tank.sensor.set_pump_running(tank.pump_on)
+            tank.decision = decision
+            if decision.action != 'HOLD':
+                tank.row_decision = decision
+            return decision
+        except Exception as e:
+            logger.error(f"{tank.label}Decision error: {e}", exc_info=True)
+            # Safety: stop pump on unexpected error
+            if tank.relay and tank.relay.pump_on:
+                tank.relay.emergency_stop()
+            return None
+
+    def _log_row(self, tank):
+        p = tank.last_packet or {}
+        self.csv.log(
+            upper_pct=tank.upper_pct,
+            upper_l=tank.upper_l,
+            pressure_kpa=p.get('pressure_kpa'),
+            sensor_v=p.get('voltage'),
+            sensor_status=p.get('status'),
+            rssi=tank.rssi, snr=tank.snr,
+            current_a=tank.current_a, voltage_v=tank.voltage_v,
+            pump_relay=tank.pump_on,
+            decision=tank.row_decision or tank.decision,
+            power=tank.power,
+            tank=tank.name,
+        )
+        # Radio metadata and ON/OFF transitions are only logged on the
+        # row following them; later evaluations in the same tick HOLD
+        tank.rssi = tank.snr = None
+        tank.row_decision = None
+
+    def _log_status(self, tank):
+        level_str = f"{tank.upper_pct:.1f}%" if tank.upper_pct is not None else "?"
+        pump_str  = "ON" if tank.pump_on else "OFF"
+        curr_str  = f"{tank.current_a:.2f}A" if tank.current_a else "N/A"
+        state_str = tank.decision.state.value if tank.decision else "?"
+        pdr = tank.link.pdr_window
+        pdr_str   = f"{pdr:.0%}" if pdr is not None else "?"
+        logger.info(
+            f"[cycle {self.cycle}]  {tank.label}upper={level_str}  "
+            f"pump={pump_str}  I={curr_str}  "
+            f"state={state_str}  link={pdr_str}"
+        )
+
+    def _log_radio_stats(self):
+        if self.lora is not None and hasattr(self.lora, 'stats'):
+            logger.info("Radio: " + "  ".join(f"{k}={v}" for k, v in self.lora.stats().items())
+                        + f"  unrouted={self.unrouted}")
+
+    # ── Tasks ─────────────────────────────────────────────────
+
+    async def _lora_task(self):
+        """
+        Handle received frames. With DIO0 interrupts the driver queues
+        each packet from the edge callback and wakes this task; otherwise
+        RxDone is polled.
+        """
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        irq = False
+        if CFG.LORA_DIO0_IRQ and hasattr(self.lora, 'start_rx_interrupt'):
+            irq = self.lora.start_rx_interrupt(
+                notify=lambda: loop.call_soon_threadsafe(wake.set))
+            logger.info("LoRa RxDone via DIO0 interrupt" if irq else "LoRa RxDone polled")
         while self.running:
             try:
-                cycle += 1
-                rssi = snr = None
-
-                # ── Read LoRa ──
-                if self.lora and self.lora.available():
+                if irq:
                     try:
+                        await asyncio.wait_for(wake.wait(), CFG.LORA_FALLBACK_POLL_S)
+                    except asyncio.TimeoutError:
+                        self.lora.poll()            # missed edge: DIO0 stuck high
+                    wake.clear()
+                    while True:
+                        item = self.lora.get_packet()
+                        if item is None:
+                            break
+                        raw, rssi, snr, _t_rx = item
+                        self._handle_frame(raw, rssi, snr)
+                    continue
+                if self.lora.available():
+                    with self.watchdog.stage('lora_read'):
                         raw = self.lora.read_payload()
-                        raw_str = ''.join(chr(c) for c in raw)
-                        rssi = self.lora.get_packet_rssi()
-                        snr  = self.lora.get_packet_snr()
-                        pkt_data = parse_lora_packet(raw_str)
-
-                        if pkt_data:
-                            self.last_packet = pkt_data
-
-                            if pkt_data['status'] == 'fault':
-                                self.logic.signal_lora_fault()
-                                self.upper_pct = None
-                                logger.debug(f"LoRa #{pkt_data['pkt']}  SENSOR FAULT  RSSI={rssi}")
-                            else:
-                                self.logic.signal_lora_ok()
-                                self.upper_pct = pressure_to_level_pct(
-                                    pkt_data['pressure_kpa'])
-                                logger.debug(
-                                    f"LoRa #{pkt_data['pkt']}  "
-                                    f"{pkt_data['pressure_kpa']:.2f}kPa → "
-                                    f"{self.upper_pct:.1f}%  "
-                                    f"RSSI={rssi}  SNR={snr:.1f}"
-                                )
-                    except Exception as e:
-                        logger.error(f"LoRa read error: {e}")
-
-                # ── Read current/voltage ──
-                cv = self.sensor.read_all()
-                current_a = cv['current_amps']
-                voltage_v = cv['voltage_ac']
-
-                # ── Manual override buttons ──
-                if self.relay:
-                    btn = self.relay.read_override_buttons()
-                    if btn:
-                        self.logic.set_override(btn)
-
-                # ── Decide ──
-                pump_is_on = self.relay.pump_on if self.relay else False
-                decision = self.logic.decide(
-                    upper_pct=self.upper_pct,
-                    pump_is_on=pump_is_on,
-                    current_amps=current_a
-                )
+                    self._handle_frame(raw, self.lora.get_packet_rssi(),
+                                       self.lora.get_packet_snr())
+                    continue
+            except Exception as e:
+                logger.error(f"LoRa read error: {e}")
+            await asyncio.sleep(CFG.LORA_POLL_INTERVAL_S)
 
-                # ── Act ──
-                if decision.action == 'ON' and not pump_is_on:
-                    if self.relay:
-                        self.relay.pump_start()
-                    logger.info(f"▶ PUMP ON  — {decision.reason}")
-                elif decision.action == 'OFF' and pump_is_on:
-                    if self.relay:
-                        self.relay.pump_stop()
-                    logger.info(f"⏹ PUMP OFF — {decision.reason}")
-
-                # ── Log (every cycle) ──
-                p = self.last_packet or {}
-                self.csv.log(
-                    upper_pct=self.upper_pct,
-                    pressure_kpa=p.get('pressure_kpa'),
-                    sensor_v=p.get('voltage'),
-                    sensor_status=p.get('status'),
-                    rssi=rssi, snr=snr,
-                    current_a=current_a, voltage_v=voltage_v,
-                    pump_relay=(self.relay.pump_on if self.relay else False),
-                    decision=decision,
-                )
+    def _handle_frame(self, raw, rssi, snr):
+        with self.watchdog.cycle('lora'):
+            self._on_packet(raw, rssi, snr)
 
-                # ── Periodic ML update ──
-                if CFG.ML_ENABLED:
-                    elapsed = (datetime.now() - ml_last).total_seconds() / 60
-                    if elapsed >= CFG.ML_CHECK_INTERVAL_MIN:
-                        self._update_ml_prediction()
-                        ml_last = datetime.now()
-
-                # ── Status print (every 10 cycles) ──
-                if cycle % 10 == 0:
-                    level_str = f"{self.upper_pct:.1f}%" if self.upper_pct is not None else "?"
-                    pump_str  = "ON" if (self.relay and self.relay.pump_on) else "OFF"
-                    curr_str  = f"{current_a:.2f}A" if current_a else "N/A"
-                    logger.info(
-                        f"[cycle {cycle}]  upper={level_str}  "
-                        f"pump={pump_str}  I={curr_str}  "
-                        f"state={decision.state.value}"
-                    )
-
-                time.sleep(CFG.LOOP_INTERVAL_S)
-
-            except KeyboardInterrupt:
-                break
+    async def _sensor_task(self):
+        """Pick up the sampler's latest current/voltage snapshots."""
+        while self.running:
+            for tank in self.tanks:
+                try:
+                    with self.watchdog.cycle('sensor'):
+                        with self.watchdog.stage('sensor_read'):
+                            cv = tank.sensor.read_all()
+                        tank.current_a = cv['current_amps']
+                        tank.voltage_v = cv['voltage_ac']
+                        tank.power     = cv
+                        # Current only feeds the dry-run guard while the pump runs
+                        if tank.pump_on:
+                            self._evaluate(tank)
+                except Exception as e:
+                    logger.error(f"{tank.label}Sensor read error: {e}")
+            await asyncio.sleep(CFG.SENSOR_INTERVAL_S)
+
+    async def _button_task(self):
+        """Collect debounced button events (edges are caught by GPIO IRQ)."""
+        tanks = [t for t in self.tanks if t.relay]
+        while self.running:
+            for tank in tanks:
+                try:
+                    with self.watchdog.stage('buttons'):
+                        events = tank.relay.poll_buttons()
+                    for btn in events:
+                        with self.watchdog.cycle('button'):
+                            self._on_override(tank, btn)
+                except Exception as e:
+                    logger.error(f"{tank.label}Button read error: {e}")
+            await asyncio.sleep(CFG.BUTTON_POLL_INTERVAL_S)
+
+    async def _ml_task(self):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            await asyncio.sleep(CFG.ML_CHECK_INTERVAL_MIN * 60)
+            with self.watchdog.stage('ml_refresh'):
+                prediction = await loop.run_in_executor(None, self._fetch_ml_prediction)
+            with self.watchdog.cycle('ml'):
+                self._apply_ml_prediction(prediction)
+                for tank in self.tanks:
+                    self._evaluate(tank)
+
+    async def _tick_task(self):
+        """
+        Periodic timer: re-evaluates time-based rules (LoRa timeout,
+        max-run, override expiry, ML window), writes one CSV row per tank
+        and prints the status lines every 10 cycles. Runs at a fixed rate
+        so its wake-up lateness measures event-loop jitter; each tick
+        also pets the systemd watchdog.
+        """
+        loop = asyncio.get_running_loop()
+        report_every = max(1, int(CFG.LATENCY_REPORT_INTERVAL_S / CFG.LOOP_INTERVAL_S))
+        deadline = loop.time()
+        while self.running:
+            self.watchdog.tick_late(int((loop.time() - deadline) * 1e9))
+            self.cycle += 1
+            with self.watchdog.cycle('tick'):
+                for tank in self.tanks:
+                    self._evaluate(tank)
+            try:
+                with self.watchdog.stage('csv_log'):
+                    for tank in self.tanks:
+                        self._log_row(tank)
+                if self.cycle % 10 == 0:
+                    for tank in self.tanks:
+                        self._log_status(tank)
+                if self.cycle % report_every == 0:
+                    self.watchdog.log_summary()
+                    for tank in self.tanks:
+                        logger.info(f"{tank.label}Level filter: {tank.filter.describe()}")
+                    self.links.log_summary(logger)
+                    self._log_radio_stats()
             except Exception as e:
-                logger.error(f"Loop error: {e}", exc_info=True)
-                # Safety: stop pump on unexpected error
-                if self.relay and self.relay.pump_on:
-                    self.relay.emergency_stop()
-                time.sleep(5)
+                logger.error(f"Log error: {e}", exc_info=True)
+            self.watchdog.pet()
+
+            deadline += CFG.LOOP_INTERVAL_S
+            now = loop.time()
+            if deadline < now:              # overran a whole tick — don't burst
+                deadline = now
+            await asyncio.sleep(deadline - now)
+
+    # ── Main loop ─────────────────────────────────────────────
+
+    def dump_trace(self):
+        """Write each tank's decision trace ring buffer under DECISION_TRACE_PATH."""
+        tracers = [(t, t.logic.tracer) for t in self.tanks
+                   if t.logic and t.logic.tracer is not None]
+        if not tracers:
+            logger.warning("SIGUSR1 ignored — decision trace not enabled (--trace)")
+            return
+        base, ext = os.path.splitext(CFG.DECISION_TRACE_PATH)
+        try:
+            os.makedirs(os.path.dirname(CFG.DECISION_TRACE_PATH), exist_ok=True)
+            for tank, tracer in tracers:
+                path = (CFG.DECISION_TRACE_PATH if len(self.tanks) == 1
+                        else f"{base}_{tank.name}{ext}")
+                tracer.dump(path)
+        except OSError as e:
+            logger.error(f"Decision trace dump failed: {e}")
+
+    def stop(self):
+        """Request the event loop to finish (safe from signal handlers and other threads)."""
+        self.running = False
+        if self._stop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        except RuntimeError:            # loop already closed
+            self._stop.set()
+
+    async def run_async(self):
+        logger.info("Event loop started — Ctrl+C to stop")
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, self.dump_trace)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            pass
+
+        coros = [self._tick_task(), self._sensor_task()]
+        if self.lora:
+            coros.append(self._lora_task())
+        if any(t.relay for t in self.tanks):
+            coros.append(self._button_task())
+        if CFG.ML_ENABLED:
+            coros.append(self._ml_task())
+        if self.sim:
+            coros.append(self.sim.run(self))
+        tasks = [asyncio.ensure_future(c) for c in coros]
+        self.watchdog.ready()
+
+        try:
+            await self._stop.wait()
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run(self):
+        if not self.sim:
+            asyncio.run(self.run_async())
+            return
+        loop = self.sim.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.run_async())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        self.sim.report(self)
 
     def shutdown(self):
         logger.info("Shutting down…")
-        self.running = False
-        if self.relay:
-            self.relay.cleanup()
+        self.stop()
+        self.watchdog.log_summary()
+        self.watchdog.close()
+        self.links.log_summary(logger)
+        self._log_radio_stats()
+        if self.sampler:
+            self.sampler.stop()
+        for tank in self.tanks:
+            if tank.relay:
+                tank.relay.cleanup()
+            if tank.logic:
+                tank.logic.close()
         if self.csv:
             self.csv.close()
         if self.lora:
@@ -337,11 +639,37 @@ def main():
                         help='Run without GPIO (for testing on non-Pi)')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='Enable debug logging')
+    parser.add_argument('--trace', action='store_true',
+                        help='Keep a decision trace ring buffer (dump with SIGUSR1)')
+    parser.add_argument('--radio-mux', action='store_true',
+                        help='Subscribe to radio_mux.py instead of opening the SX127x')
+    parser.add_argument('--capture', metavar='PATH',
+                        help='Record raw LoRa frames (see lora_capture.py)')
+    parser.add_argument('--simulate', action='store_true',
+                        help='Fake LoRa/GPIO/ADC backends driven by a tank model, on virtual time')
+    parser.add_argument('--sim-hours', type=float, default=CFG.SIM_HOURS,
+                        help='Simulated run length (default: %(default)s)')
+    parser.add_argument('--sim-script', metavar='JSON',
+                        help='Scenario events for the simulation (see simulator.py)')
+    parser.add_argument('--sim-level', type=float, default=CFG.SIM_START_LEVEL_PCT,
+                        help='Initial upper tank level %% (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Random seed for the simulation')
     args = parser.parse_args()
+    if args.radio_mux:
+        CFG.LORA_USE_MUX = True
+
+    sim = None
+    if args.simulate:
+        from simulator import Simulation
+        sim = Simulation(hours=args.sim_hours, script=args.sim_script,
+                         seed=args.seed, level_pct=args.sim_level)
+        sim.install()
 
     setup_logging(verbose=args.verbose)
 
-    ctrl = PumpController(dry_run=args.dry_run)
+    ctrl = PumpController(dry_run=args.dry_run, trace=args.trace, sim=sim,
+                          capture=args.capture, specs=sim.specs if sim else None)
 
     def handle_signal(sig, frame):
         ctrl.shutdown()
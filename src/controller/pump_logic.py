@@ -11,14 +11,23 @@ Decision engine evaluates triggers in strict priority order:
   P5 — Normal threshold       (hysteresis: ON at LOW%, OFF at HIGH%)
 
 If no trigger fires, the current pump state is held (HOLD).
+
+State is persisted only on real transitions (atomic temp-file + fsync +
+rename). Liveness for power-cut detection comes from a separate heartbeat:
+an 8-byte timestamp in a memory-mapped file, updated on every decide()
+without any syscall.
 """
 
 import os
 import json
+import mmap
+import struct
 import logging
 from enum import Enum
 from datetime import datetime, timedelta
 
+import clock
+
 logger = logging.getLogger('wilo.logic')
 
 
@@ -48,12 +57,56 @@ class PumpDecision:
         self.action = action        # 'ON', 'OFF', or 'HOLD'
         self.state  = state
         self.reason = reason
-        self.ts     = datetime.now()
+        self.ts     = clock.now()
 
     def __repr__(self):
         return f"{self.action} [{self.state.value}] {self.reason}"
 
 
+# ── Heartbeat ────────────────────────────────────────────────
+
+class _Heartbeat:
+    """Wall-clock timestamp slot in a memory-mapped 8-byte file."""
+
+    _SLOT = struct.Struct('<d')
+
+    def __init__(self, path):
+        self.path = path
+        self._mm  = None
+
+    def read(self):
+        """Last recorded timestamp (epoch seconds) or None."""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read(self._SLOT.size)
+            if len(data) == self._SLOT.size:
+                return self._SLOT.unpack(data)[0] or None
+        except OSError:
+            pass
+        return None
+
+    def open(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a+b') as f:
+                if os.path.getsize(self.path) < self._SLOT.size:
+                    f.truncate(self._SLOT.size)
+                self._mm = mmap.mmap(f.fileno(), self._SLOT.size)
+        except (OSError, ValueError) as e:
+            logger.error(f"Heartbeat unavailable: {e}")
+            self._mm = None
+
+    def beat(self, ts):
+        if self._mm is not None:
+            self._SLOT.pack_into(self._mm, 0, ts)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.flush()
+            self._mm.close()
+            self._mm = None
+
+
 # ── Decision engine ──────────────────────────────────────────
 
 class HybridPumpLogic:
@@ -64,7 +117,8 @@ class HybridPumpLogic:
                  lora_timeout_s, max_run_min, dry_run_a,
                  dry_run_enabled, power_delay_s,
                  override_timeout_min,
-                 ml_enabled, ml_window_min):
+                 ml_enabled, ml_window_min,
+                 heartbeat_file=None):
         # Thresholds
         self.crit_low  = critical_low
         self.low       = low
@@ -97,60 +151,107 @@ class HybridPumpLogic:
         self.ml_prediction    = None        # {'start_hour':float, 'duration':float}
         self.ml_check_ts      = None
 
+        # Rule table in priority order (name, bound method)
+        self._rules = (
+            ('P0_power_restore', self._rule_power_restore),
+            ('P1_emergency',     self._rule_emergency),
+            ('P2_lora_timeout',  self._rule_lora_timeout),
+            ('P2_sensor_fault',  self._rule_sensor_fault),
+            ('P2_max_run',       self._rule_max_run),
+            ('P2_dry_run',       self._rule_dry_run),
+            ('P3_override',      self._rule_override),
+            ('P4_ml',            self._rule_ml),
+            ('P5_threshold',     self._rule_threshold),
+        )
+        self.tracer = None          # DecisionTracer when tracing is enabled
+
+        self._heartbeat = _Heartbeat(heartbeat_file
+                                     or os.path.splitext(state_file)[0] + '.hb')
         self._load_state()
+        self._heartbeat.open()
+        self._heartbeat.beat(clock.now().timestamp())
 
     # ── Persistence (power-cut recovery) ─────────────────────
 
     def _save_state(self):
+        """Atomically replace the state file (temp file, fsync, rename)."""
         try:
-            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
-            with open(self.state_file, 'w') as f:
+            state_dir = os.path.dirname(self.state_file)
+            os.makedirs(state_dir, exist_ok=True)
+            tmp = self.state_file + '.tmp'
+            with open(tmp, 'w') as f:
                 json.dump({
                     'state': self.current_state.value,
                     'pump_start': self.pump_start_time.isoformat() if self.pump_start_time else None,
-                    'ts': datetime.now().isoformat(),
+                    'ts': clock.now().isoformat(),
                 }, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.state_file)
+            try:
+                fd = os.open(state_dir, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass        # directory fsync not supported (e.g. Windows)
         except Exception as e:
             logger.error(f"State save failed: {e}")
 
     def _load_state(self):
         try:
-            if not os.path.exists(self.state_file):
+            prev_state = '?'
+            last_seen = None
+            if os.path.exists(self.state_file):
+                with open(self.state_file) as f:
+                    d = json.load(f)
+                prev_state = d.get('state', '?')
+                last_seen = datetime.fromisoformat(d['ts'])
+            hb = self._heartbeat.read()
+            if hb is not None:
+                hb_ts = datetime.fromtimestamp(hb)
+                last_seen = max(last_seen, hb_ts) if last_seen else hb_ts
+            if last_seen is None:
                 return
-            with open(self.state_file) as f:
-                d = json.load(f)
-            saved = datetime.fromisoformat(d['ts'])
-            gap = (datetime.now() - saved).total_seconds()
+            gap = (clock.now() - last_seen).total_seconds()
             if gap > 10:
-                self.power_restore_ts = datetime.now()
+                self.power_restore_ts = clock.now()
                 logger.warning(f"Power-cut detected (gap {gap:.0f}s). "
-                               f"Previous state: {d['state']}. "
+                               f"Previous state: {prev_state}. "
                                f"Waiting {self.power_delay.total_seconds():.0f}s…")
         except Exception as e:
             logger.error(f"State load failed: {e}")
 
+    def close(self):
+        """Flush the heartbeat (call on shutdown)."""
+        self._heartbeat.beat(clock.now().timestamp())
+        self._heartbeat.close()
+
     # ── External updates ─────────────────────────────────────
 
     def signal_lora_ok(self):
         """Call when a clean (non-fault) LoRa packet is received."""
-        self.last_lora_ts = datetime.now()
+        self.last_lora_ts = clock.now()
         self.consec_faults = 0
 
     def signal_lora_fault(self):
         """Call when a LoRa packet arrives but sensor reports fault."""
-        self.last_lora_ts = datetime.now()   # still alive, just bad reading
+        self.last_lora_ts = clock.now()   # still alive, just bad reading
         self.consec_faults += 1
 
     def set_override(self, mode):
         """mode: 'ON', 'OFF', or None to clear."""
-        self.override = mode
-        self.override_time = datetime.now() if mode else None
         if mode:
             logger.info(f"Manual override → {mode}")
+        elif self.override:
+            logger.info("Manual override released → AUTO")
+        self.override = mode
+        self.override_time = clock.now() if mode else None
 
     def set_ml_prediction(self, pred: dict):
         self.ml_prediction = pred
-        self.ml_check_ts = datetime.now()
+        self.ml_check_ts = clock.now()
         logger.info(f"ML prediction: start={pred.get('start_hour',0):.2f}h  "
                      f"dur={pred.get('duration',0):.0f}min")
 
@@ -165,8 +266,26 @@ class HybridPumpLogic:
         Returns:
             PumpDecision with .action in {'ON','OFF','HOLD'}
         """
-        now = datetime.now()
+        now = clock.now()
+        self._heartbeat.beat(now.timestamp())
+
+        if self.tracer is not None:
+            return self.tracer.run(self._rules, self._hold, now,
+                                   upper_pct, pump_is_on, current_amps)
 
+        for _, rule in self._rules:
+            decision = rule(now, upper_pct, pump_is_on, current_amps)
+            if decision is not None:
+                return decision
+        return self._hold()
+
+    def enable_trace(self, tracer):
+        """Attach a DecisionTracer (None disables tracing)."""
+        self.tracer = tracer
+
+    # ── Rules (strict priority order; None = no trigger) ─────
+
+    def _rule_power_restore(self, now, upper_pct, pump_is_on, current_amps):
         # ── P0  Power-cut recovery ───────────────────────────
         if self.power_restore_ts:
             elapsed = now - self.power_restore_ts
@@ -175,7 +294,9 @@ class HybridPumpLogic:
                 return PumpDecision('OFF', PumpState.OFF_POWER_RESTORE,
                     f"Power restored {elapsed.total_seconds():.0f}s ago, waiting {rem:.0f}s")
             self.power_restore_ts = None
+        return None
 
+    def _rule_emergency(self, now, upper_pct, pump_is_on, current_amps):
         # ── P1  Emergency thresholds ─────────────────────────
         if upper_pct is not None:
             if upper_pct >= self.crit_high:
@@ -184,32 +305,40 @@ class HybridPumpLogic:
             if upper_pct <= self.crit_low:
                 return self._on(PumpState.ON_EMERGENCY, now,
                     f"Upper tank CRITICAL LOW {upper_pct:.1f}% ≤ {self.crit_low}%")
+        return None
+
+    # ── P2  Safety guards ────────────────────────────────────
 
-        # ── P2  Safety guards ────────────────────────────────
-        # LoRa timeout
+    def _rule_lora_timeout(self, now, upper_pct, pump_is_on, current_amps):
         if self.last_lora_ts and (now - self.last_lora_ts) > self.lora_timeout:
             return self._off(PumpState.OFF_LORA_TIMEOUT,
                 f"No LoRa data for {(now - self.last_lora_ts).total_seconds():.0f}s")
+        return None
 
-        # Sensor fault (3+ consecutive)
+    def _rule_sensor_fault(self, now, upper_pct, pump_is_on, current_amps):
+        # 3+ consecutive
         if self.consec_faults >= 3:
             return self._off(PumpState.OFF_SENSOR_FAULT,
                 f"{self.consec_faults} consecutive sensor faults")
+        return None
 
-        # Max continuous run
+    def _rule_max_run(self, now, upper_pct, pump_is_on, current_amps):
         if pump_is_on and self.pump_start_time:
             run_time = now - self.pump_start_time
             if run_time > self.max_run:
                 return self._off(PumpState.OFF_MAX_RUN,
                     f"Max run exceeded ({run_time.total_seconds()/60:.0f}min)")
+        return None
 
-        # Dry-run protection
+    def _rule_dry_run(self, now, upper_pct, pump_is_on, current_amps):
         if (self.dry_run_on and pump_is_on
                 and current_amps is not None
                 and current_amps < self.dry_run_a):
             return self._off(PumpState.OFF_DRY_RUN,
                 f"Dry-run detected: {current_amps:.2f}A < {self.dry_run_a}A")
+        return None
 
+    def _rule_override(self, now, upper_pct, pump_is_on, current_amps):
         # ── P3  Manual override ──────────────────────────────
         if self.override:
             # Auto-expire
@@ -221,7 +350,9 @@ class HybridPumpLogic:
                 return self._on(PumpState.ON_MANUAL, now, "Manual override ON")
             elif self.override == 'OFF':
                 return self._off(PumpState.OFF_MANUAL, "Manual override OFF")
+        return None
 
+    def _rule_ml(self, now, upper_pct, pump_is_on, current_amps):
         # ── P4  ML prediction ────────────────────────────────
         if self.ml_enabled and self.ml_prediction:
             pred_h = self.ml_prediction.get('start_hour', -1)
@@ -238,7 +369,9 @@ class HybridPumpLogic:
                             f"ML schedule complete ({run_min:.0f}/{pred_d:.0f}min)")
                 return self._on(PumpState.ON_ML_SCHEDULED, now,
                     f"ML schedule: {pred_h:.2f}h for {pred_d:.0f}min")
+        return None
 
+    def _rule_threshold(self, now, upper_pct, pump_is_on, current_amps):
         # ── P5  Normal threshold hysteresis ──────────────────
         if upper_pct is not None:
             if not pump_is_on and upper_pct <= self.low:
@@ -247,21 +380,27 @@ class HybridPumpLogic:
             if pump_is_on and upper_pct >= self.high:
                 return self._off(PumpState.OFF,
                     f"Upper tank {upper_pct:.1f}% ≥ {self.high}%")
+        return None
 
+    def _hold(self):
         # ── Default: hold current state ──────────────────────
         return PumpDecision('HOLD', self.current_state, "No trigger — holding")
 
     # ── Internal helpers ─────────────────────────────────────
 
     def _on(self, state, now, reason):
+        changed = state != self.current_state or self.pump_start_time is None
         if self.pump_start_time is None:
             self.pump_start_time = now
         self.current_state = state
-        self._save_state()
+        if changed:
+            self._save_state()
         return PumpDecision('ON', state, reason)
 
     def _off(self, state, reason):
+        changed = state != self.current_state or self.pump_start_time is not None
         self.pump_start_time = None
         self.current_state = state
-        self._save_state()
+        if changed:
+            self._save_state()
         return PumpDecision('OFF', state, reason)
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+LoRa Radio Multiplexer
+=======================
+One process owns the SX127x; every received frame, with its RSSI, SNR
+and reception time, is fanned out to any number of local subscribers
+over a Unix SOCK_SEQPACKET socket (LORA_MUX_SOCKET). The pump
+controller and the CSV packet logger can then run as separate services
+on one radio:
+
+    python3 radio_mux.py                      # wilo-radio-mux.service
+    python3 pump_controller.py --radio-mux
+    python3 lora_csv_receiver.py --radio-mux
+
+Each message is one frame: a fixed header (mux sequence number, t_rx,
+RSSI, SNR) followed by the raw payload. Every subscriber has its own
+bounded queue (LORA_MUX_CLIENT_QUEUE) drained with non-blocking sends;
+when a subscriber falls behind, its oldest frames are dropped and
+counted, so it never stalls the radio or the other subscribers. It
+sees the drop as a gap in the sequence numbers.
+
+RadioMuxClient has the receive API of sx127x.SX127x (start_rx_interrupt,
+get_packet, available/read_payload, ...), so consumers take either.
+"""
+
+import os
+import sys
+import time
+import queue
+import signal
+import socket
+import struct
+import logging
+import argparse
+import selectors
+import threading
+from collections import deque
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _HERE)
+
+import lora_capture
+import tank_config as CFG
+
+logger = logging.getLogger('wilo.mux')
+
+# seq (uint32), t_rx (epoch s), RSSI (dBm), SNR (dB), then the payload
+_HEADER = struct.Struct('<Idhf')
+MAX_PAYLOAD = 255               # SX127x FIFO limit
+MAX_FRAME = _HEADER.size + MAX_PAYLOAD
+
+
+def encode_frame(seq, payload, rssi, snr, t_rx):
+    return _HEADER.pack(seq & 0xFFFFFFFF, t_rx, rssi or 0, snr or 0.0) + bytes(payload)
+
+
+def decode_frame(msg):
+    """(seq, (payload, rssi, snr, t_rx)) for one socket message."""
+    seq, t_rx, rssi, snr = _HEADER.unpack_from(msg)
+    return seq, (msg[_HEADER.size:], rssi, round(snr, 2), t_rx)
+
+
+# ── Daemon ──────────────────────────────────────────────────
+
+class _Subscriber:
+    def __init__(self, sock, n, maxlen):
+        self.sock    = sock
+        self.name    = f"#{n}"
+        self.queue   = deque()
+        self.maxlen  = maxlen
+        self.sent    = 0
+        self.dropped = 0
+        self.writing = False        # registered for EVENT_WRITE
+
+    def push(self, frame):
+        if len(self.queue) >= self.maxlen:
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(frame)
+
+
+class RadioMux:
+    """Own the radio and fan its frames out to socket subscribers."""
+
+    def __init__(self, path=None, lora=None, client_queue=None, capture=None):
+        self.path = path or CFG.LORA_MUX_SOCKET
+        self.lora = lora            # SX127x (or a fake); created by run() if None
+        self.capture = capture or CFG.LORA_CAPTURE_PATH
+        self.client_queue = client_queue or CFG.LORA_MUX_CLIENT_QUEUE
+        self.running = False
+        self.frames  = 0
+        self.subscribers = {}       # fileno → _Subscriber
+        self._accepted = 0
+        self._sel = None
+        self._listen = None
+        self._wake_r = self._wake_w = None
+
+    # ── Setup ──
+
+    def _open_radio(self):
+        if self.lora is None:
+            from sx127x import SX127x
+            self.lora = SX127x(
+                spi_bus=CFG.LORA_SPI_BUS, spi_cs=CFG.LORA_SPI_CS,
+                reset_pin=CFG.LORA_RESET_PIN, dio0_pin=CFG.LORA_DIO0_PIN,
+                frequency=CFG.LORA_FREQUENCY, queue_size=CFG.LORA_RX_QUEUE_SIZE,
+                crc=CFG.LORA_CRC,
+            )
+        self.lora.receive()
+        lora_capture.attach(self.lora, self.capture)
+
+    def _open_socket(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        try:
+            os.unlink(self.path)            # stale socket from a previous run
+        except FileNotFoundError:
+            pass
+        self._listen = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self._listen.bind(self.path)
+        os.chmod(self.path, 0o660)
+        self._listen.listen(8)
+        self._listen.setblocking(False)
+
+    def start(self):
+        self._open_radio()
+        self._open_socket()
+        self._sel = selectors.DefaultSelector()
+        self._sel.register(self._listen, selectors.EVENT_READ, 'accept')
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, 'wake')
+        self.running = True
+        irq = CFG.LORA_DIO0_IRQ and self.lora.start_rx_interrupt(notify=self._wake)
+        logger.info(f"Radio mux on {self.path} — RxDone "
+                    f"{'via DIO0 interrupt' if irq else 'polled'}")
+        return irq
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b'\0')
+        except BlockingIOError:
+            pass                            # already pending
+
+    # ── Main loop ──
+
+    def run(self):
+        irq = self.start()
+        timeout = CFG.LORA_FALLBACK_POLL_S if irq else 0.01
+        last_report = time.monotonic()
+        try:
+            while self.running:
+                events = self._sel.select(timeout)
+                if not events:
+                    self.lora.poll()        # no IRQ, or a missed edge
+                for key, mask in events:
+                    if key.data == 'accept':
+                        self._accept()
+                    elif key.data == 'wake':
+                        try:
+                            os.read(self._wake_r, 4096)
+                        except BlockingIOError:
+                            pass
+                    else:
+                        sub = key.data
+                        if mask & selectors.EVENT_READ:
+                            self._check_closed(sub)
+                        if mask & selectors.EVENT_WRITE and sub.sock.fileno() in self.subscribers:
+                            self._flush(sub)
+                self._fan_out()
+                if time.monotonic() - last_report >= CFG.LORA_STATS_INTERVAL_S:
+                    self.log_stats()
+                    last_report = time.monotonic()
+        finally:
+            self.close()
+
+    def _fan_out(self):
+        while True:
+            item = self.lora.get_packet()
+            if item is None:
+                return
+            payload, rssi, snr, t_rx = item
+            frame = encode_frame(self.frames, payload, rssi, snr, t_rx)
+            self.frames += 1
+            for sub in list(self.subscribers.values()):
+                sub.push(frame)
+                self._flush(sub)
+
+    def _accept(self):
+        try:
+            sock, _ = self._listen.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        self._accepted += 1
+        sub = _Subscriber(sock, self._accepted, self.client_queue)
+        self.subscribers[sock.fileno()] = sub
+        self._sel.register(sock, selectors.EVENT_READ, sub)
+        logger.info(f"Subscriber {sub.name} connected ({len(self.subscribers)} total)")
+
+    def _flush(self, sub):
+        """Send queued frames until the socket buffer is full."""
+        try:
+            while sub.queue:
+                sub.sock.send(sub.queue[0])
+                sub.queue.popleft()
+                sub.sent += 1
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            self._drop(sub, e)
+            return
+        want = bool(sub.queue)
+        if want != sub.writing:
+            sub.writing = want
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if want else 0)
+            self._sel.modify(sub.sock, events, sub)
+
+    def _check_closed(self, sub):
+        try:
+            data = sub.sock.recv(64)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._drop(sub, e)
+            return
+        if not data:
+            self._drop(sub, None)
+
+    def _drop(self, sub, err):
+        self.subscribers.pop(sub.sock.fileno(), None)
+        self._sel.unregister(sub.sock)
+        sub.sock.close()
+        logger.info(f"Subscriber {sub.name} gone{f' ({err})' if err else ''} — "
+                    f"sent={sub.sent} dropped={sub.dropped}")
+
+    # ── Shutdown / stats ──
+
+    def log_stats(self):
+        subs = "  ".join(f"{s.name}: sent={s.sent} queued={len(s.queue)} dropped={s.dropped}"
+                         for s in self.subscribers.values()) or "no subscribers"
+        logger.info(f"Mux: frames={self.frames} radio_dropped={self.lora.rx_dropped} "
+                    f"crc_errors={getattr(self.lora, 'crc_errors', 0)}  {subs}")
+
+    def stop(self, *_):
+        self.running = False
+        if self._wake_w is not None:
+            self._wake()
+
+    def close(self):
+        self.running = False
+        if self._sel is None:
+            return
+        self.log_stats()
+        self._sel.unregister(self._listen)
+        self._listen.close()
+        for sub in list(self.subscribers.values()):
+            self._drop(sub, None)
+        self._sel.close()
+        self._sel = None
+        for fd in (self._wake_r, self._wake_w):
+            os.close(fd)
+        self._wake_r = self._wake_w = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.lora.close()
+
+
+# ── Subscriber side ─────────────────────────────────────────
+
+class RadioMuxClient:
+    """
+    SX127x receive API backed by a RadioMux subscription. A reader
+    thread takes the place of the DIO0 callback: it queues each frame
+    in ``rx_queue`` and calls ``notify()``. Reconnects every
+    LORA_MUX_RECONNECT_S while the daemon is down.
+    """
+
+    def __init__(self, path=None, queue_size=None, reconnect_s=None):
+        self.path = path or CFG.LORA_MUX_SOCKET
+        self.reconnect_s = reconnect_s or CFG.LORA_MUX_RECONNECT_S
+        self.rx_queue = queue.Queue(maxsize=queue_size or CFG.LORA_RX_QUEUE_SIZE)
+        self.rx_queue_peak = 0
+        self.rx_dropped = 0         # dropped here on a full rx_queue
+        self.mux_dropped = 0        # dropped by the daemon (sequence gaps)
+        self.irq_enabled = False
+        self.connected = False
+        self.last_irq_flags = 0
+        self._notify = None
+        self._running = False
+        self._thread = None
+        self._sock = None
+        self._next_seq = None
+        self._pending = None
+        self._rssi = None
+        self._snr = None
+
+    def receive(self):
+        """Subscribe (starts the reader thread; idempotent)."""
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._reader, name='lora-mux', daemon=True)
+            self._thread.start()
+
+    def start_rx_interrupt(self, notify=None):
+        self._notify = notify
+        self.receive()
+        self.irq_enabled = True
+        return True
+
+    def poll(self):
+        return False                # frames arrive on the reader thread
+
+    def get_packet(self, timeout=0):
+        try:
+            if timeout == 0:
+                return self.rx_queue.get_nowait()
+            return self.rx_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    # Polled API, as SX127x.available() / read_payload()
+    def available(self):
+        if self._pending is None:
+            self._pending = self.get_packet()
+        return self._pending is not None
+
+    def read_payload(self):
+        payload, self._rssi, self._snr, _ = self._pending
+        self._pending = None
+        return payload
+
+    def get_packet_rssi(self):
+        return self._rssi
+
+    def get_packet_snr(self):
+        return self._snr
+
+    def standby(self):
+        pass
+
+    def sleep(self):
+        pass
+
+    def close(self):
+        self._running = False
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._next_seq = None
+        self.connected = True
+        logger.info(f"Subscribed to radio mux {self.path}")
+
+    def _reader(self):
+        warned = False
+        while self._running:
+            if self._sock is None:
+                try:
+                    self._connect()
+                    warned = False
+                except OSError as e:
+                    if not warned:
+                        logger.warning(f"Radio mux {self.path} unavailable ({e}); retrying")
+                        warned = True
+                    time.sleep(self.reconnect_s)
+                    continue
+            try:
+                msg = self._sock.recv(MAX_FRAME)
+            except OSError:
+                msg = b''
+            if not msg:
+                self._sock.close()
+                self._sock = None
+                self.connected = False
+                if self._running:
+                    logger.warning("Radio mux connection lost; reconnecting")
+                continue
+            self._put(msg)
+
+    def _put(self, msg):
+        seq, item = decode_frame(msg)
+        if self._next_seq is not None and seq != self._next_seq:
+            self.mux_dropped += (seq - self._next_seq) & 0xFFFFFFFF
+        self._next_seq = (seq + 1) & 0xFFFFFFFF
+        self._enqueue(item)
+
+    def _enqueue(self, item):
+        try:
+            self.rx_queue.put_nowait(item)
+        except queue.Full:
+            try:
+                self.rx_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.rx_dropped += 1
+            self.rx_queue.put_nowait(item)
+        depth = self.rx_queue.qsize()
+        if depth > self.rx_queue_peak:
+            self.rx_queue_peak = depth
+        if self._notify is not None:
+            self._notify()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Own the SX127x and share its frames '
+                                                 'with local subscribers')
+    parser.add_argument('--socket', default=CFG.LORA_MUX_SOCKET,
+                        help=f'Unix socket path (default: {CFG.LORA_MUX_SOCKET})')
+    parser.add_argument('--capture', metavar='PATH',
+                        help='Record raw LoRa frames (see lora_capture.py)')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Debug logging')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s [%(name)-12s] %(levelname)-7s %(message)s',
+                        datefmt='%H:%M:%S')
+    mux = RadioMux(args.socket, capture=args.capture)
+    signal.signal(signal.SIGINT, mux.stop)
+    signal.signal(signal.SIGTERM, mux.stop)
+    mux.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,20 @@
 GPIO Relay Control for Wilo Pump
 =================================
 Handles relay switching with safety interlocks and manual override buttons.
+
+Buttons are edge-triggered (GPIO.add_event_detect on both edges) and
+debounced by timestamp, so reading them never sleeps:
+
+    short press  ON / OFF   → force pump ON / OFF
+    long press   either     → release override (back to AUTO)
+
+FakeGPIO mimics the RPi.GPIO calls used here for running off-Pi.
 """
 
 import time
 import logging
+import threading
+from collections import deque
 
 logger = logging.getLogger('wilo.relay')
 
@@ -20,11 +30,138 @@ def _gpio():
     return _GPIO
 
 
+# ── Fake GPIO (simulation / tests) ──────────────────────────
+
+class FakeGPIO:
+    """
+    In-memory stand-in for the RPi.GPIO module. Inputs follow their
+    pull resistor until driven with set_input() / press() / release(),
+    which fire registered edge callbacks synchronously, like the
+    RPi.GPIO event thread would.
+    """
+
+    BCM, BOARD = 11, 10
+    IN, OUT = 1, 0
+    LOW, HIGH = 0, 1
+    PUD_OFF, PUD_DOWN, PUD_UP = 20, 21, 22
+    RISING, FALLING, BOTH = 31, 32, 33
+
+    def __init__(self):
+        self.mode      = None
+        self.levels    = {}         # pin → level
+        self.modes     = {}         # pin → IN / OUT
+        self.callbacks = {}         # pin → (edge, callback)
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode, pull_up_down=None, initial=None):
+        self.modes[pin] = mode
+        if mode == self.IN:
+            self.levels[pin] = self.HIGH if pull_up_down == self.PUD_UP else self.LOW
+        else:
+            self.levels[pin] = self.LOW if initial is None else initial
+
+    def output(self, pin, level):
+        self.levels[pin] = level
+
+    def input(self, pin):
+        return self.levels.get(pin, self.LOW)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self, pins=None):
+        self.callbacks.clear()
+
+    # ── Simulation hooks ──
+
+    def set_input(self, pin, level):
+        old = self.levels.get(pin)
+        self.levels[pin] = level
+        if old == level or pin not in self.callbacks:
+            return
+        edge, callback = self.callbacks[pin]
+        rising = level == self.HIGH
+        if callback and (edge == self.BOTH or
+                         (edge == self.RISING) == rising):
+            callback(pin)
+
+    def press(self, pin):
+        self.set_input(pin, self.LOW)
+
+    def release(self, pin):
+        self.set_input(pin, self.HIGH)
+
+
+# ── Button debounce state machine ───────────────────────────
+
+class _Button:
+    """
+    Timestamp-debounced push button (pressed = LOW).
+
+    feed() takes raw edges (from the GPIO callback thread), update()
+    advances the state machine at poll time. A press is confirmed once
+    the level has stayed LOW for ``debounce_s``, but only reported on
+    release: a short press yields 'press', while holding for
+    ``long_press_s`` yields 'long' as soon as the hold is reached and
+    nothing on release. Presses released between two polls still count.
+    """
+
+    IDLE, PRESSED, HELD = 'idle', 'pressed', 'held'
+
+    def __init__(self, pin, debounce_s, long_press_s):
+        self.pin          = pin
+        self.debounce_s   = debounce_s
+        self.long_press_s = long_press_s
+        self.pressed      = False       # raw level is LOW
+        self.since        = 0.0         # time of last raw edge
+        self.state        = self.IDLE
+        self.pending      = deque()
+        self.lock         = threading.Lock()
+
+    def feed(self, pressed, t):
+        with self.lock:
+            if pressed == self.pressed:
+                return
+            if not pressed and self.state != self.HELD:
+                held = t - self.since
+                if held >= self.long_press_s:
+                    self.pending.append('long')     # held and released between polls
+                elif held >= self.debounce_s:
+                    self.pending.append('press')
+            if not pressed:
+                self.state = self.IDLE
+            self.pressed = pressed
+            self.since = t
+
+    def update(self, now):
+        """Return the events ('press' / 'long') confirmed up to ``now``."""
+        with self.lock:
+            events = list(self.pending)
+            self.pending.clear()
+            if self.pressed:
+                held = now - self.since
+                if self.state == self.IDLE and held >= self.debounce_s:
+                    self.state = self.PRESSED
+                if self.state == self.PRESSED and held >= self.long_press_s:
+                    self.state = self.HELD
+                    events.append('long')
+            return events
+
+
 class RelayController:
     """Controls pump relay and reads manual-override buttons."""
 
     def __init__(self, pump_pin, valve_pin, active_low,
-                 btn_on_pin, btn_off_pin, led_pin, debounce_ms=200):
+                 btn_on_pin, btn_off_pin, led_pin, debounce_ms=200,
+                 long_press_ms=3000, gpio=None, clock=time.monotonic):
         self.pump_pin   = pump_pin
         self.valve_pin  = valve_pin
         self.active_low = active_low
@@ -34,22 +171,49 @@ class RelayController:
         self.debounce_s = debounce_ms / 1000.0
         self.pump_on    = False
         self._ready     = False
+        self._gpio_mod  = gpio
+        self._clock     = clock
+        self._edges     = False         # edge detection active
+        self._buttons   = {                 # pins set to None are not fitted
+            pin: (mode, _Button(pin, self.debounce_s, long_press_ms / 1000.0))
+            for pin, mode in ((btn_on_pin, 'ON'), (btn_off_pin, 'OFF'))
+            if pin is not None
+        }
+
+    @property
+    def gpio(self):
+        if self._gpio_mod is None:
+            self._gpio_mod = _gpio()
+        return self._gpio_mod
 
     # ── Init / cleanup ────────────────────────────────────────
 
     def initialize(self):
         """Setup GPIO pins. Call AFTER GPIO.setmode(BCM) in main."""
-        gpio = _gpio()
-        gpio.setup(self.pump_pin,  gpio.OUT)
-        gpio.setup(self.valve_pin, gpio.OUT)
-        gpio.setup(self.led_pin,   gpio.OUT)
-        gpio.setup(self.btn_on,    gpio.IN, pull_up_down=gpio.PUD_UP)
-        gpio.setup(self.btn_off,   gpio.IN, pull_up_down=gpio.PUD_UP)
+        gpio = self.gpio
+        for pin in (self.pump_pin, self.valve_pin, self.led_pin):
+            if pin is not None:
+                gpio.setup(pin, gpio.OUT)
+        for pin in self._buttons:
+            gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP)
 
         # Start with everything OFF
         self._relay(self.pump_pin, False)
         self._relay(self.valve_pin, False)
-        gpio.output(self.led_pin, gpio.LOW)
+        self._led(False)
+
+        # Edge-triggered buttons; fall back to level sampling in
+        # poll_buttons() if the kernel refuses edge detection
+        now = self._clock()
+        for pin, (_, btn) in self._buttons.items():
+            btn.feed(gpio.input(pin) == gpio.LOW, now)
+        try:
+            for pin in self._buttons:
+                gpio.add_event_detect(pin, gpio.BOTH, callback=self._on_edge)
+            self._edges = True
+        except (RuntimeError, AttributeError) as e:
+            logger.warning(f"Button edge detection unavailable ({e}) — sampling instead")
+
         self._ready = True
         logger.info("Relay controller initialised  "
                      f"pump=GPIO{self.pump_pin}  valve=GPIO{self.valve_pin}  "
@@ -59,18 +223,31 @@ class RelayController:
         """Ensure pump OFF before shutdown."""
         if self._ready:
             self.pump_stop()
-            _gpio().output(self.led_pin, _gpio().LOW)
+            self._led(False)
+            if self._edges:
+                for pin in self._buttons:
+                    try:
+                        self.gpio.remove_event_detect(pin)
+                    except Exception:
+                        pass
+                self._edges = False
         self._ready = False
 
     # ── Relay helpers ─────────────────────────────────────────
 
     def _relay(self, pin, on: bool):
-        gpio = _gpio()
+        if pin is None:
+            return
+        gpio = self.gpio
         if self.active_low:
             gpio.output(pin, gpio.LOW if on else gpio.HIGH)
         else:
             gpio.output(pin, gpio.HIGH if on else gpio.LOW)
 
+    def _led(self, on: bool):
+        if self.led_pin is not None:
+            self.gpio.output(self.led_pin, self.gpio.HIGH if on else self.gpio.LOW)
+
     # ── Pump control ─────────────────────────────────────────
 
     def pump_start(self) -> bool:
@@ -78,7 +255,7 @@ class RelayController:
             logger.error("Relay not initialised!")
             return False
         self._relay(self.pump_pin, True)
-        _gpio().output(self.led_pin, _gpio().HIGH)
+        self._led(True)
         self.pump_on = True
         logger.info("⚡ PUMP → ON")
         return True
@@ -88,35 +265,50 @@ class RelayController:
             logger.error("Relay not initialised!")
             return False
         self._relay(self.pump_pin, False)
-        _gpio().output(self.led_pin, _gpio().LOW)
+        self._led(False)
         self.pump_on = False
         logger.info("⏹  PUMP → OFF")
         return True
 
     def emergency_stop(self):
         """All relays OFF immediately — no checks."""
-        gpio = _gpio()
+        gpio = self.gpio
         off = gpio.HIGH if self.active_low else gpio.LOW
         gpio.output(self.pump_pin, off)
-        gpio.output(self.valve_pin, off)
-        gpio.output(self.led_pin, gpio.LOW)
+        if self.valve_pin is not None:
+            gpio.output(self.valve_pin, off)
+        self._led(False)
         self.pump_on = False
         logger.warning("🚨 EMERGENCY STOP — all relays OFF")
 
     # ── Manual override buttons ──────────────────────────────
 
+    def _on_edge(self, pin):
+        """GPIO event-thread callback: timestamp the edge, nothing else."""
+        entry = self._buttons.get(pin)
+        if entry:
+            entry[1].feed(self.gpio.input(pin) == self.gpio.LOW, self._clock())
+
+    def poll_buttons(self, now=None):
+        """
+        Non-blocking. Returns the override events confirmed since the
+        last call, in order: 'ON' / 'OFF' for a short press, 'AUTO' when
+        either button is held for the long-press time.
+        """
+        gpio = self.gpio
+        now = self._clock() if now is None else now
+        events = []
+        for pin, (mode, btn) in self._buttons.items():
+            if not self._edges:
+                btn.feed(gpio.input(pin) == gpio.LOW, now)
+            for ev in btn.update(now):
+                events.append(mode if ev == 'press' else 'AUTO')
+        return events
+
     def read_override_buttons(self):
         """
-        Returns 'ON', 'OFF', or None.
+        Returns 'ON', 'OFF', 'AUTO' or None — the latest confirmed event.
         Buttons are normally-open with internal pull-up → pressed = LOW.
         """
-        gpio = _gpio()
-        if gpio.input(self.btn_on) == gpio.LOW:
-            time.sleep(self.debounce_s)
-            if gpio.input(self.btn_on) == gpio.LOW:
-                return 'ON'
-        if gpio.input(self.btn_off) == gpio.LOW:
-            time.sleep(self.debounce_s)
-            if gpio.input(self.btn_off) == gpio.LOW:
-                return 'OFF'
-        return None
+        events = self.poll_buttons()
+        return events[-1] if events else None
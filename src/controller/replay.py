@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Log Replay
+===========
+Streams a recorded log through a fresh HybridPumpLogic on a virtual
+clock, as fast as the CPU allows, to try threshold / max-run / ML window
+changes before deploying them:
+
+    python3 replay.py logs/pump/rpi_pump_log.csv --low 30 --high 80
+    python3 replay.py logs/lora/esp32_pressure_packets.csv --max-run-min 120
+
+Two inputs are understood (detected from the header):
+
+  controller log  rpi_pump_log.csv — one row per tick with the level,
+                  sensor status, pump current and the recorded decision.
+                  Gaps longer than RESTART_GAP_S are treated as a
+                  controller restart (power-restore delay applies).
+  packet log      esp32_pressure_packets.csv — one row per LoRa packet;
+                  levels are derived with each tank's geometry and level
+                  filter, and ticks are inserted between packets so the
+                  time-based rules (LoRa timeout, max-run) still fire.
+
+The recorded level is corrected for the difference between replayed
+and recorded pumping (PUMP_FLOW_RATE_LPM into the tank's capacity), so
+a replay that stops the pump earlier also sees a lower tank afterwards.
+Household draw is taken from the recording. Use --open-loop to feed the
+recorded level unchanged.
+
+The report covers pump cycles, runtime, time at or past each threshold,
+time per decision state and where the replay disagrees with the recorded
+relay.
+"""
+
+import os
+import sys
+import csv
+import json
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+from collections import Counter
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _HERE)
+
+import clock
+import tank_config as CFG
+from pump_logic import HybridPumpLogic, PumpState
+from tank_geometry import TankGeometry
+from level_filter import make_filter
+from tanks import tank_specs
+
+logger = logging.getLogger('wilo.replay')
+
+RESTART_GAP_S = 10          # controller log gap treated as a restart (as pump_logic)
+MAX_DIVERGENCES = 20        # divergences listed in the report
+
+# Recorded states that outrank a manual override (P0–P2); any other
+# non-manual recorded state means the override had been released.
+_ABOVE_OVERRIDE = {
+    PumpState.OFF_POWER_RESTORE.value, PumpState.ON_EMERGENCY.value,
+    PumpState.OFF_EMERGENCY.value, PumpState.OFF_LORA_TIMEOUT.value,
+    PumpState.OFF_SENSOR_FAULT.value, PumpState.OFF_MAX_RUN.value,
+    PumpState.OFF_DRY_RUN.value,
+}
+_ON_MANUAL  = PumpState.ON_MANUAL.value
+_OFF_MANUAL = PumpState.OFF_MANUAL.value
+
+
+def _float(s):
+    return float(s) if s else None
+
+
+# ── Log readers ─────────────────────────────────────────────
+# Both yield (ts, tank, level_pct, status, current_a, relay, state, packet)
+# where relay/state are the recorded values ('' when not logged) and
+# packet tells whether the row carries a fresh LoRa reading.
+
+def _controller_rows(f, header, specs):
+    col = {name: k for k, name in enumerate(header)}
+    k_ts, k_pct = col['timestamp'], col['upper_tank_pct']
+    k_st, k_cur = col['sensor_status'], col['pump_current_a']
+    k_rel, k_state = col['pump_relay'], col['decision_state']
+    k_tank = col.get('tank')
+    default = specs[0]['name']
+    timeout = PumpState.OFF_LORA_TIMEOUT.value
+    parse = datetime.fromisoformat
+    for r in csv.reader(f):
+        tank = (r[k_tank] if k_tank is not None else '') or default
+        # One row per tick and packets arrive about once a tick, so every
+        # row counts as a reading unless the recording had lost the radio
+        state = r[k_state]
+        status = r[k_st]
+        yield (parse(r[k_ts]), tank, _float(r[k_pct]), status,
+               _float(r[k_cur]), r[k_rel], state, bool(status) and state != timeout)
+
+
+def _packet_rows(f, header, specs):
+    col = {name: k for k, name in enumerate(header)}
+    k_ts, k_dev = col['timestamp'], col['device']
+    k_st, k_kpa = col['status'], col['pressure_kpa']
+    by_device = {s['device']: s for s in specs}
+    geometry = {s['name']: TankGeometry.from_spec(s) for s in specs}
+    filters = {s['name']: make_filter(s['level_filter'], geometry[s['name']].capacity_l)
+               for s in specs}
+    parse = datetime.fromisoformat
+    t0 = None
+    for r in csv.reader(f):
+        spec = by_device.get(r[k_dev])
+        if spec is None:
+            continue                    # parse error or foreign device
+        ts = parse(r[k_ts])
+        t0 = t0 or ts
+        name = spec['name']
+        status = r[k_st]
+        pct = None
+        if status != 'fault':
+            pct, _ = geometry[name].convert(_float(r[k_kpa]))
+        # Pump state is not in this log; the filter runs without it
+        pct = filters[name].update(pct, (ts - t0).total_seconds())
+        yield ts, name, pct, status, None, '', '', True
+
+
+# ── Per-tank replay ─────────────────────────────────────────
+
+class TankReplay:
+    """Fresh HybridPumpLogic for one tank plus its replay statistics."""
+
+    def __init__(self, spec, workdir, fill_pct_s, closed_loop=True, recorded=True):
+        self.spec = spec
+        self.logic = HybridPumpLogic(
+            state_file=os.path.join(workdir, f"state_{spec['name']}.json"),
+            critical_low=spec['critical_low'], low=spec['low'],
+            high=spec['high'], critical_high=spec['critical_high'],
+            lora_timeout_s=spec['lora_timeout_s'], max_run_min=spec['max_run_min'],
+            dry_run_a=spec['dry_run_a'], dry_run_enabled=CFG.DRY_RUN_PROTECTION,
+            power_delay_s=CFG.POWER_RESTORE_DELAY_S,
+            override_timeout_min=CFG.OVERRIDE_TIMEOUT_MIN,
+            ml_enabled=spec['ml'] is not None, ml_window_min=spec['ml_window_min'],
+        )
+        if spec['ml'] is not None:
+            self.logic.ml_prediction = spec['ml']
+        self.fill_pct_s  = fill_pct_s
+        self.recorded    = recorded         # log has the recorded relay state
+        self.closed_loop = closed_loop and recorded
+
+        self.pump_on   = False
+        self.rec_on    = False
+        self.offset    = 0.0            # level % gained (lost) vs the recording
+        self.last_t    = None
+        self.last_pct  = None
+        self.state     = PumpState.OFF.value
+
+        # ── Statistics ──
+        self.rows       = 0
+        self.decisions  = 0
+        self.starts     = 0
+        self.rec_starts = 0
+        self.on_s       = 0.0
+        self.rec_on_s   = 0.0
+        self.disagree_s = 0.0
+        self.state_s    = Counter()     # replay state → seconds
+        self.level_s    = Counter()     # threshold band → seconds
+        self.seconds    = 0.0
+        self.divergences = []
+
+    def _elapse(self, t):
+        """Account time since the previous row at the previous row's state."""
+        if self.last_t is None:
+            return
+        dt = t - self.last_t
+        if dt <= 0:
+            return
+        self.seconds += dt
+        if self.pump_on:
+            self.on_s += dt
+        if self.rec_on:
+            self.rec_on_s += dt
+        if self.recorded and self.pump_on != self.rec_on:
+            self.disagree_s += dt
+            if self.closed_loop:
+                self.offset += (dt if self.pump_on else -dt) * self.fill_pct_s
+        self.state_s[self.state] += dt
+        pct = self.last_pct
+        if pct is not None:
+            s = self.spec
+            if pct <= s['critical_low']:
+                self.level_s['critical_low'] += dt
+            if pct <= s['low']:
+                self.level_s['low'] += dt
+            if pct >= s['high']:
+                self.level_s['high'] += dt
+            if pct >= s['critical_high']:
+                self.level_s['critical_high'] += dt
+
+    def step(self, t, level, status, current, relay, rec_state, packet):
+        """Advance to virtual time ``t`` and run one decision."""
+        self._elapse(t)
+        self.last_t = t
+        self.rows += 1
+
+        if level is not None and self.closed_loop and self.offset:
+            # Keep the correction within what the tank can physically hold
+            self.offset = max(-level, min(100.0 - level, self.offset))
+            level += self.offset
+        self.last_pct = level
+
+        logic = self.logic
+        if packet:
+            if status == 'fault':
+                logic.signal_lora_fault()
+            elif status:
+                logic.signal_lora_ok()
+
+        if rec_state:
+            self._follow_override(rec_state)
+
+        if relay:
+            on = relay == 'ON'
+            if on and not self.rec_on:
+                self.rec_starts += 1
+            self.rec_on = on
+
+        # Recorded current is only meaningful while both pumps ran
+        amps = current if (self.pump_on and self.rec_on) else None
+        d = logic.decide(level, self.pump_on, amps)
+        self.decisions += 1
+        if d.action == 'ON' and not self.pump_on:
+            self.pump_on = True
+            self.starts += 1
+        elif d.action == 'OFF' and self.pump_on:
+            self.pump_on = False
+        self.state = d.state.value
+
+        if relay and self.pump_on != self.rec_on and len(self.divergences) < MAX_DIVERGENCES:
+            if not self.divergences or self.divergences[-1][3] != self.state:
+                self.divergences.append((clock.now().isoformat(), rec_state or relay,
+                                         relay, self.state, d.reason))
+
+    def _follow_override(self, rec_state):
+        logic = self.logic
+        if rec_state == _ON_MANUAL:
+            if logic.override != 'ON':
+                logic.set_override('ON')
+        elif rec_state == _OFF_MANUAL:
+            if logic.override != 'OFF':
+                logic.set_override('OFF')
+        elif logic.override and rec_state not in _ABOVE_OVERRIDE:
+            logic.set_override(None)
+
+    def restart(self):
+        """Controller restart in the recording: relay dropped, power-restore delay."""
+        self.pump_on = self.rec_on = False
+        self.last_t = None                  # downtime is not accounted
+        self.logic.pump_start_time = None
+        self.logic.current_state = PumpState.OFF
+        self.logic.power_restore_ts = clock.now()
+
+    def summary(self):
+        h = 3600.0
+        return {
+            'hours':          round(self.seconds / h, 2),
+            'rows':           self.rows,
+            'pump_starts':    self.starts,
+            'pump_on_h':      round(self.on_s / h, 2),
+            'recorded_starts': self.rec_starts,
+            'recorded_on_h':  round(self.rec_on_s / h, 2),
+            'disagree_h':     round(self.disagree_s / h, 2),
+            'level_h':        {k: round(v / h, 2) for k, v in self.level_s.items()},
+            'state_h':        {k: round(v / h, 2) for k, v in self.state_s.most_common()},
+            'divergences':    [dict(zip(('ts', 'recorded', 'relay', 'replay', 'reason'), d))
+                               for d in self.divergences],
+        }
+
+
+# ── Driver ──────────────────────────────────────────────────
+
+class Replay:
+    """Runs one log file through a TankReplay per configured tank."""
+
+    def __init__(self, overrides=None, ml=None, closed_loop=True, only_tank=None):
+        self.specs = []
+        for s in tank_specs():
+            s = dict(s, lora_timeout_s=CFG.LORA_TIMEOUT_S,
+                     ml_window_min=CFG.ML_ACTIVATION_WINDOW_MIN, ml=ml)
+            s.update({k: v for k, v in (overrides or {}).items() if v is not None})
+            self.specs.append(s)
+        self.only_tank   = only_tank
+        self.closed_loop = closed_loop
+        self.tanks = {}
+        self.kind  = None
+
+    def run(self, path):
+        clk = clock.VirtualClock()
+        clock.install(clk)
+        # Override / ML chatter from thousands of decisions is not useful here
+        logic_log = logging.getLogger('wilo.logic')
+        level = logic_log.level
+        logic_log.setLevel(logging.WARNING)
+        try:
+            with tempfile.TemporaryDirectory(prefix='wilo-replay-') as workdir, \
+                    open(path, newline='') as f:
+                header = next(csv.reader(f))
+                if 'decision_state' in header:
+                    self.kind, rows = 'controller', _controller_rows(f, header, self.specs)
+                elif 'raw_payload' in header:
+                    self.kind, rows = 'packets', _packet_rows(f, header, self.specs)
+                else:
+                    raise ValueError(f"{path}: not a controller or LoRa packet log")
+                self._run(rows, clk, workdir)
+        finally:
+            logic_log.setLevel(level)
+            clock.install(None)
+        return self.summary()
+
+    def _run(self, rows, clk, workdir):
+        tanks = self.tanks
+        tick = CFG.LOOP_INTERVAL_S
+        controller = self.kind == 'controller'
+        last = {}
+        for ts, name, level, status, current, relay, state, packet in rows:
+            if self.only_tank and name != self.only_tank:
+                continue
+            tr = tanks.get(name)
+            if tr is None:
+                spec = next((s for s in self.specs if s['name'] == name), self.specs[0])
+                if clk.monotonic() == 0.0:
+                    clk.start = ts
+                capacity_l = TankGeometry.from_spec(spec).capacity_l
+                fill = CFG.PUMP_FLOW_RATE_LPM / capacity_l * 100.0 / 60.0
+                clk.t = (ts - clk.start).total_seconds()
+                tr = tanks[name] = TankReplay(spec, workdir, fill, self.closed_loop,
+                                              recorded=controller)
+            t = (ts - clk.start).total_seconds()
+            prev = last.get(name)
+            if prev is not None and t - prev > RESTART_GAP_S:
+                if controller:
+                    clk.t = t
+                    tr.restart()
+                else:
+                    # Packet log: the controller kept ticking between packets
+                    k = prev + tick
+                    while k < t:
+                        clk.t = k
+                        tr.step(k, tr.last_pct - tr.offset if tr.last_pct is not None else None,
+                                '', None, '', '', False)
+                        k += tick
+            last[name] = t
+            clk.t = t
+            tr.step(t, level, status, current, relay, state, packet)
+
+    def summary(self):
+        return {
+            'kind':  self.kind,
+            'tanks': {name: tr.summary() for name, tr in self.tanks.items()},
+        }
+
+
+def print_report(summary, elapsed_s=None):
+    print(f"Replayed {summary['kind']} log"
+          + (f" in {elapsed_s:.1f} s" if elapsed_s is not None else ''))
+    for name, s in summary['tanks'].items():
+        speed = f"  ({s['hours'] * 3600 / elapsed_s:,.0f}× real time)" if elapsed_s else ''
+        print(f"\n[{name}]  {s['hours']} h, {s['rows']} rows{speed}")
+        if summary['kind'] == 'controller':
+            print(f"  pump starts   {s['pump_starts']:>8}   recorded {s['recorded_starts']}")
+            print(f"  pump on (h)   {s['pump_on_h']:>8}   recorded {s['recorded_on_h']}")
+            print(f"  disagree (h)  {s['disagree_h']:>8}")
+        else:
+            print(f"  pump starts   {s['pump_starts']:>8}")
+            print(f"  pump on (h)   {s['pump_on_h']:>8}")
+        for band in ('critical_low', 'low', 'high', 'critical_high'):
+            print(f"  at/past {band:<14} {s['level_h'].get(band, 0.0)} h")
+        print("  time per state (h): "
+              + ", ".join(f"{k}={v}" for k, v in s['state_h'].items()))
+        if s['divergences']:
+            print("  first divergences:")
+            for d in s['divergences']:
+                print(f"    {d['ts']}  recorded {d['recorded']:<16} replay {d['replay']:<16} {d['reason']}")
+
+
+def main(argv=None):
+    import time
+    ap = argparse.ArgumentParser(description='Replay a recorded pump or LoRa packet log '
+                                             'through HybridPumpLogic')
+    ap.add_argument('log', help='rpi_pump_log.csv or esp32_pressure_packets.csv')
+    ap.add_argument('--tank', help='only replay this tank')
+    ap.add_argument('--critical-low', type=float)
+    ap.add_argument('--low', type=float)
+    ap.add_argument('--high', type=float)
+    ap.add_argument('--critical-high', type=float)
+    ap.add_argument('--max-run-min', type=float)
+    ap.add_argument('--lora-timeout-s', type=float)
+    ap.add_argument('--ml-start-hour', type=float,
+                    help='enable the ML rule with this predicted start hour')
+    ap.add_argument('--ml-duration', type=float, default=30.0,
+                    help='predicted run (min) for --ml-start-hour (default: %(default)s)')
+    ap.add_argument('--ml-window-min', type=float)
+    ap.add_argument('--open-loop', action='store_true',
+                    help='feed the recorded level unchanged')
+    ap.add_argument('--json', metavar='PATH', help='also write the summary as JSON')
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+    overrides = {
+        'critical_low': args.critical_low, 'low': args.low, 'high': args.high,
+        'critical_high': args.critical_high, 'max_run_min': args.max_run_min,
+        'lora_timeout_s': args.lora_timeout_s, 'ml_window_min': args.ml_window_min,
+    }
+    ml = None
+    if args.ml_start_hour is not None:
+        ml = {'start_hour': args.ml_start_hour, 'duration': args.ml_duration}
+
+    replay = Replay(overrides, ml=ml, closed_loop=not args.open_loop, only_tank=args.tank)
+    t0 = time.perf_counter()
+    summary = replay.run(args.log)
+    print_report(summary, time.perf_counter() - t0)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
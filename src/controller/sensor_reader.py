@@ -11,35 +11,196 @@ IMPORTANT: Both ACS712T and ZMPT101B output 0-5 V.
 If the ADS1115 is not connected, this module operates in
 "degraded" mode — all reads return None and the pump controller
 falls back to LoRa-only upper-tank data.
+
+Acquisition runs the ADS1115 in continuous-conversion mode at a fixed
+data rate and reads one channel per block, paced at that rate. Block
+lengths are chosen to span a whole number of mains cycles, so the block
+mean is the sensor's DC offset and the RMS of the remainder is the true
+AC RMS; both are computed with NumPy. FakeAdcBackend synthesises the
+same signals for testing off-Pi.
+
+In interleaved mode current and voltage are sampled alternately into one
+paired block (voltage re-aligned to the current sample instants), which
+adds real power, apparent power, power factor and cumulative energy to
+the same vectorised pass.
+
+Once start() is called, a background thread samples both channels
+into a preallocated NumPy block buffer and publishes RMS snapshots, so
+read_all() returns immediately instead of blocking for the I2C burst.
+Shorter windows are taken (less often) while the pump is off.
 """
 
 import time
-import math
 import logging
+import threading
 from typing import Optional
 
+import numpy as np
+
+import clock
+
 logger = logging.getLogger('wilo.sensors')
 
+# ACS712 output slope (V per A) by model
+ACS712_SENSITIVITY = {'5A': 0.185, '20A': 0.100, '30A': 0.066}
+
 # ── Try importing ADS1115 library (only works on real Pi) ──
 _ADS_OK = False
 try:
     import board
     import busio
     import adafruit_ads1x15.ads1115 as ADS
+    from adafruit_ads1x15.ads1x15 import Mode
     from adafruit_ads1x15.analog_in import AnalogIn
     _ADS_OK = True
 except ImportError:
     pass
 
 
+def whole_cycle_window(data_rate, mains_hz, min_cycles, max_samples):
+    """
+    Return the sample count spanning an (almost exactly) integer number of
+    mains cycles: the cycle count ≥ min_cycles whose length in samples is
+    closest to a whole number, without exceeding max_samples.
+    """
+    per_cycle = data_rate / mains_hz
+    best_n, best_err = max(1, round(min_cycles * per_cycle)), 1.0
+    cycles = min_cycles
+    while cycles * per_cycle <= max_samples:
+        exact = cycles * per_cycle
+        err = abs(exact - round(exact))
+        if err < best_err - 1e-9:
+            best_n, best_err = round(exact), err
+        if err < 1e-9:
+            break
+        cycles += 1
+    return min(best_n, max_samples)
+
+
+# ── ADC backends ─────────────────────────────────────────────
+
+class Ads1115Backend:
+    """ADS1115 via the Adafruit driver, continuous or single-shot."""
+
+    FULL_SCALE_V = 6.144        # gain 2/3
+
+    def __init__(self, address=0x48, data_rate=860, continuous=True):
+        self.address    = address
+        self.data_rate  = data_rate
+        self.continuous = continuous
+        self.lsb        = self.FULL_SCALE_V / 32768.0
+        self.ads        = None
+        self._chans     = {}
+
+    def open(self):
+        if self.ads is not None:                # shared by several readers
+            return
+        i2c = busio.I2C(board.SCL, board.SDA)
+        self.ads = ADS.ADS1115(i2c, address=self.address)
+        self.ads.gain = 2/3                     # ±6.144 V (allows 0-5 V)
+        self.ads.data_rate = self.data_rate
+        self.ads.mode = Mode.CONTINUOUS if self.continuous else Mode.SINGLE
+        pins = [ADS.P0, ADS.P1, ADS.P2, ADS.P3]
+        self._chans = {n: AnalogIn(self.ads, pin) for n, pin in enumerate(pins)}
+
+    def read_block(self, channel, out):
+        """Fill ``out`` with channel voltages."""
+        chan = self._chans[channel]
+        raw = chan.value                        # selects the mux (restarts conversion)
+        if self.continuous:
+            # Pace reads at the data rate, starting one conversion after the mux switch
+            period = 1.0 / self.data_rate
+            due = time.perf_counter() + period
+            for i in range(len(out)):
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                out[i] = chan.value
+                due += period
+        else:
+            out[0] = raw
+            for i in range(1, len(out)):
+                out[i] = chan.value
+        out *= self.lsb
+        return out
+
+    def read_pairs(self, ch_a, ch_b, out):
+        """
+        Fill ``out[0]``/``out[1]`` with alternating ch_a/ch_b samples.
+        Every read switches the mux, so each is a fresh conversion; returns
+        the measured pair rate (pairs per second).
+        """
+        a, b = self._chans[ch_a], self._chans[ch_b]
+        n = out.shape[1]
+        t0 = time.perf_counter()
+        for i in range(n):
+            out[0, i] = a.value
+            out[1, i] = b.value
+        elapsed = time.perf_counter() - t0
+        out *= self.lsb
+        return n / elapsed if elapsed > 0 else self.data_rate / 2.0
+
+
+class FakeAdcBackend:
+    """
+    Synthetic ADC for off-Pi testing.
+    Each channel is offset + amplitude·sin(2πft + phase) + Gaussian noise,
+    sampled at data_rate on a virtual time axis.
+    """
+
+    def __init__(self, data_rate=860, realtime=False, seed=None):
+        self.data_rate = data_rate
+        self.realtime  = realtime
+        self.signals   = {}
+        self.t         = 0.0
+        self._rng      = np.random.default_rng(seed)
+
+    def set_signal(self, channel, offset_v=2.5, amplitude_v=0.0,
+                   freq_hz=50.0, phase_rad=0.0, noise_v=0.0):
+        self.signals[channel] = (offset_v, amplitude_v, freq_hz, phase_rad, noise_v)
+
+    def open(self):
+        pass
+
+    def _wave(self, channel, t):
+        offset, amp, freq, phase, noise = self.signals.get(channel, (2.5, 0.0, 50.0, 0.0, 0.0))
+        x = offset + amp * np.sin(2 * np.pi * freq * t + phase)
+        if noise:
+            x += self._rng.normal(0.0, noise, len(t))
+        return x
+
+    def read_block(self, channel, out):
+        n = len(out)
+        out[:] = self._wave(channel, self.t + np.arange(n) / self.data_rate)
+        self.t += n / self.data_rate
+        if self.realtime:
+            time.sleep(n / self.data_rate)
+        return out
+
+    def read_pairs(self, ch_a, ch_b, out):
+        # Conversions alternate a, b, a, b… one data-rate period apart
+        n = out.shape[1]
+        t = self.t + 2.0 * np.arange(n) / self.data_rate
+        out[0] = self._wave(ch_a, t)
+        out[1] = self._wave(ch_b, t + 1.0 / self.data_rate)
+        self.t += 2.0 * n / self.data_rate
+        if self.realtime:
+            time.sleep(2.0 * n / self.data_rate)
+        return self.data_rate / 2.0
+
+
 class SensorReader:
     """Reads ACS712T (current) and ZMPT101B (voltage) via ADS1115."""
 
     def __init__(self, acs_model='30A', acs_zero_v=2.5,
                  acs_divider=1.0, zmpt_cal=1.0,
                  zmpt_zero_v=2.5, zmpt_divider=1.0,
-                 adc_addr=0x48, ch_current=0, ch_voltage=1):
-        self.sensitivity = {'5A': 0.185, '20A': 0.100, '30A': 0.066}[acs_model]
+                 adc_addr=0x48, ch_current=0, ch_voltage=1,
+                 data_rate=860, mains_hz=50, continuous=True,
+                 active_cycles=10, idle_cycles=5,
+                 idle_interval_s=2.0, max_samples=1024, max_age_s=10.0,
+                 interleaved=False, backend=None):
+        self.sensitivity = ACS712_SENSITIVITY[acs_model]
         self.acs_zero    = acs_zero_v
         self.acs_div     = acs_divider
         self.zmpt_cal    = zmpt_cal
@@ -49,73 +210,283 @@ class SensorReader:
         self.ch_i        = ch_current
         self.ch_v        = ch_voltage
 
-        self.ads         = None
-        self.chan_i       = None
-        self.chan_v       = None
+        self.data_rate   = data_rate
+        self.mains_hz    = mains_hz
+        self.continuous  = continuous
+        self.interleaved = interleaved
+        self.backend     = backend
         self.available   = False
+        self.dc_offset   = [None, None]     # measured sensor offsets (V): current, voltage
+
+        # ── Whole-cycle windows ──
+        # Interleaved pairs arrive at roughly half the data rate; the
+        # estimate is refined from measured block timing.
+        self.active_cycles = active_cycles
+        self.idle_cycles   = idle_cycles
+        self._max_samples  = max_samples
+        self.sample_rate   = data_rate / 2.0 if interleaved else float(data_rate)
+        self._set_windows(self.sample_rate)
+
+        # ── Energy ──
+        self.energy_kwh     = 0.0     # since start
+        self.run_energy_kwh = 0.0     # current / last pump run
+        self._energy_ts     = None
+
+        # ── Background sampler ──
+        self.idle_interval_s = idle_interval_s
+        self.max_age_s       = max_age_s
+        self._scratch   = np.empty((2, max_samples))  # raw block voltages
+        self._pump_on   = False
+        self._snapshot  = None
+        self._lock      = threading.Lock()
+        self._wake      = threading.Event()    # replaced by the group's event
+        self._group     = None                 # SamplerGroup while sampling
 
     def initialize(self) -> bool:
-        if not _ADS_OK:
-            logger.warning("ADS1115 library not installed → sensor reading disabled. "
-                           "Install: pip3 install adafruit-circuitpython-ads1x15")
-            return False
+        if self.backend is None:
+            if not _ADS_OK:
+                logger.warning("ADS1115 library not installed → sensor reading disabled. "
+                               "Install: pip3 install adafruit-circuitpython-ads1x15")
+                return False
+            self.backend = Ads1115Backend(self.adc_addr, self.data_rate, self.continuous)
         try:
-            i2c = busio.I2C(board.SCL, board.SDA)
-            self.ads = ADS.ADS1115(i2c, address=self.adc_addr)
-            self.ads.gain = 2/3                     # ±6.144 V (allows 0-5 V)
-            ch = [ADS.P0, ADS.P1, ADS.P2, ADS.P3]
-            self.chan_i = AnalogIn(self.ads, ch[self.ch_i])
-            self.chan_v = AnalogIn(self.ads, ch[self.ch_v])
+            self.backend.open()
             self.available = True
-            logger.info(f"ADS1115 OK  current→A{self.ch_i}  voltage→A{self.ch_v}")
+            mode = ('interleaved' if self.interleaved
+                    else 'continuous' if self.continuous else 'single-shot')
+            logger.info(f"ADC OK ({type(self.backend).__name__})  "
+                        f"current→A{self.ch_i}  voltage→A{self.ch_v}  "
+                        f"{self.data_rate} SPS {mode}  "
+                        f"window={self.active_window}/{self.idle_window} samples")
             return True
         except Exception as e:
             logger.error(f"ADS1115 init failed: {e}")
             return False
 
+    def _set_windows(self, rate):
+        self.active_window = whole_cycle_window(rate, self.mains_hz, self.active_cycles, self._max_samples)
+        self.idle_window   = whole_cycle_window(rate, self.mains_hz, self.idle_cycles, self._max_samples)
+
+    # ── Block conversion ─────────────────────────────────────
+
+    def _acquire(self, channel, n):
+        """Read n samples of one channel; returns (AC component, DC offset) in sensor volts."""
+        block = self._scratch[0 if channel == self.ch_i else 1, :n]
+        self.backend.read_block(channel, block)
+        dc = float(block.mean())
+        return block - dc, dc
+
+    def _sample_current(self, n):
+        ac, dc = self._acquire(self.ch_i, n)
+        self.dc_offset[0] = dc / self.acs_div
+        return ac / (self.acs_div * self.sensitivity)
+
+    def _sample_voltage(self, n):
+        ac, dc = self._acquire(self.ch_v, n)
+        self.dc_offset[1] = dc / self.zmpt_div
+        return ac * (self.zmpt_cal / self.zmpt_div)
+
+    def _sample_paired(self, n):
+        """
+        Read n interleaved I/V pairs; returns (amps, volts, real power W).
+        Each voltage sample lags its current sample by half a pair period;
+        the window spans whole cycles, so it is treated as periodic and
+        power uses V·(I[k] + I[k+1])/2, corrected by cos(π·f/rate).
+        """
+        block = self._scratch[:, :n]
+        rate = self.backend.read_pairs(self.ch_i, self.ch_v, block)
+        dc = block.mean(axis=1)
+        self.dc_offset = [float(dc[0]) / self.acs_div, float(dc[1]) / self.zmpt_div]
+        amps  = (block[0] - dc[0]) / (self.acs_div * self.sensitivity)
+        volts = (block[1] - dc[1]) * (self.zmpt_cal / self.zmpt_div)
+
+        # Track the real pair rate so later windows stay on whole cycles
+        if abs(rate - self.sample_rate) > 0.02 * self.sample_rate:
+            self.sample_rate = rate
+            self._set_windows(rate)
+        delta = np.pi * self.mains_hz / rate
+        power = float(np.dot(volts, amps + np.roll(amps, -1)) / (2 * n * np.cos(delta)))
+        return amps, volts, power
+
+    def _measure(self, n):
+        """One acquisition window → snapshot dict."""
+        power = None
+        if self.interleaved:
+            amps, volts, power = self._sample_paired(n)
+        else:
+            amps  = self._sample_current(n)
+            volts = self._sample_voltage(n)
+
+        i_rms, v_rms = self._rms(amps), self._rms(volts)
+        apparent = v_rms * i_rms
+        pf = None
+        if power is not None and apparent > 0:
+            pf = max(-1.0, min(1.0, power / apparent))
+            self._add_energy(power)
+        return {
+            'current_amps':      round(i_rms, 2),
+            'voltage_ac':        round(v_rms, 1),
+            'real_power_w':      round(power, 1) if power is not None else None,
+            'apparent_power_va': round(apparent, 1),
+            'power_factor':      round(pf, 3) if pf is not None else None,
+            'energy_kwh':        round(self.energy_kwh, 4) if self.interleaved else None,
+            'run_energy_kwh':    round(self.run_energy_kwh, 4) if self.interleaved else None,
+            'samples':           n,
+        }
+
+    def _add_energy(self, power_w):
+        """Integrate real power since the previous window (held constant over the gap)."""
+        now = clock.monotonic()
+        with self._lock:
+            if self._energy_ts is not None and power_w > 0:
+                kwh = power_w * (now - self._energy_ts) / 3.6e6
+                self.energy_kwh += kwh
+                self.run_energy_kwh += kwh
+            self._energy_ts = now
+
+    @staticmethod
+    def _rms(x):
+        return float(np.sqrt(np.dot(x, x) / len(x)))
+
     # ── Current (ACS712T) ────────────────────────────────────
 
-    def read_current_rms(self, samples: int = 200) -> Optional[float]:
+    def read_current_rms(self, samples: Optional[int] = None) -> Optional[float]:
         """Return RMS current in amps, or None."""
         if not self.available:
             return None
         try:
-            sq_sum = 0.0
-            for _ in range(samples):
-                v_adc    = self.chan_i.voltage
-                v_sensor = v_adc / self.acs_div        # undo divider
-                i_inst   = (v_sensor - self.acs_zero) / self.sensitivity
-                sq_sum  += i_inst * i_inst
-                time.sleep(0.0001)                     # ~100 µs → covers 50 Hz
-            return round(math.sqrt(sq_sum / samples), 2)
+            return round(self._rms(self._sample_current(samples or self.active_window)), 2)
         except Exception as e:
             logger.error(f"Current read error: {e}")
             return None
 
     # ── Voltage (ZMPT101B) ───────────────────────────────────
 
-    def read_voltage_rms(self, samples: int = 200) -> Optional[float]:
+    def read_voltage_rms(self, samples: Optional[int] = None) -> Optional[float]:
         """Return RMS mains voltage, or None."""
         if not self.available:
             return None
         try:
-            sq_sum = 0.0
-            for _ in range(samples):
-                v_adc    = self.chan_v.voltage
-                v_sensor = v_adc / self.zmpt_div
-                v_inst   = (v_sensor - self.zmpt_zero) * self.zmpt_cal
-                sq_sum  += v_inst * v_inst
-                time.sleep(0.0001)
-            return round(math.sqrt(sq_sum / samples), 1)
+            return round(self._rms(self._sample_voltage(samples or self.active_window)), 1)
         except Exception as e:
             logger.error(f"Voltage read error: {e}")
             return None
 
+    # ── Background sampler ───────────────────────────────────
+
+    def start(self):
+        """Start a sampling thread for this reader alone (no-op in degraded mode)."""
+        if self.available and self._group is None:
+            SamplerGroup([self]).start()
+
+    def stop(self):
+        if self._group is not None:
+            self._group.stop()
+
+    def set_pump_running(self, on: bool):
+        """Pump state selects the sampling profile; switching ON wakes the sampler."""
+        on = bool(on)
+        if on != self._pump_on:
+            self._pump_on = on
+            if on:
+                # Drop the pre-start snapshot: it would read as a dry run
+                with self._lock:
+                    self.run_energy_kwh = 0.0
+                    self._snapshot = None
+                self._wake.set()
+
+    def _sample_window(self):
+        """Measure one window sized for the pump state and publish it."""
+        n = self.active_window if self._pump_on else self.idle_window
+        try:
+            snap = self._measure(n)
+            snap['ts'] = clock.monotonic()
+        except Exception as e:
+            logger.error(f"ADC sampler error: {e}")
+            snap = None
+        with self._lock:
+            self._snapshot = snap
+        return snap
+
     # ── Combined read ────────────────────────────────────────
 
+    _EMPTY = {
+        'current_amps': None, 'voltage_ac': None, 'real_power_w': None,
+        'apparent_power_va': None, 'power_factor': None,
+        'energy_kwh': None, 'run_energy_kwh': None,
+    }
+
     def read_all(self) -> dict:
-        return {
-            'current_amps': self.read_current_rms(),
-            'voltage_ac':   self.read_voltage_rms(),
-            'available':    self.available,
-        }
+        """
+        Return the latest current/voltage RMS and power figures. With the
+        sampler running this is a non-blocking snapshot (None values if it
+        is stale); otherwise one window is sampled synchronously.
+        Power factor and energy need interleaved mode.
+        """
+        snap = None
+        if self._group is None:
+            if self.available:
+                try:
+                    snap = self._measure(self.active_window)
+                except Exception as e:
+                    logger.error(f"Sensor read error: {e}")
+        else:
+            with self._lock:
+                snap = self._snapshot
+            if snap is not None and clock.monotonic() - snap['ts'] > self.max_age_s:
+                snap = None
+        out = {k: (snap or self._EMPTY)[k] for k in self._EMPTY}
+        out['available'] = self.available
+        return out
+
+
+class SamplerGroup:
+    """
+    One background sampling thread for several SensorReaders sharing an
+    ADC (one reader per pump). Readers whose pump runs are sampled back
+    to back; idle ones once per their idle interval.
+    """
+
+    def __init__(self, readers):
+        self.readers  = [r for r in readers if r.available]
+        self._wake    = threading.Event()
+        self._thread  = None
+        self._running = False
+
+    def start(self):
+        if not self.readers or self._thread is not None:
+            return
+        for r in self.readers:
+            r._group = self
+            r._wake  = self._wake
+        self._running = True
+        self._thread = threading.Thread(target=self._loop,
+                                        name='adc-sampler', daemon=True)
+        self._thread.start()
+        r = self.readers[0]
+        logger.info(f"ADC sampler started  readers={len(self.readers)}  "
+                    f"active={r.active_window}  idle={r.idle_window}/{r.idle_interval_s}s")
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        for r in self.readers:
+            r._group = None
+
+    def _loop(self):
+        due = [0.0] * len(self.readers)
+        while self._running:
+            active = False
+            for k, r in enumerate(self.readers):
+                if r._pump_on or clock.monotonic() >= due[k]:
+                    snap = r._sample_window()
+                    if r._pump_on and snap is not None:
+                        active = True
+                    else:
+                        due[k] = clock.monotonic() + r.idle_interval_s
+            if not active:
+                self._wake.wait(max(0.0, min(due) - clock.monotonic()))
+                self._wake.clear()
@@ -0,0 +1,436 @@
+"""
+Hardware Simulator
+===================
+Fake SX127x radio, GPIO and ADS1115 backends driven by a modelled
+tank, so the real PumpController — HybridPumpLogic, DataLogger, the
+event loop — runs on any Linux box. Time is virtual: asyncio sleeps
+and every timestamp advance instantly, so days of operation take
+seconds.
+
+    python3 pump_controller.py --simulate --sim-hours 72
+    python3 pump_controller.py --simulate --sim-script scenario.json
+
+Scenario scripts are JSON lists of timed events (``at`` = seconds
+from the start of the run):
+
+    [{"at": 3600,  "event": "press", "button": "ON"},
+     {"at": 5400,  "event": "press", "button": "OFF", "hold": 4},
+     {"at": 7200,  "event": "lora_outage",  "duration": 600},
+     {"at": 20000, "event": "sensor_fault", "duration": 120},
+     {"at": 30000, "event": "sump_dry",     "duration": 900},
+     {"at": 40000, "event": "set_level",    "pct": 5},
+     {"at": 50000, "event": "demand",       "scale": 2.0}]
+
+Per-tank events (press, sensor_fault, sump_dry, set_level, demand) take
+an optional "tank" name; the first tank in TANKS is the default.
+
+Outputs (CSV, state file, controller log) go to SIM_LOG_DIR
+($XDG_STATE_HOME/wilo/sim, by default ~/.local/state/wilo/sim).
+"""
+
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import logging
+
+import clock
+import lora_codec
+import tank_config as CFG
+from relay_control import FakeGPIO
+from sensor_reader import FakeAdcBackend, ACS712_SENSITIVITY
+from tanks import scratch_specs, tank_specs
+from tank_geometry import TankGeometry
+
+logger = logging.getLogger('wilo.sim')
+
+EVENTS = ('press', 'lora_outage', 'sensor_fault', 'sump_dry', 'set_level', 'demand')
+
+
+# ── Tank model ──────────────────────────────────────────────
+
+class TankModel:
+    """
+    Upper tank filled by the pump and drained by household demand
+    (SIM_DEMAND_LPM by hour, with a random factor redrawn every 5 min).
+    Integrated lazily up to the requested time.
+    """
+
+    STEP_S = 60.0
+
+    def __init__(self, start, level_pct=50.0, capacity_l=25000,
+                 flow_lpm=200.0, demand_lpm=CFG.SIM_DEMAND_LPM, seed=None):
+        self.start      = start
+        self.level_pct  = float(level_pct)
+        self.capacity_l = capacity_l
+        self.flow_lpm   = flow_lpm
+        self.demand_lpm = demand_lpm
+        self.demand_scale = 1.0
+        self.sump_dry   = False
+        self.t          = 0.0
+        self._rng       = random.Random(seed)
+        self._factor    = 1.0
+        self._factor_until = 0.0
+
+        # ── Statistics ──
+        self.min_level  = self.level_pct
+        self.max_level  = self.level_pct
+        self.overflow_s = 0.0
+        self.empty_s    = 0.0
+        self.pumped_l   = 0.0
+        self.drawn_l    = 0.0
+
+    def demand_at(self, t):
+        if t >= self._factor_until:
+            self._factor = self._rng.uniform(0.7, 1.3)
+            self._factor_until = t + 300.0
+        hour = int(((self.start.hour * 3600 + self.start.minute * 60 + t) // 3600) % 24)
+        return self.demand_lpm[hour] * self._factor * self.demand_scale
+
+    def advance_to(self, t, pump_on):
+        while self.t < t:
+            dt = min(self.STEP_S, t - self.t)
+            inflow = self.flow_lpm if (pump_on and not self.sump_dry) else 0.0
+            demand = self.demand_at(self.t)
+            drawn = min(demand * dt / 60.0, self.level_pct / 100.0 * self.capacity_l)
+            litres = self.level_pct / 100.0 * self.capacity_l + inflow * dt / 60.0 - drawn
+            self.pumped_l += inflow * dt / 60.0
+            self.drawn_l  += drawn
+            self.level_pct = litres / self.capacity_l * 100.0
+            if self.level_pct >= 100.0:
+                self.level_pct = 100.0
+                if inflow:
+                    self.overflow_s += dt
+            if self.level_pct <= 0.0:
+                self.level_pct = 0.0
+                self.empty_s += dt
+            self.min_level = min(self.min_level, self.level_pct)
+            self.max_level = max(self.max_level, self.level_pct)
+            self.t += dt
+
+
+# ── Fake hardware ───────────────────────────────────────────
+
+class FakeSX127x:
+    """
+    SX127x receive API fed with ESP32-format packets from the tank
+    models: every simulated sender transmits once per interval, the
+    senders staggered across it.
+    """
+
+    def __init__(self, sim, interval_s=1.0):
+        self.sim        = sim
+        self.interval_s = interval_s
+        n = len(sim.tanks)
+        self.next_t     = [k * interval_s / n for k in range(n)]
+        self.pkt        = [0] * n
+        self.node_ids   = {dev: node for node, dev in CFG.LORA_NODE_IDS.items()}
+        self.outage_until = -1.0
+        self._rssi      = -60
+        self._snr       = 9.0
+
+    @property
+    def packets(self):
+        return sum(self.pkt)
+
+    def receive(self):
+        pass
+
+    def standby(self):
+        pass
+
+    def sleep(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _due(self):
+        k = min(range(len(self.next_t)), key=self.next_t.__getitem__)
+        return k, self.next_t[k]
+
+    def available(self):
+        now = self.sim.clock.monotonic()
+        while True:
+            k, t = self._due()
+            if t > now:
+                return False
+            if t >= self.outage_until:
+                return True
+            self.next_t[k] += self.interval_s       # sent, never heard
+            self.pkt[k] += 1
+
+    def read_payload(self):
+        self.sim.sync()
+        k, t = self._due()
+        st = self.sim.tanks[k]
+        self.next_t[k] += self.interval_s
+        if t < st.fault_until:
+            status, volts, kpa = 'fault', 0.05, -1.0
+        else:
+            kpa = st.geometry.pressure_at(st.model.level_pct)
+            kpa += self.sim.rng.gauss(0.0, 0.02)
+            status, volts = 'ok', 0.5 + 4.0 * kpa / 100.0
+        pkt = self.pkt[k]
+        self.pkt[k] += 1
+        self._rssi = int(-60 + self.sim.rng.gauss(0.0, 3.0))
+        self._snr  = round(9.0 + self.sim.rng.gauss(0.0, 1.0), 1)
+        # Nodes listed in LORA_NODE_IDS send binary frames, others legacy JSON
+        node = self.node_ids.get(st.spec['device'])
+        if node is not None:
+            return lora_codec.encode(node, pkt, status, volts, kpa)
+        payload = {'device': st.spec['device'], 'sensor': 'PR12P210', 'status': status,
+                   'voltage': round(volts, 3), 'pressure_kpa': round(kpa, 2), 'pkt': pkt}
+        return json.dumps(payload, separators=(',', ':')).encode()
+
+    def get_packet_rssi(self):
+        return self._rssi
+
+    def get_packet_snr(self):
+        return self._snr
+
+
+class _SimGPIO(FakeGPIO):
+    """FakeGPIO that brings the tank models up to date before a pump relay flips."""
+
+    def __init__(self, sim):
+        super().__init__()
+        self.sim = sim
+
+    def output(self, pin, level):
+        st = self.sim.by_relay.get(pin)
+        if st is not None and level != self.levels.get(pin):
+            self.sim.sync()
+            super().output(pin, level)
+            st.relay_changed(self.sim.clock.monotonic())
+            return
+        super().output(pin, level)
+
+
+class _SimAdc(FakeAdcBackend):
+    """ADS1115 backend whose current/voltage waveforms follow the pump states."""
+
+    def __init__(self, sim, data_rate):
+        super().__init__(data_rate=data_rate, realtime=False, seed=sim.seed)
+        self.sim = sim
+
+    def _update(self):
+        self.sim.sync()
+        sens = ACS712_SENSITIVITY[CFG.ACS712_MODEL]
+        div_i, div_v = CFG.ACS712_DIVIDER_RATIO, CFG.ZMPT101B_DIVIDER_RATIO
+        f = CFG.MAINS_FREQUENCY_HZ
+        for st in self.sim.tanks:
+            amps = 0.0
+            if st.pump_on():
+                amps = CFG.SIM_PUMP_DRY_CURRENT_A if st.model.sump_dry else CFG.SIM_PUMP_CURRENT_A
+            self.set_signal(st.spec['ch_current'], offset_v=CFG.ACS712_ZERO_V * div_i,
+                            amplitude_v=amps * math.sqrt(2) * div_i * sens, freq_hz=f,
+                            phase_rad=-math.acos(CFG.SIM_PUMP_PF), noise_v=0.004)
+            self.set_signal(st.spec['ch_voltage'], offset_v=CFG.ZMPT101B_ZERO_V * div_v,
+                            amplitude_v=CFG.SIM_MAINS_V * math.sqrt(2) * div_v / CFG.ZMPT101B_CAL_FACTOR,
+                            freq_hz=f, noise_v=0.004)
+
+    def read_block(self, channel, out):
+        self._update()
+        return super().read_block(channel, out)
+
+    def read_pairs(self, ch_a, ch_b, out):
+        self._update()
+        return super().read_pairs(ch_a, ch_b, out)
+
+
+# ── Simulation ──────────────────────────────────────────────
+
+class _SimTank:
+    """Model and pump statistics for one configured tank."""
+
+    def __init__(self, sim, spec, model):
+        self.sim   = sim
+        self.spec  = spec
+        self.model = model
+        self.geometry = TankGeometry.from_spec(spec)
+        self.fault_until = -1.0
+        self.pump_starts = 0
+        self.pump_on_s   = 0.0
+        self._on_since   = None
+
+    def pump_on(self):
+        gpio = self.sim.gpio
+        level = gpio.input(self.spec['relay_pin'])
+        return level == (gpio.LOW if CFG.RELAY_ACTIVE_LOW else gpio.HIGH)
+
+    def relay_changed(self, now):
+        if self.pump_on():
+            self.pump_starts += 1
+            self._on_since = now
+        elif self._on_since is not None:
+            self.pump_on_s += now - self._on_since
+            self._on_since = None
+
+    def on_hours(self, now):
+        run = now - self._on_since if self._on_since is not None else 0.0
+        return (self.pump_on_s + run) / 3600.0
+
+
+class Simulation:
+    """Owns the virtual clock, tank models, fake backends and scenario."""
+
+    def __init__(self, hours=CFG.SIM_HOURS, script=None, seed=None,
+                 level_pct=CFG.SIM_START_LEVEL_PCT):
+        self.hours  = hours
+        self.seed   = seed
+        self.rng    = random.Random(seed)
+        self.clock  = clock.VirtualClock()
+        self.gpio   = _SimGPIO(self)
+        self.tanks  = []
+        for k, spec in enumerate(tank_specs()):
+            # Demand scales with tank size so small tanks see a similar duty
+            capacity_l = TankGeometry.from_spec(spec).capacity_l
+            scale = capacity_l / CFG.UPPER_TANK_CAPACITY_L
+            model = TankModel(self.clock.start, level_pct=level_pct,
+                              capacity_l=capacity_l,
+                              flow_lpm=CFG.SIM_PUMP_FLOW_LPM * scale,
+                              demand_lpm=[d * scale for d in CFG.SIM_DEMAND_LPM],
+                              seed=None if seed is None else seed + k)
+            self.tanks.append(_SimTank(self, spec, model))
+        self.by_name  = {st.spec['name']: st for st in self.tanks}
+        self.by_relay = {st.spec['relay_pin']: st for st in self.tanks}
+        self.events = load_script(script) if script else []
+        self.radio  = FakeSX127x(self, CFG.SIM_LORA_INTERVAL_S)
+        self.adc    = _SimAdc(self, CFG.ADS1115_DATA_RATE)
+        self._wall_t0 = None
+        self.specs  = None          # controller's tank specs, set by install()
+
+    @property
+    def model(self):
+        """The first tank's model (single-tank shorthand)."""
+        return self.tanks[0].model
+
+    def install(self):
+        """
+        Point the controller config at sim outputs (fresh state, no ML,
+        no systemd) and install the virtual clock. Call before setting
+        up logging and constructing the PumpController with ``specs``,
+        whose state files are all under SIM_LOG_DIR.
+        """
+        CFG.LOG_DIR             = CFG.SIM_LOG_DIR
+        CFG.CSV_LOG_PATH        = os.path.join(CFG.SIM_LOG_DIR, 'sim_pump_log.csv')
+        CFG.STATE_FILE          = os.path.join(CFG.SIM_LOG_DIR, 'pump_state.json')
+        CFG.DECISION_TRACE_PATH = os.path.join(CFG.SIM_LOG_DIR, 'decision_trace.jsonl')
+        CFG.LORA_POLL_INTERVAL_S   = CFG.SIM_POLL_INTERVAL_S
+        CFG.BUTTON_POLL_INTERVAL_S = CFG.SIM_POLL_INTERVAL_S
+        CFG.LATENCY_REPORT_INTERVAL_S = 6 * 3600
+        CFG.ML_ENABLED       = False
+        CFG.SYSTEMD_WATCHDOG = False
+        self.specs = scratch_specs(CFG.SIM_LOG_DIR)
+        clock.install(self.clock)
+
+    def new_event_loop(self):
+        return clock.VirtualTimeLoop(self.clock)
+
+    # ── Model plumbing ──
+
+    def sync(self):
+        """Advance every tank model to the current virtual time."""
+        now = self.clock.monotonic()
+        for st in self.tanks:
+            st.model.advance_to(now, st.pump_on())
+
+    # ── Scenario ──
+
+    def _apply(self, ev):
+        kind, now = ev['event'], self.clock.monotonic()
+        self.sync()
+        args = {k: v for k, v in ev.items() if k not in ('at', 'event')}
+        logger.info(f"[t={now:.0f}s] scenario: {kind} {args}")
+        st = self.by_name[ev['tank']] if 'tank' in ev else self.tanks[0]
+        if kind == 'lora_outage':
+            self.radio.outage_until = now + ev.get('duration', 600)
+        elif kind == 'sensor_fault':
+            st.fault_until = now + ev.get('duration', 60)
+        elif kind == 'sump_dry':
+            st.model.sump_dry = True
+            asyncio.get_running_loop().call_later(
+                ev.get('duration', 600), self._end_sump_dry, st)
+        elif kind == 'set_level':
+            st.model.level_pct = float(ev['pct'])
+        elif kind == 'demand':
+            st.model.demand_scale = float(ev['scale'])
+        elif kind == 'press':
+            pin = st.spec['btn_on'] if ev['button'].upper() == 'ON' else st.spec['btn_off']
+            if pin is None:
+                logger.warning(f"Tank {st.spec['name']} has no {ev['button']} button")
+                return
+            self.gpio.press(pin)
+            asyncio.get_running_loop().call_later(
+                ev.get('hold', 0.5), self.gpio.release, pin)
+
+    def _end_sump_dry(self, st):
+        self.sync()
+        st.model.sump_dry = False
+
+    async def run(self, ctrl):
+        """Scenario task: play scripted events, then stop the controller."""
+        self._wall_t0 = time.perf_counter()
+        end = self.hours * 3600.0
+        for ev in self.events:
+            if ev['at'] >= end:
+                break
+            await asyncio.sleep(ev['at'] - self.clock.monotonic())
+            self._apply(ev)
+        await asyncio.sleep(end - self.clock.monotonic())
+        ctrl.stop()
+
+    # ── Report ──
+
+    def report(self, ctrl=None):
+        self.sync()
+        now = self.clock.monotonic()
+        wall = time.perf_counter() - self._wall_t0 if self._wall_t0 else 0.0
+        summary = {
+            'simulated_h': round(now / 3600.0, 2),
+            'wall_s':      round(wall, 2),
+            'speedup':     round(now / wall) if wall else None,
+            'packets':     self.radio.packets,
+            'tanks':       {},
+        }
+        energy, pdr = {}, {}
+        if ctrl is not None:
+            energy = {t.name: t.sensor.energy_kwh for t in ctrl.tanks if t.sensor}
+            pdr = {t.name: t.link.pdr for t in ctrl.tanks if t.link and t.link.pdr is not None}
+        for st in self.tanks:
+            m, name = st.model, st.spec['name']
+            tank = {
+                'pump_starts': st.pump_starts,
+                'pump_on_h':   round(st.on_hours(now), 2),
+                'level_min':   round(m.min_level, 1),
+                'level_max':   round(m.max_level, 1),
+                'level_end':   round(m.level_pct, 1),
+                'overflow_s':  round(m.overflow_s),
+                'empty_s':     round(m.empty_s),
+                'pumped_l':    round(m.pumped_l),
+                'drawn_l':     round(m.drawn_l),
+            }
+            if name in energy:
+                tank['energy_kwh'] = round(energy[name], 3)
+            if name in pdr:
+                tank['lora_pdr'] = round(pdr[name], 3)
+            summary['tanks'][name] = tank
+        logger.info("Simulation summary: " + "  ".join(
+            f"{k}={v}" for k, v in summary.items() if k != 'tanks'))
+        for name, tank in summary['tanks'].items():
+            logger.info(f"  {name}: " + "  ".join(f"{k}={v}" for k, v in tank.items()))
+        return summary
+
+
+def load_script(path):
+    """Read a scenario file; events are returned sorted by time."""
+    with open(path) as f:
+        events = json.load(f)
+    for ev in events:
+        if ev.get('event') not in EVENTS or 'at' not in ev:
+            raise ValueError(f"Bad scenario event: {ev}")
+        ev['at'] = float(ev['at'])
+    return sorted(events, key=lambda ev: ev['at'])
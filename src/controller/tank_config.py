@@ -19,6 +19,12 @@ LORA_RESET_PIN    = 25       # GPIO 25 (Physical Pin 22)
 LORA_DIO0_PIN     = 24       # GPIO 24 (Physical Pin 18)
 LORA_FREQUENCY    = 433E6    # Must match ESP32
 LORA_SYNC_WORD    = 0xF3     # Must match ESP32
+LORA_CRC          = True     # Payload CRC (LORA_CRC in the ESP32 firmware);
+                             # frames failing it are dropped by the driver
+
+# Binary payloads carry a numeric node id (NODE_ID in the ESP32 firmware)
+# instead of the device name; map it to the 'device' used in TANKS
+LORA_NODE_IDS     = {1: 'esp32'}
 
 # ── Relay Module (Active-LOW) ──
 RELAY_PUMP_PIN    = 17       # GPIO 17 (Physical Pin 11)
@@ -46,6 +52,15 @@ UPPER_TANK_CAPACITY_L  = 25000
 UPPER_TANK_HEIGHT_CM   = 200     # PLACEHOLDER — measure and update!
 UPPER_TANK_DIAMETER_CM = 180     # PLACEHOLDER — measure and update!
 
+# Calibration profile for non-cylindrical tanks: (water height cm, litres)
+# points from the floor up, last point = full. None = vertical cylinder of
+# UPPER_TANK_HEIGHT_CM / UPPER_TANK_CAPACITY_L. With a profile, level % is
+# % of the profile's full volume. Example (tapered loft tank):
+#   UPPER_TANK_PROFILE = [(0, 0), (20, 1600), (100, 11000), (200, 25000)]
+UPPER_TANK_PROFILE     = None
+UPPER_SENSOR_OFFSET_CM = 0.0     # Pressure port height above the tank floor
+LEVEL_LUT_STEP_CM      = 0.1     # Resolution of the precomputed lookup
+
 # Main / Lower Tank (ground, near pump)
 MAIN_TANK_CAPACITY_L   = 25000
 MAIN_TANK_HEIGHT_CM    = 200     # PLACEHOLDER — measure and update!
@@ -66,6 +81,35 @@ UPPER_CRITICAL_HIGH = 95   # Emergency OFF — overflow risk
 # Hysteresis band: pump turns ON at LOW, turns OFF at HIGH
 # Prevents rapid cycling
 
+# Level filter between each LoRa reading and the decision engine, so a
+# single noisy packet near a threshold cannot flip the pump:
+#   'median' | 'ema' | 'kalman' | None (raw readings)
+LEVEL_FILTER            = 'median'
+LEVEL_FILTER_MEDIAN_N   = 5        # Readings (lag (N-1)/2 packets)
+LEVEL_FILTER_EMA_ALPHA  = 0.3      # Lag (1-α)/α packets
+LEVEL_FILTER_KALMAN_Q   = 1e-4     # Process noise, %²/s (unmodelled draw)
+LEVEL_FILTER_KALMAN_R   = 0.04     # Measurement noise, %² (≈0.2 % std dev)
+LEVEL_FILTER_RESET_S    = 30       # Gap that restarts the filter
+
+# ============================================================
+# TANK / PUMP PAIRS
+# ============================================================
+# One entry per upper tank + pump served by this controller. All pairs
+# share the radio, the ADC sampler and the CSV log; LoRa packets are
+# routed by their "device" field (DEVICE_ID in the ESP32 firmware).
+# Keys left out fall back to the single-tank settings in this file:
+#   relay_pin, valve_pin, led_pin, btn_on, btn_off   (None = not fitted)
+#   ch_current, ch_voltage                           (ADS1115 channels)
+#   height_cm, capacity_l, profile, sensor_offset_cm, level_filter
+#   critical_low, low, high, critical_high           (% of upper tank)
+#   max_run_min, dry_run_a, state_file
+TANKS = [
+    {'name': 'main', 'device': 'esp32'},
+    # {'name': 'block-b', 'device': 'esp32-b', 'relay_pin': 23,
+    #  'valve_pin': None, 'led_pin': None, 'btn_on': None, 'btn_off': None,
+    #  'ch_current': 2, 'height_cm': 150, 'capacity_l': 10000},
+]
+
 # ============================================================
 # ACS712T CURRENT SENSOR
 # ============================================================
@@ -82,6 +126,18 @@ ZMPT101B_CAL_FACTOR    = 1.0    # PLACEHOLDER — calibrate with multimeter
 ZMPT101B_ZERO_V        = 2.5   # Midpoint of 0–5 V supply
 ZMPT101B_DIVIDER_RATIO = 1.0
 
+# ── ADC acquisition ──
+ADS1115_DATA_RATE      = 860   # SPS (8…860) in continuous-conversion mode
+ADC_CONTINUOUS         = True  # False = legacy single-shot reads
+ADC_INTERLEAVED        = True  # Paired I/V samples → real power, PF, energy
+MAINS_FREQUENCY_HZ     = 50    # RMS windows span whole mains cycles
+
+# ── Background ADC sampler ──
+SENSOR_ACTIVE_CYCLES   = 10    # Mains cycles per RMS window while the pump runs
+SENSOR_IDLE_CYCLES     = 5     # Mains cycles per RMS window while the pump is off
+SENSOR_IDLE_INTERVAL_S = 2.0   # Pause between windows while the pump is off
+SENSOR_MAX_WINDOW      = 1024  # Block buffer length; caps the window (samples per channel)
+
 # ============================================================
 # PUMP SPECIFICATIONS (Wilo)
 # ============================================================
@@ -105,7 +161,8 @@ POWER_RESTORE_DELAY_S    = 30     # Wait after power-cut before pump
 # ============================================================
 
 OVERRIDE_TIMEOUT_MIN     = 60     # Auto-release override after this
-OVERRIDE_DEBOUNCE_MS     = 200    # Button debounce
+OVERRIDE_DEBOUNCE_MS     = 200    # Button must read pressed this long
+OVERRIDE_LONG_PRESS_MS   = 3000   # Hold either button → release override (AUTO)
 
 # ============================================================
 # ML PREDICTION
@@ -121,6 +178,9 @@ ML_ACTIVATION_WINDOW_MIN = 5      # Tolerance around predicted start
 
 _BASE = os.path.dirname(os.path.abspath(__file__))
 _PROJECT = os.path.join(_BASE, '..', '..')
+# Scratch output of simulation and capture replay, kept out of the checkout
+_STATE_HOME = (os.environ.get('XDG_STATE_HOME')
+               or os.path.join(os.path.expanduser('~'), '.local', 'state'))
 
 LOG_DIR        = os.path.join(_PROJECT, 'logs', 'pump')
 LORA_LOG_DIR   = os.path.join(_PROJECT, 'logs', 'lora')
@@ -129,5 +189,68 @@ CSV_LOG_PATH   = os.path.join(LOG_DIR, 'rpi_pump_log.csv')
 LORA_PACKET_CSV_PATH = os.path.join(LORA_LOG_DIR, 'esp32_pressure_packets.csv')
 STATE_FILE     = os.path.join(LOG_DIR, 'pump_state.json')
 
-LOOP_INTERVAL_S  = 1    # Main loop cycle
+LOOP_INTERVAL_S  = 1    # Decision tick + CSV row interval
 LOG_INTERVAL_S   = 5    # CSV write interval
+
+# Event loop task intervals
+LORA_DIO0_IRQ          = True   # Packets from the DIO0 RxDone edge (else poll)
+LORA_FALLBACK_POLL_S   = 1.0    # IRQ mode: RxDone check in case an edge is missed
+LORA_POLL_INTERVAL_S   = 0.02   # RxDone poll when DIO0 edges are unavailable
+LORA_RX_QUEUE_SIZE     = 256    # Packets buffered between radio drain and parser
+LORA_STATS_INTERVAL_S  = 300    # CSV receiver queue/latency report
+LORA_CSV_FLUSH_ROWS    = 64     # Packet CSV group commit: rows per write…
+LORA_CSV_FLUSH_S       = 5.0    # …or oldest buffered row age
+LORA_CSV_DURABILITY    = 'os'   # 'row' (flush each row) | 'os' | 'fsync' (each commit)
+LORA_CSV_RAW_PAYLOAD   = 'errors'   # raw_payload column: 'always' | 'errors' | 'never'
+LORA_CAPTURE_PATH      = None   # Raw frame capture file (lora_capture.py); --capture
+LORA_CAPTURE_FLUSH_S   = 1.0    # Capture file flush interval
+LORA_REPLAY_DIR        = os.path.join(_STATE_HOME, 'wilo', 'replay')   # Capture replay outputs
+LORA_LINK_WINDOW       = 64     # Sequence numbers in the rolling delivery ratio
+LORA_LINK_ALPHA        = 0.05   # EW weight for inter-arrival / RSSI / SNR stats
+LORA_SEQ_REORDER_S     = 5      # Older packets than this are a sender restart
+LORA_PDR_WARN          = 0.8    # Warn when the rolling delivery ratio drops below
+SENSOR_INTERVAL_S      = 1      # Current/voltage sampling
+BUTTON_POLL_INTERVAL_S = 0.05   # Override button poll
+
+# Radio mux (radio_mux.py): one daemon owns the SX127x; the controller
+# and CSV receiver subscribe instead of opening it (--radio-mux)
+LORA_USE_MUX           = False
+LORA_MUX_SOCKET        = '/run/wilo/lora-mux.sock'
+LORA_MUX_CLIENT_QUEUE  = 256    # Frames held per slow subscriber (oldest dropped)
+LORA_MUX_RECONNECT_S   = 2.0    # Subscriber retry while the daemon is down
+
+# Several gateways in range of one sender (gateway_merge.py): with
+# --radio-mux, subscribe to each mux socket and merge duplicate frames.
+# e.g. {'shed': '/run/wilo/lora-mux.sock', 'roof': '/run/wilo/roof-mux.sock'}
+LORA_GATEWAYS          = {}
+LORA_DEDUP_WINDOW_S    = 2.0    # Copies of a (device, pkt) within this are one frame
+LORA_MERGE_HOLD_S      = 0.3    # Live: wait this long for other gateways' copies
+
+# Loop latency watchdog
+CYCLE_BUDGET_MS           = 100    # Input → relay reaction budget (overrun warning)
+LATENCY_REPORT_INTERVAL_S = 600    # Log stage/cycle latency histograms
+SYSTEMD_WATCHDOG          = True   # sd_notify READY/WATCHDOG (wilo-pump.service is Type=notify)
+
+# Decision trace (opt-in; also enabled with --trace). SIGUSR1 dumps it.
+DECISION_TRACE_ENABLED = False
+DECISION_TRACE_SIZE    = 2048   # Decisions kept in the ring buffer
+DECISION_TRACE_PATH    = os.path.join(LOG_DIR, 'decision_trace.jsonl')
+
+# ============================================================
+# SIMULATION (pump_controller.py --simulate)
+# ============================================================
+
+SIM_HOURS              = 24       # Simulated run length
+SIM_START_LEVEL_PCT    = 50       # Upper tank level at t=0
+SIM_PUMP_FLOW_LPM      = 200      # Pump delivery into the upper tank
+SIM_PUMP_CURRENT_A     = 6.5      # Running current (normal load)
+SIM_PUMP_DRY_CURRENT_A = 0.8      # Running current with the sump dry
+SIM_PUMP_PF            = 0.85
+SIM_MAINS_V            = 230.0
+SIM_LORA_INTERVAL_S    = 1.0      # ESP32 send period (delay(1000) in firmware)
+SIM_POLL_INTERVAL_S    = 0.5      # LoRa/button poll while simulating
+SIM_LOG_DIR            = os.path.join(_STATE_HOME, 'wilo', 'sim')
+
+# Household draw from the upper tank, L/min by hour of day (00–23)
+SIM_DEMAND_LPM = (3, 2, 2, 2, 3, 8, 40, 60, 50, 25, 15, 12,
+                  15, 12, 10, 10, 15, 30, 45, 50, 35, 20, 10, 5)
@@ -0,0 +1,179 @@
+"""
+Tank Geometry / Calibration
+============================
+Pressure → level % and litres for real tank shapes.
+
+A profile is a piecewise-linear table of (water height cm, litres)
+points measured from the tank floor, e.g. filled bucket-by-bucket or
+taken from the manufacturer's drawing. Without one the tank is the old
+vertical cylinder (height_cm, capacity_l). Level % is the fraction of
+the profile's full volume, so for a cylinder it equals % of height.
+
+The table is resampled once onto a uniform grid in kPa, so the per-packet
+conversion is one multiply, one index and one interpolation regardless
+of how many calibration points there are. ``convert_many`` runs the same
+arithmetic over numpy arrays for reprocessing logs:
+
+    python tank_geometry.py logs/rpi_pump_log.csv -o reprocessed.csv
+"""
+
+import csv
+import sys
+import argparse
+
+import numpy as np
+
+import tank_config as CFG
+
+
+def head_cm_per_kpa():
+    """Water column height (cm) that produces 1 kPa at the tank floor."""
+    return 1000.0 / (CFG.WATER_DENSITY * CFG.GRAVITY) * 100.0
+
+
+class TankGeometry:
+    """Precomputed pressure → (level %, litres) lookup for one tank."""
+
+    def __init__(self, profile=None, height_cm=None, capacity_l=None,
+                 sensor_offset_cm=0.0, step_cm=None):
+        height_cm  = height_cm or CFG.UPPER_TANK_HEIGHT_CM
+        capacity_l = capacity_l or CFG.UPPER_TANK_CAPACITY_L
+        if profile:
+            pts = sorted((float(h), float(v)) for h, v in profile)
+            if pts[0][0] > 0:
+                pts.insert(0, (0.0, 0.0))
+        else:
+            pts = [(0.0, 0.0), (float(height_cm), float(capacity_l))]
+        heights = np.array([p[0] for p in pts])
+        volumes = np.array([p[1] for p in pts])
+        if np.any(np.diff(heights) <= 0) or np.any(np.diff(volumes) < 0):
+            raise ValueError(f"Tank profile must rise in height and not fall in volume: {pts}")
+
+        self.height_cm  = heights[-1]
+        self.capacity_l = volumes[-1]
+        self.offset_cm  = float(sensor_offset_cm)   # sensor port above the floor
+
+        # Uniform grid in kPa over the whole profile; one extra point so
+        # a reading at exactly full height still has a right neighbour.
+        step_cm  = step_cm or CFG.LEVEL_LUT_STEP_CM
+        n        = int(np.ceil(self.height_cm / step_cm)) + 1
+        grid_cm  = np.linspace(0.0, self.height_cm, n)
+        self._kpa_step = (self.height_cm / (n - 1)) / head_cm_per_kpa()
+        self._inv_step = 1.0 / self._kpa_step
+        self._last     = n - 1
+        litres         = np.interp(grid_cm, heights, volumes)
+        self._litres   = litres                         # numpy, for batches
+        self._pct      = litres / self.capacity_l * 100.0
+        self._litres_l = litres.tolist()                # lists, for scalars
+        self._pct_l    = self._pct.tolist()
+        self._offset_kpa = self.offset_cm / head_cm_per_kpa()
+
+    @classmethod
+    def from_spec(cls, spec):
+        """Build from a tanks.tank_specs() entry."""
+        return cls(profile=spec.get('profile'),
+                   height_cm=spec.get('height_cm'),
+                   capacity_l=spec.get('capacity_l'),
+                   sensor_offset_cm=spec.get('sensor_offset_cm', 0.0))
+
+    def convert(self, pressure_kpa):
+        """(level %, litres) for one reading; (None, None) for a fault."""
+        if pressure_kpa is None or pressure_kpa < 0:
+            return None, None
+        x = (pressure_kpa + self._offset_kpa) * self._inv_step
+        i = int(x)
+        if i >= self._last:
+            return self._pct_l[-1], self._litres_l[-1]
+        f = x - i
+        pct, lit = self._pct_l, self._litres_l
+        return (pct[i] + (pct[i + 1] - pct[i]) * f,
+                lit[i] + (lit[i + 1] - lit[i]) * f)
+
+    def level_pct(self, pressure_kpa):
+        return self.convert(pressure_kpa)[0]
+
+    def litres_at(self, level_pct):
+        """Volume for a level % (e.g. a filtered one); None passes through."""
+        if level_pct is None:
+            return None
+        return level_pct / 100.0 * self.capacity_l
+
+    def convert_many(self, pressure_kpa):
+        """
+        Vectorised convert(): arrays of level % and litres, NaN where the
+        reading is missing or negative (sensor fault).
+        """
+        p = np.asarray(pressure_kpa, dtype=float)
+        bad = ~(p >= 0)                                 # also catches NaN
+        x = np.clip((np.where(bad, 0.0, p) + self._offset_kpa) * self._inv_step,
+                    0.0, self._last)
+        i = np.minimum(x.astype(np.intp), self._last - 1)
+        f = x - i
+        pct = self._pct[i] + (self._pct[i + 1] - self._pct[i]) * f
+        lit = self._litres[i] + (self._litres[i + 1] - self._litres[i]) * f
+        pct[bad] = np.nan
+        lit[bad] = np.nan
+        return pct, lit
+
+    def pressure_at(self, level_pct):
+        """Inverse lookup: sensor pressure (kPa) for a level % (simulator)."""
+        kpa = float(np.interp(level_pct, self._pct, np.arange(self._last + 1) * self._kpa_step))
+        return max(0.0, kpa - self._offset_kpa)
+
+
+# ── Log reprocessing ────────────────────────────────────────
+
+def reprocess_csv(src, dst, geometries):
+    """
+    Recompute upper_tank_pct / upper_tank_l in a controller CSV log from
+    its pressure_kpa column. ``geometries`` maps tank name → TankGeometry
+    ('' is used for rows without a tank column).
+    """
+    with open(src, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    col = {name: k for k, name in enumerate(header)}
+    if 'upper_tank_l' not in col:
+        header.insert(col['upper_tank_pct'] + 1, 'upper_tank_l')
+        for r in rows:
+            r.insert(col['upper_tank_pct'] + 1, '')
+        col = {name: k for k, name in enumerate(header)}
+    k_p, k_pct, k_l = col['pressure_kpa'], col['upper_tank_pct'], col['upper_tank_l']
+    k_tank = col.get('tank')
+
+    by_tank = {}
+    for n, r in enumerate(rows):
+        by_tank.setdefault(r[k_tank] if k_tank is not None else '', []).append(n)
+    for name, idx in by_tank.items():
+        geo = geometries.get(name) or geometries['']
+        kpa = np.array([float(rows[n][k_p]) if rows[n][k_p] else np.nan for n in idx])
+        pct, lit = geo.convert_many(kpa)
+        for n, a, b in zip(idx, pct, lit):
+            rows[n][k_pct] = '' if np.isnan(a) else f"{a:.1f}"
+            rows[n][k_l]   = '' if np.isnan(b) else f"{b:.0f}"
+
+    with open(dst, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows(rows)
+    return len(rows)
+
+
+def main(argv=None):
+    from tanks import tank_specs
+    ap = argparse.ArgumentParser(description='Recompute tank levels in a pump log '
+                                             'with the configured tank geometry')
+    ap.add_argument('csv', help='controller CSV log')
+    ap.add_argument('-o', '--output', help='output CSV (default: overwrite input)')
+    args = ap.parse_args(argv)
+
+    specs = tank_specs()
+    geometries = {s['name']: TankGeometry.from_spec(s) for s in specs}
+    geometries[''] = geometries[specs[0]['name']]
+    n = reprocess_csv(args.csv, args.output or args.csv, geometries)
+    print(f"{n} rows → {args.output or args.csv}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
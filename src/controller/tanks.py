@@ -0,0 +1,113 @@
+"""
+Tank / Pump Pairs
+==================
+Resolves TANKS from tank_config.py into full per-tank settings and holds
+each pair's runtime objects. One controller process serves every pair:
+the radio, ADC sampler, CSV log and event loop are shared, and only the
+relay, current reader and decision logic exist per tank.
+"""
+
+import os
+
+import tank_config as CFG
+from tank_geometry import TankGeometry
+from level_filter import make_filter
+
+_PIN_KEYS = ('relay_pin', 'valve_pin', 'led_pin', 'btn_on', 'btn_off')
+
+
+def tank_specs():
+    """TANKS with the single-tank settings filled in for missing keys."""
+    defaults = {
+        'relay_pin':     CFG.RELAY_PUMP_PIN,
+        'valve_pin':     CFG.RELAY_VALVE_PIN,
+        'led_pin':       CFG.LED_STATUS_PIN,
+        'btn_on':        CFG.BUTTON_FORCE_ON,
+        'btn_off':       CFG.BUTTON_FORCE_OFF,
+        'ch_current':    CFG.ADC_CH_CURRENT,
+        'ch_voltage':    CFG.ADC_CH_VOLTAGE,
+        'height_cm':     CFG.UPPER_TANK_HEIGHT_CM,
+        'capacity_l':    CFG.UPPER_TANK_CAPACITY_L,
+        'profile':       CFG.UPPER_TANK_PROFILE,
+        'sensor_offset_cm': CFG.UPPER_SENSOR_OFFSET_CM,
+        'level_filter':  CFG.LEVEL_FILTER,
+        'critical_low':  CFG.UPPER_CRITICAL_LOW,
+        'low':           CFG.UPPER_LOW,
+        'high':          CFG.UPPER_HIGH,
+        'critical_high': CFG.UPPER_CRITICAL_HIGH,
+        'max_run_min':   CFG.MAX_CONTINUOUS_RUN_MIN,
+        'dry_run_a':     CFG.PUMP_DRY_RUN_CURRENT_A,
+    }
+    specs = [dict(defaults, **t) for t in CFG.TANKS]
+    if not specs:
+        raise ValueError("TANKS is empty")
+
+    # A lone tank keeps the original state file name
+    base, ext = os.path.splitext(CFG.STATE_FILE)
+    for s in specs:
+        if 'state_file' not in s:
+            s['state_file'] = (CFG.STATE_FILE if len(specs) == 1
+                               else f"{base}_{s['name']}{ext}")
+
+    for key in ('name', 'device', 'ch_current'):
+        values = [s[key] for s in specs]
+        if len(set(values)) != len(values):
+            raise ValueError(f"TANKS: duplicate {key} in {values}")
+    pins = [s[k] for s in specs for k in _PIN_KEYS if s[k] is not None]
+    if len(set(pins)) != len(pins):
+        raise ValueError(f"TANKS: GPIO pin used twice in {pins} "
+                         "(set unused pins of extra tanks to None)")
+    return specs
+
+
+def scratch_specs(out_dir):
+    """
+    tank_specs() with every state file moved under ``out_dir``, for the
+    simulator and capture replay, which must never read or write a
+    tank's production state. Stale state / heartbeat files there are
+    removed so each run starts fresh.
+    """
+    specs = tank_specs()
+    os.makedirs(out_dir, exist_ok=True)
+    for s in specs:
+        name = 'pump_state.json' if len(specs) == 1 else f"pump_state_{s['name']}.json"
+        s['state_file'] = os.path.join(out_dir, name)
+        for stale in (s['state_file'], os.path.splitext(s['state_file'])[0] + '.hb'):
+            if os.path.exists(stale):
+                os.remove(stale)
+    return specs
+
+
+class Tank:
+    """One upper tank + pump: its subsystems and latest readings."""
+
+    def __init__(self, spec, label=''):
+        self.spec   = spec
+        self.name   = spec['name']
+        self.device = spec['device']
+        self.label  = label         # log prefix when several tanks share the process
+        self.geometry = TankGeometry.from_spec(spec)
+        self.filter   = make_filter(spec['level_filter'], self.geometry.capacity_l)
+
+        # ── Subsystems ──
+        self.relay  = None
+        self.sensor = None
+        self.logic  = None
+        self.link   = None          # link_stats.LinkTracker for its device
+
+        # ── Latest data ──
+        self.last_packet = None
+        self.raw_pct     = None     # unfiltered, straight from the packet
+        self.upper_pct   = None
+        self.upper_l     = None
+        self.rssi        = None
+        self.snr         = None
+        self.current_a   = None
+        self.voltage_v   = None
+        self.power       = None
+        self.decision    = None
+        self.row_decision = None    # last ON/OFF since the previous CSV row
+
+    @property
+    def pump_on(self):
+        return bool(self.relay and self.relay.pump_on)
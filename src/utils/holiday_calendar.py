@@ -0,0 +1,529 @@
+"""
+Compiled Holiday Calendar for Wilo Water Pump Automation System
+
+The scraped ``Holidays_2020_2030.csv`` stores dates as long strings such as
+"April 1, 2020, Wednesday". Parsing those on every start-up is slow, so this
+module compiles the CSV into a compact, versioned binary artifact:
+
+  - dates are stored as proleptic ordinals (``date.toordinal()``)
+  - event names and types are interned into a single string table
+  - each distinct (name, type) event carries a precomputed impact code
+
+Several named regional calendars share one artifact. The national calendar
+(``DEFAULT_REGION``) comes from ``HOLIDAY_DATA_FILE``; every
+``data/raw/regions/<REGION>.csv`` adds a region that inherits the national
+dates and lists only its own festivals. All regions share the interned event
+table and each keeps a sorted date index of its own occurrences. The artifact
+is memory-mapped, so processes on the same host share its pages.
+
+Build / update the artifact:
+
+    python -m src.utils.holiday_calendar                 # full rebuild
+    python -m src.utils.holiday_calendar --update new.csv  # new/changed years only
+
+``HolidayPredictor`` loads the artifact with ``load_calendar()`` and falls back
+to parsing the CSV when the artifact is missing or stale.
+"""
+
+import os
+import csv
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+from config.settings import get_absolute_path
+
+# Source CSVs and compiled artifact paths
+HOLIDAY_DATA_FILE = get_absolute_path('data/raw/Holidays_2020_2030.csv')
+HOLIDAY_REGION_DIR = get_absolute_path('data/raw/regions')
+HOLIDAY_ARTIFACT_FILE = get_absolute_path('data/processed/holidays_calendar.bin')
+
+# Region served by HOLIDAY_DATA_FILE; regional calendars inherit from it
+DEFAULT_REGION = 'IN'
+
+# Date format used by the scraper
+HOLIDAY_DATE_FORMAT = '%B %d, %Y, %A'
+
+# Holiday impact factors for different types of events
+HOLIDAY_IMPACT_FACTORS = {
+    'high_demand': {
+        'festivals': ['Holi', 'Diwali', 'Eid', 'Christmas', 'Dussehra', 'Ganesh Chaturthi', 'Durga', 'Navratri'],
+        'hour_adjustment': -1.5,  # Start 1.5 hours earlier
+        'duration_multiplier': 1.4,  # 40% longer duration
+        'description': 'Major festivals with high water usage'
+    },
+    'medium_demand': {
+        'festivals': ['Independence Day', 'Republic Day', 'Gandhi Jayanti', 'New Year', 'Valentine', 'Diwas'],
+        'hour_adjustment': -0.5,  # Start 30 minutes earlier
+        'duration_multiplier': 1.2,  # 20% longer duration
+        'description': 'National holidays and celebrations'
+    },
+    'low_demand': {
+        'festivals': ['Guru', 'Jayanti', 'Purnima', 'Ekadashi', 'Ashtami', 'Navami'],
+        'hour_adjustment': -0.25,  # Start 15 minutes earlier
+        'duration_multiplier': 1.1,  # 10% longer duration
+        'description': 'Religious observances with moderate impact'
+    }
+}
+
+# Impact codes stored in the artifact (index into IMPACT_LEVELS)
+IMPACT_LEVELS = ('low_demand', 'medium_demand', 'high_demand')
+
+# ── Binary layout (little-endian) ────────────────────────────
+#   header   : magic, version, n_strings, n_events, n_dates, n_regions,
+#              n_sources, impact-table fingerprint
+#   sources  : n_sources × sha1 of each compiled CSV
+#   strings  : n_strings × (u16 length + UTF-8 bytes)
+#   regions  : n_regions × (name idx u16, parent idx u16, first date u32,
+#              date count u32)
+#   (padding to a 4-byte boundary)
+#   dates    : ordinal u32[], event idx u16[]   (sorted per region)
+#   events   : name idx u16[], type idx u16[], impact code u8[]
+ARTIFACT_MAGIC = b'WHOL'
+ARTIFACT_VERSION = 2
+_HEADER = struct.Struct('<4sHIIIHH20s')
+_REGION = struct.Struct('<HHII')
+_NO_PARENT = 0xFFFF
+
+
+def classify_event(event_name):
+    """Return the impact code for an event name using keyword matching."""
+    name = event_name.lower()
+    for code in (2, 1):
+        for keyword in HOLIDAY_IMPACT_FACTORS[IMPACT_LEVELS[code]]['festivals']:
+            if keyword.lower() in name:
+                return code
+    return 0
+
+
+def impact_fingerprint():
+    """Digest of the impact table; a change invalidates precomputed codes."""
+    blob = json.dumps([IMPACT_LEVELS, HOLIDAY_IMPACT_FACTORS], sort_keys=True)
+    return hashlib.sha1(blob.encode('utf-8')).digest()
+
+
+def file_digest(path):
+    """SHA-1 of a source file's contents."""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+class HolidayCalendar:
+    """
+    In-memory compiled calendar holding every region.
+
+    Events are interned: ``event_names``/``event_types`` index into
+    ``strings`` and every dated occurrence refers to an event by index.
+    ``regions`` maps a region name to (parent, first, last) — the slice of
+    ``ordinals``/``date_events`` holding that region's own dates.
+    """
+
+    def __init__(self, strings=None, event_names=None, event_types=None,
+                 event_impacts=None, ordinals=None, date_events=None,
+                 regions=None, sources=None, buffer=None):
+        self.strings       = strings if strings is not None else []
+        self.event_names   = event_names if event_names is not None else array('H')
+        self.event_types   = event_types if event_types is not None else array('H')
+        self.event_impacts = event_impacts if event_impacts is not None else array('B')
+        self.ordinals      = ordinals if ordinals is not None else array('I')
+        self.date_events   = date_events if date_events is not None else array('H')
+        self.regions       = regions if regions is not None else {}
+        self.sources       = sources if sources is not None else []
+        self._buffer       = buffer     # keeps the mmap alive
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    @property
+    def years(self):
+        return sorted({date.fromordinal(o).year for o in set(self.ordinals)})
+
+    def region_years(self, region):
+        """Years with dates of ``region`` itself (not inherited)."""
+        _, lo, hi = self.regions[region]
+        return sorted({date.fromordinal(self.ordinals[i]).year for i in range(lo, hi)})
+
+    def lineage(self, region):
+        """Region chain from the root calendar down to ``region``."""
+        chain = []
+        while region is not None:
+            if region not in self.regions:
+                raise KeyError(f"unknown holiday region: {region}")
+            chain.append(region)
+            region = self.regions[region][0]
+        return chain[::-1]
+
+    def events_on(self, day, region=DEFAULT_REGION):
+        """Return holiday records (dicts) falling on ``day`` in ``region``."""
+        ordinal = day.toordinal()
+        records = []
+        for name in self.lineage(region):
+            _, first, last = self.regions[name]
+            lo = bisect_left(self.ordinals, ordinal, first, last)
+            hi = bisect_right(self.ordinals, ordinal, lo, last)
+            if lo != hi:
+                d = date.fromordinal(ordinal)
+                records.extend(self._record(d, self.date_events[i], name)
+                               for i in range(lo, hi))
+        return records
+
+    def iter_records(self, region=None):
+        """Yield records of ``region``'s own dates (all regions if None)."""
+        names = [region] if region is not None else list(self.regions)
+        for name in names:
+            _, lo, hi = self.regions[name]
+            for i in range(lo, hi):
+                yield self._record(date.fromordinal(self.ordinals[i]),
+                                   self.date_events[i], name)
+
+    def _record(self, d, ev, region):
+        return {
+            'year':        d.year,
+            'date':        datetime(d.year, d.month, d.day),
+            'event':       self.strings[self.event_names[ev]],
+            'type':        self.strings[self.event_types[ev]],
+            'impact_code': self.event_impacts[ev],
+            'region':      region,
+        }
+
+
+class _Builder:
+    """Interns strings/events and collects dated occurrences per region."""
+
+    def __init__(self):
+        self.strings = []
+        self._string_idx = {}
+        self.events = []            # (name idx, type idx, impact code)
+        self._event_idx = {}
+        self.parents = {}           # region -> parent region or None
+        self.occurrences = {}       # region -> {(ordinal, event idx)}, in source order
+
+    def _intern(self, s):
+        idx = self._string_idx.get(s)
+        if idx is None:
+            idx = len(self.strings)
+            self.strings.append(s)
+            self._string_idx[s] = idx
+        return idx
+
+    def _event(self, name, event_type, impact=None):
+        key = (name, event_type)
+        idx = self._event_idx.get(key)
+        if idx is None:
+            idx = len(self.events)
+            if impact is None:
+                impact = classify_event(name)
+            self.events.append((self._intern(name), self._intern(event_type), impact))
+            self._event_idx[key] = idx
+        return idx
+
+    def region(self, name, parent=None):
+        self._intern(name)
+        self.parents.setdefault(name, parent)
+        self.occurrences.setdefault(name, {})
+
+    def add(self, region, d, name, event_type, impact=None):
+        self.occurrences[region].setdefault(
+            (d.toordinal(), self._event(name, event_type, impact)))
+
+    def build(self, sources=()):
+        ordinals, date_events, regions = array('I'), array('H'), {}
+        for name, occ in self.occurrences.items():
+            # Stable sort keeps the source order of events sharing a date
+            first = len(ordinals)
+            for o, ev in sorted(occ, key=lambda x: x[0]):
+                ordinals.append(o)
+                date_events.append(ev)
+            regions[name] = (self.parents[name], first, len(ordinals))
+        return HolidayCalendar(
+            strings=self.strings,
+            event_names=array('H', (e[0] for e in self.events)),
+            event_types=array('H', (e[1] for e in self.events)),
+            event_impacts=array('B', (e[2] for e in self.events)),
+            ordinals=ordinals,
+            date_events=date_events,
+            regions=regions,
+            sources=list(sources),
+        )
+
+
+# ── Region configuration ─────────────────────────────────────
+
+def discover_regions():
+    """
+    Return {region: (parent, [csv paths])} for the configured calendars:
+    the national CSV plus one region per ``HOLIDAY_REGION_DIR/<name>.csv``.
+    """
+    regions = {DEFAULT_REGION: (None, [HOLIDAY_DATA_FILE])}
+    if os.path.isdir(HOLIDAY_REGION_DIR):
+        for fn in sorted(os.listdir(HOLIDAY_REGION_DIR)):
+            name, ext = os.path.splitext(fn)
+            if ext.lower() == '.csv' and name != DEFAULT_REGION:
+                regions[name] = (DEFAULT_REGION, [os.path.join(HOLIDAY_REGION_DIR, fn)])
+    return regions
+
+
+# ── CSV parsing ──────────────────────────────────────────────
+
+def read_csv_rows(csv_path, skip_years=()):
+    """
+    Yield (date, event, type) from the scraped CSV.
+    Rows whose ``year`` column is in ``skip_years`` are not date-parsed.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                if int(row['year']) in skip_years:
+                    continue
+            except (KeyError, ValueError):
+                pass
+            d = datetime.strptime(row['date'], HOLIDAY_DATE_FORMAT).date()
+            yield d, row['event'], row['type']
+
+
+def csv_years(csv_path):
+    """Years covered by a scraped CSV (its ``year`` column, else the dates)."""
+    years = set()
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                years.add(int(row['year']))
+            except (KeyError, ValueError):
+                years.add(datetime.strptime(row['date'], HOLIDAY_DATE_FORMAT).year)
+    return years
+
+
+def calendar_from_csv(regions=None):
+    """Parse the region CSVs directly (slow path / fallback)."""
+    if regions is None:
+        regions = discover_regions()
+    builder = _Builder()
+    sources = []
+    for name, (parent, paths) in regions.items():
+        builder.region(name, parent)
+        for path in paths:
+            for d, event, event_type in read_csv_rows(path):
+                builder.add(name, d, event, event_type)
+            sources.append(file_digest(path))
+    return builder.build(sources)
+
+
+# ── Artifact I/O ─────────────────────────────────────────────
+
+def write_artifact(calendar, artifact_path):
+    """Serialise a calendar to ``artifact_path`` (written atomically)."""
+    strings = list(calendar.strings)
+    string_idx = {s: i for i, s in enumerate(strings)}
+    for name in calendar.regions:
+        if name not in string_idx:
+            string_idx[name] = len(strings)
+            strings.append(name)
+
+    parts = [_HEADER.pack(ARTIFACT_MAGIC, ARTIFACT_VERSION,
+                          len(strings), len(calendar.event_names),
+                          len(calendar.ordinals), len(calendar.regions),
+                          len(calendar.sources), impact_fingerprint())]
+    parts.extend(calendar.sources)
+    for s in strings:
+        b = s.encode('utf-8')
+        parts.append(struct.pack('<H', len(b)))
+        parts.append(b)
+    for name, (parent, lo, hi) in calendar.regions.items():
+        parts.append(_REGION.pack(string_idx[name],
+                                  _NO_PARENT if parent is None else string_idx[parent],
+                                  lo, hi - lo))
+    size = sum(len(p) for p in parts)
+    parts.append(b'\0' * (-size % 4))
+    for typecode, arr in (('I', calendar.ordinals), ('H', calendar.date_events),
+                          ('H', calendar.event_names), ('H', calendar.event_types),
+                          ('B', calendar.event_impacts)):
+        a = array(typecode, arr)
+        if sys.byteorder != 'little':
+            a.byteswap()
+        parts.append(a.tobytes())
+
+    os.makedirs(os.path.dirname(os.path.abspath(artifact_path)), exist_ok=True)
+    tmp = artifact_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(b''.join(parts))
+    os.replace(tmp, artifact_path)
+
+
+def read_artifact(artifact_path):
+    """
+    Memory-map a compiled artifact.
+    Raises ValueError if the file is not a compatible artifact.
+    """
+    with open(artifact_path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(buf) < _HEADER.size:
+        raise ValueError("truncated artifact")
+    (magic, version, n_str, n_ev, n_dates,
+     n_reg, n_src, fp) = _HEADER.unpack_from(buf, 0)
+    if magic != ARTIFACT_MAGIC:
+        raise ValueError("not a holiday calendar artifact")
+    if version != ARTIFACT_VERSION:
+        raise ValueError(f"artifact version {version} != {ARTIFACT_VERSION}")
+    if fp != impact_fingerprint():
+        raise ValueError("impact table changed since compile")
+
+    pos = _HEADER.size
+    sources = [buf[pos + i * 20:pos + (i + 1) * 20] for i in range(n_src)]
+    pos += n_src * 20
+
+    strings = []
+    for _ in range(n_str):
+        (n,) = struct.unpack_from('<H', buf, pos)
+        pos += 2
+        strings.append(buf[pos:pos + n].decode('utf-8'))
+        pos += n
+
+    regions = {}
+    for _ in range(n_reg):
+        name, parent, first, count = _REGION.unpack_from(buf, pos)
+        pos += _REGION.size
+        regions[strings[name]] = (None if parent == _NO_PARENT else strings[parent],
+                                  first, first + count)
+    pos += -pos % 4
+
+    view = memoryview(buf)
+
+    def take(typecode, count):
+        # Zero-copy view into the mapping; copy only on big-endian hosts
+        nonlocal pos
+        end = pos + count * array(typecode).itemsize
+        if end > len(buf):
+            raise ValueError("truncated artifact")
+        if sys.byteorder == 'little':
+            a = view[pos:end].cast(typecode)
+        else:
+            a = array(typecode, view[pos:end].tobytes())
+            a.byteswap()
+        pos = end
+        return a
+
+    return HolidayCalendar(
+        ordinals=take('I', n_dates),
+        date_events=take('H', n_dates),
+        event_names=take('H', n_ev),
+        event_types=take('H', n_ev),
+        event_impacts=take('B', n_ev),
+        strings=strings,
+        regions=regions,
+        sources=sources,
+        buffer=buf,
+    )
+
+
+def compile_calendar(regions=None, artifact_path=HOLIDAY_ARTIFACT_FILE, update=False):
+    """
+    Compile the region CSVs into ``artifact_path``.
+
+    ``regions`` is {region: (parent, [csv paths])}; defaults to
+    ``discover_regions()``. With ``update=True`` the existing artifact is kept
+    and, per region, only years it does not contain yet or that appear in a
+    CSV it was not compiled from are parsed from the CSVs; those years are
+    rebuilt from every CSV of the region, so corrections replace old rows.
+    """
+    if regions is None:
+        regions = discover_regions()
+    builder = _Builder()
+    sources = []
+    known_years = {}
+
+    if update and os.path.exists(artifact_path):
+        existing = read_artifact(artifact_path)
+        changed = {}                # region -> years of its new / edited CSVs
+        for name, (_, paths) in regions.items():
+            changed[name] = set()
+            for path in paths:
+                if file_digest(path) not in existing.sources:
+                    changed[name] |= csv_years(path)
+        for name, (parent, _, _) in existing.regions.items():
+            builder.region(name, parent)
+            known_years[name] = set(existing.region_years(name)) - changed.get(name, set())
+        for rec in existing.iter_records():
+            if rec['year'] in known_years[rec['region']]:
+                builder.add(rec['region'], rec['date'].date(), rec['event'], rec['type'],
+                            rec['impact_code'])
+
+    # Only the CSVs compiled now count as sources: a digest kept from an
+    # older version would mark that version fresh if a CSV reverted to it
+    for name, (parent, paths) in regions.items():
+        builder.region(name, parent)
+        for path in paths:
+            for d, event, event_type in read_csv_rows(path, known_years.get(name, ())):
+                builder.add(name, d, event, event_type)
+            digest = file_digest(path)
+            if digest not in sources:
+                sources.append(digest)
+
+    calendar = builder.build(sources)
+    write_artifact(calendar, artifact_path)
+    return calendar
+
+
+def load_calendar(artifact_path=HOLIDAY_ARTIFACT_FILE, regions=None):
+    """
+    Load the compiled calendar, falling back to the CSVs.
+
+    The artifact is considered stale when its format or impact table is out of
+    date, when a configured region is missing from it, or when a region CSV
+    exists with contents it was not compiled from.
+    Returns (calendar, source) where source is 'artifact' or 'csv'.
+    """
+    if regions is None:
+        regions = discover_regions()
+    try:
+        calendar = read_artifact(artifact_path)
+        for name, (_, paths) in regions.items():
+            if name not in calendar.regions:
+                raise ValueError(f"region {name} not compiled")
+            for path in paths:
+                if os.path.exists(path) and file_digest(path) not in calendar.sources:
+                    raise ValueError(f"{os.path.basename(path)} changed since compile")
+        return calendar, 'artifact'
+    except FileNotFoundError:
+        pass
+    except (ValueError, struct.error, UnicodeDecodeError) as e:
+        print(f"[WARNING] Holiday artifact stale ({e}) - falling back to CSV")
+    return calendar_from_csv(regions), 'csv'
+
+
+_shared = {}
+
+def get_calendar(artifact_path=HOLIDAY_ARTIFACT_FILE):
+    """Process-wide calendar shared by every HolidayPredictor."""
+    if artifact_path not in _shared:
+        _shared[artifact_path] = load_calendar(artifact_path)
+    return _shared[artifact_path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile the holiday CSVs into a binary calendar')
+    parser.add_argument('csv', nargs='*',
+                        help='National holiday CSV(s) (default: data/raw/Holidays_2020_2030.csv)')
+    parser.add_argument('--out', default=HOLIDAY_ARTIFACT_FILE,
+                        help='Artifact path (default: data/processed/holidays_calendar.bin)')
+    parser.add_argument('--update', action='store_true',
+                        help='Keep the existing artifact; parse only new or changed years')
+    args = parser.parse_args()
+
+    regions = discover_regions()
+    if args.csv:
+        regions[DEFAULT_REGION] = (None, args.csv)
+    calendar = compile_calendar(regions, args.out, update=args.update)
+    years = calendar.years
+    span = f"{years[0]}-{years[-1]}" if years else "no years"
+    print(f"[INFO] Compiled {len(calendar)} holiday records "
+          f"({len(calendar.event_names)} events, {len(calendar.regions)} regions, {span}) → {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,61 +5,57 @@ This module analyzes holiday and festival data to predict increased water demand
 and adjust pump operation schedules accordingly.
 """
 
-import pandas as pd
 from datetime import datetime, timedelta
-from config.settings import get_absolute_path
+from config.settings import HOLIDAY_REGION
+from src.utils.holiday_calendar import (
+    HOLIDAY_ARTIFACT_FILE, HOLIDAY_IMPACT_FACTORS,
+    IMPACT_LEVELS, DEFAULT_REGION, classify_event, get_calendar
+)
 
-# Holiday data file path
-HOLIDAY_DATA_FILE = get_absolute_path('data/raw/Holidays_2020_2030.csv')
-
-# Holiday impact factors for different types of events
-HOLIDAY_IMPACT_FACTORS = {
-    'high_demand': {
-        'festivals': ['Holi', 'Diwali', 'Eid', 'Christmas', 'Dussehra', 'Ganesh Chaturthi', 'Durga', 'Navratri'],
-        'hour_adjustment': -1.5,  # Start 1.5 hours earlier
-        'duration_multiplier': 1.4,  # 40% longer duration
-        'description': 'Major festivals with high water usage'
-    },
-    'medium_demand': {
-        'festivals': ['Independence Day', 'Republic Day', 'Gandhi Jayanti', 'New Year', 'Valentine', 'Diwas'],
-        'hour_adjustment': -0.5,  # Start 30 minutes earlier
-        'duration_multiplier': 1.2,  # 20% longer duration
-        'description': 'National holidays and celebrations'
-    },
-    'low_demand': {
-        'festivals': ['Guru', 'Jayanti', 'Purnima', 'Ekadashi', 'Ashtami', 'Navami'],
-        'hour_adjustment': -0.25,  # Start 15 minutes earlier
-        'duration_multiplier': 1.1,  # 10% longer duration
-        'description': 'Religious observances with moderate impact'
-    }
-}
+# Impact weight per level (used to pick the dominant holiday)
+IMPACT_WEIGHTS = {'low_demand': 0.3, 'medium_demand': 0.6, 'high_demand': 1.0}
 
 class HolidayPredictor:
     """
     Predicts water demand adjustments based on holidays and festivals.
+    
+    All predictors in a process share one compiled calendar; ``region``
+    selects the site's regional calendar (national dates + regional festivals).
     """
     
-    def __init__(self):
+    def __init__(self, region=DEFAULT_REGION):
         self.holiday_data = None
+        self.region = region
         self.load_holiday_data()
     
+    @property
+    def regions(self):
+        """Names of the available regional calendars"""
+        return sorted(self.holiday_data.regions) if self.holiday_data is not None else []
+    
     def load_holiday_data(self):
-        """Load holiday data from CSV file"""
+        """Load the shared compiled calendar (falls back to the CSVs if stale)"""
         try:
-            self.holiday_data = pd.read_csv(HOLIDAY_DATA_FILE)
-            self.holiday_data['date'] = pd.to_datetime(self.holiday_data['date'], format='%B %d, %Y, %A')
-            print(f"[INFO] Loaded {len(self.holiday_data)} holiday records from 2020-2030")
+            self.holiday_data, source = get_calendar(HOLIDAY_ARTIFACT_FILE)
+            if self.region not in self.holiday_data.regions:
+                print(f"[WARNING] Unknown holiday region '{self.region}' - using {DEFAULT_REGION}")
+                self.region = DEFAULT_REGION
+            years = self.holiday_data.years
+            span = f"{years[0]}-{years[-1]}" if years else "no years"
+            print(f"[INFO] Loaded {len(self.holiday_data)} holiday records from {span} "
+                  f"({len(self.holiday_data.regions)} regions, {source}), region={self.region}")
         except Exception as e:
             print(f"[ERROR] Failed to load holiday data: {e}")
             self.holiday_data = None
     
-    def get_holiday_impact(self, target_date, look_ahead_days=2):
+    def get_holiday_impact(self, target_date, look_ahead_days=2, region=None):
         """
         Analyze holiday impact for a given date and nearby dates.
         
         Args:
             target_date (datetime): The date to analyze
             look_ahead_days (int): Number of days to look ahead for upcoming holidays
+            region (str): Regional calendar to use (default: this predictor's region)
             
         Returns:
             dict: Holiday impact analysis including adjustments
@@ -88,7 +84,7 @@ class HolidayPredictor:
         cumulative_duration_multiplier = 1.0
         
         for i, check_date in enumerate(date_range):
-            holidays_on_date = self._get_holidays_for_date(check_date)
+            holidays_on_date = self._get_holidays_for_date(check_date, region)
             
             if holidays_on_date:
                 for holiday in holidays_on_date:
@@ -113,41 +109,24 @@ class HolidayPredictor:
         
         return impact_analysis
     
-    def _get_holidays_for_date(self, check_date):
+    def _get_holidays_for_date(self, check_date, region=None):
         """Get all holidays for a specific date"""
         if self.holiday_data is None:
             return []
         
-        # Filter holidays for the specific date
-        date_holidays = self.holiday_data[
-            self.holiday_data['date'].dt.date == check_date.date()
-        ]
-        
-        return date_holidays.to_dict('records') if not date_holidays.empty else []
+        return self.holiday_data.events_on(check_date, region or self.region)
     
     def _analyze_holiday_impact(self, holiday_record, days_ahead=0):
         """Analyze the impact of a specific holiday"""
         event_name = holiday_record['event']
         event_type = holiday_record['type']
         
-        # Determine impact level based on festival name matching
-        impact_level = 'low_demand'
-        impact_weight = 0.3
-        
-        # Check for high impact festivals
-        for keyword in HOLIDAY_IMPACT_FACTORS['high_demand']['festivals']:
-            if keyword.lower() in event_name.lower():
-                impact_level = 'high_demand'
-                impact_weight = 1.0
-                break
-        
-        # Check for medium impact if not high
-        if impact_level != 'high_demand':
-            for keyword in HOLIDAY_IMPACT_FACTORS['medium_demand']['festivals']:
-                if keyword.lower() in event_name.lower():
-                    impact_level = 'medium_demand'
-                    impact_weight = 0.6
-                    break
+        # Impact level is precomputed at compile time; match keywords otherwise
+        impact_code = holiday_record.get('impact_code')
+        if impact_code is None:
+            impact_code = classify_event(event_name)
+        impact_level = IMPACT_LEVELS[impact_code]
+        impact_weight = IMPACT_WEIGHTS[impact_level]
         
         # Get impact factors
         factors = HOLIDAY_IMPACT_FACTORS[impact_level]
@@ -194,7 +173,8 @@ class HolidayPredictor:
             'reason': 'Regular weekday'
         }
     
-    def get_comprehensive_prediction_adjustment(self, target_date, base_hour, base_duration):
+    def get_comprehensive_prediction_adjustment(self, target_date, base_hour, base_duration,
+                                                region=None):
         """
         Get comprehensive prediction adjustments considering holidays and weekends.
         
@@ -202,11 +182,12 @@ class HolidayPredictor:
             target_date (datetime): Date to analyze
             base_hour (float): Base predicted start hour
             base_duration (float): Base predicted duration
+            region (str): Regional calendar to use (default: this predictor's region)
             
         Returns:
             dict: Comprehensive adjustment information
         """
-        holiday_impact = self.get_holiday_impact(target_date)
+        holiday_impact = self.get_holiday_impact(target_date, region=region)
         weekend_impact = self.get_weekend_adjustment(target_date)
         
         # Calculate total adjustments
@@ -256,4 +237,4 @@ class HolidayPredictor:
         return "; ".join(explanations)
 
 # Global instance for easy access
-holiday_predictor = HolidayPredictor()
\ No newline at end of file
+holiday_predictor = HolidayPredictor(region=HOLIDAY_REGION)
\ No newline at end of file
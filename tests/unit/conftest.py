@@ -0,0 +1,7 @@
+import os
+import sys
+
+_PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, _PROJECT)
+# Controller modules import their siblings directly (import tank_config as CFG)
+sys.path.insert(0, os.path.join(_PROJECT, 'src', 'controller'))
@@ -0,0 +1,74 @@
+import csv
+
+from gateway_merge import Deduplicator, frame_key, merge_files
+
+
+def test_frame_key():
+    assert frame_key('esp32', 65537) == ('esp32', 1)
+    assert frame_key('esp32', '12') == ('esp32', 12)
+    assert frame_key('', None, 'c10a') == ('raw', 'c10a')
+
+
+def test_released_after_hold_with_best_copy():
+    d = Deduplicator(window_s=2.0, hold_s=0.3)
+    key = ('esp32', 1)
+    assert d.push(0.0, key, -90, 'gw1') == []
+    assert d.push(0.1, key, -70, 'gw2') == []
+    assert d.push(0.2, key, -80, 'gw3') == []
+    assert d.expire(0.29) == []
+    assert d.expire(0.3) == [('gw2', 3)]
+    assert d.summary() == {'received': 3, 'released': 1, 'duplicates': 2, 'late': 0}
+
+
+def test_late_copy_dropped_within_window():
+    d = Deduplicator(window_s=2.0, hold_s=0.3)
+    key = ('esp32', 1)
+    d.push(0.0, key, -70, 'gw1')
+    assert d.push(1.0, key, -60, 'gw2') == [('gw1', 1)]
+    assert d.late == 1
+    # Same key after the window is a new frame (sequence wrapped or reset)
+    d.push(5.0, key, -60, 'gw1')
+    assert d.drain() == [('gw1', 1)]
+    assert d.released == 2
+
+
+def test_release_order_and_deadline():
+    d = Deduplicator(window_s=2.0, hold_s=0.5)
+    assert d.next_deadline() is None
+    d.push(0.0, ('a', 1), None, 'a1')
+    d.push(0.2, ('b', 1), None, 'b1')
+    assert d.next_deadline() == 0.5
+    assert d.push(0.6, ('a', 2), None, 'a2') == [('a1', 1)]
+    assert d.expire(10.0) == [('b1', 1), ('a2', 1)]
+
+
+def test_missing_rssi_keeps_first_copy():
+    d = Deduplicator(window_s=2.0, hold_s=0.3)
+    d.push(0.0, ('a', 1), None, 'first')
+    d.push(0.1, ('a', 1), None, 'second')
+    assert d.drain() == [('first', 2)]
+
+
+def _write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['timestamp', 'device', 'pkt', 'rssi_dbm', 'raw_payload'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_merge_files(tmp_path):
+    gw1, gw2, out = tmp_path / 'gw1.csv', tmp_path / 'gw2.csv', tmp_path / 'merged.csv'
+    _write_csv(gw1, [
+        {'timestamp': '2025-01-01T00:00:00', 'device': 'esp32', 'pkt': 1, 'rssi_dbm': -80},
+        {'timestamp': '2025-01-01T00:00:01', 'device': 'esp32', 'pkt': 2, 'rssi_dbm': -60},
+    ])
+    _write_csv(gw2, [
+        {'timestamp': '2025-01-01T00:00:00', 'device': 'esp32', 'pkt': 1, 'rssi_dbm': -70},
+        {'timestamp': '2025-01-01T00:00:03', 'device': 'esp32', 'pkt': 3, 'rssi_dbm': -75},
+    ])
+    d = merge_files({'gw1': str(gw1), 'gw2': str(gw2)}, str(out), window_s=2.0)
+    with open(out, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [(r['pkt'], r['gateway'], r['copies']) for r in rows] == [
+        ('1', 'gw2', '2'), ('2', 'gw1', '1'), ('3', 'gw2', '1')]
+    assert d.duplicates == 1
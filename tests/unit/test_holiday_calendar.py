@@ -0,0 +1,64 @@
+import csv
+
+from src.utils import holiday_calendar as hc
+
+ROWS = [
+    {'year': 2024, 'date': 'January 26, 2024, Friday', 'event': 'Republic Day', 'type': 'Govt'},
+    {'year': 2024, 'date': 'March 25, 2024, Monday', 'event': 'Holi', 'type': 'Hindu'},
+    {'year': 2025, 'date': 'March 14, 2025, Friday', 'event': 'Holi', 'type': 'Hindu'},
+]
+
+
+def _write(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['year', 'date', 'event', 'type'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _events(calendar):
+    return sorted((r['date'], r['event']) for r in calendar.iter_records())
+
+
+def _setup(tmp_path):
+    src, artifact = tmp_path / 'holidays.csv', str(tmp_path / 'holidays.bin')
+    return src, artifact, {hc.DEFAULT_REGION: (None, [str(src)])}
+
+
+def test_artifact_round_trip(tmp_path):
+    src, artifact, regions = _setup(tmp_path)
+    _write(src, ROWS)
+    compiled = hc.compile_calendar(regions, artifact)
+    calendar, source = hc.load_calendar(artifact, regions)
+    assert source == 'artifact'
+    assert _events(calendar) == _events(compiled)
+    holi = calendar.events_on(hc.date(2024, 3, 25))
+    assert [r['event'] for r in holi] == ['Holi']
+    assert holi[0]['impact_code'] == 2
+
+
+def test_update_rebuilds_corrected_year(tmp_path):
+    src, artifact, regions = _setup(tmp_path)
+    _write(src, ROWS)
+    hc.compile_calendar(regions, artifact)
+    corrected = [dict(ROWS[0], event='Republic Day (observed)')] + ROWS[1:]
+    corrected.append({'year': 2026, 'date': 'March 4, 2026, Wednesday', 'event': 'Holi', 'type': 'Hindu'})
+    _write(src, corrected)
+    updated = hc.compile_calendar(regions, artifact, update=True)
+    assert _events(updated) == _events(hc.calendar_from_csv(regions))
+    assert hc.load_calendar(artifact, regions)[1] == 'artifact'
+
+
+def test_update_after_revert(tmp_path):
+    src, artifact, regions = _setup(tmp_path)
+    _write(src, ROWS)
+    hc.compile_calendar(regions, artifact)
+    _write(src, [dict(ROWS[0], event='Republic Day (observed)')] + ROWS[1:])
+    hc.compile_calendar(regions, artifact, update=True)
+
+    _write(src, ROWS)
+    # The artifact serves the edited version: stale until recompiled
+    assert hc.load_calendar(artifact, regions)[1] == 'csv'
+    reverted = hc.compile_calendar(regions, artifact, update=True)
+    assert _events(reverted) == _events(hc.calendar_from_csv(regions))
+    assert len(reverted.sources) == 1
@@ -0,0 +1,110 @@
+from link_stats import LinkStats, LinkTracker
+
+
+def _tracker(**kwargs):
+    kwargs.setdefault('window', 64)
+    kwargs.setdefault('reorder_s', 5)
+    kwargs.setdefault('pdr_warn', 0.8)
+    return LinkTracker('esp32', **kwargs)
+
+
+def _feed(tracker, seqs, t0=0.0, period=1.0):
+    return [tracker.update(seq, t0 + i * period) for i, seq in enumerate(seqs)]
+
+
+def test_in_order():
+    tr = _tracker()
+    assert _feed(tr, range(10)) == [LinkTracker.NEW] * 10
+    assert (tr.received, tr.lost) == (10, 0)
+    assert tr.pdr == 1.0
+    assert tr.pdr_window == 1.0
+
+
+def test_gap_counts_lost():
+    tr = _tracker()
+    _feed(tr, [0, 1, 2, 6, 7])
+    assert tr.received == 5
+    assert tr.lost == 3
+    assert tr.pdr == 5 / 8
+    assert tr.pdr_window == 5 / 8
+
+
+def test_duplicate():
+    tr = _tracker()
+    assert _feed(tr, [0, 1, 2, 2, 1])[3:] == [LinkTracker.DUPLICATE, LinkTracker.DUPLICATE]
+    assert tr.duplicates == 2
+    assert tr.received == 3
+
+
+def test_late_fills_gap():
+    tr = _tracker()
+    _feed(tr, [0, 1, 3])
+    assert tr.lost == 1
+    assert tr.update(2, 3.1) == LinkTracker.LATE
+    assert (tr.lost, tr.late, tr.received) == (0, 1, 4)
+    assert tr.pdr_window == 1.0
+    assert tr.update(2, 3.2) == LinkTracker.DUPLICATE
+
+
+def test_reset_backwards():
+    tr = _tracker()
+    _feed(tr, range(100, 120))
+    # Sender rebooted: pkt restarts at 0, far behind the window
+    assert tr.update(0, 20.0) == LinkTracker.RESET
+    assert tr.resets == 1
+    assert tr.last_seq == 0
+    assert tr.update(1, 21.0) == LinkTracker.NEW
+
+
+def test_reset_forward_jump():
+    tr = _tracker()
+    _feed(tr, range(10))
+    # 5000 numbers in 1 s at a 1 s period cannot be loss
+    assert tr.update(5010, 10.0) == LinkTracker.RESET
+    assert tr.lost == 0
+
+
+def test_long_outage_is_loss():
+    tr = _tracker()
+    _feed(tr, range(10))
+    assert tr.update(210, 209.0) == LinkTracker.NEW
+    assert tr.lost == 200
+    assert tr.resets == 0
+
+
+def test_sequence_wrap():
+    tr = _tracker()
+    seqs = [65533, 65534, 65535, 0, 1, 2]
+    assert _feed(tr, seqs) == [LinkTracker.NEW] * 6
+    assert (tr.lost, tr.resets) == (0, 0)
+    assert tr.update(65535, 6.0) == LinkTracker.DUPLICATE
+
+
+def test_unsequenced():
+    tr = _tracker()
+    assert tr.update(None, 0.0) == LinkTracker.NEW
+    assert tr.update(-1, 1.0) == LinkTracker.NEW
+    assert tr.unsequenced == 2
+    assert tr.pdr is None
+
+
+def test_radio_stats():
+    tr = _tracker()
+    for i in range(5):
+        tr.update(i, float(i), rssi=-60 - i, snr=9.0)
+    s = tr.summary()
+    assert s['rssi_dbm']['min'] == -64
+    assert s['rssi_dbm']['max'] == -60
+    assert s['snr_db']['mean'] == 9.0
+    assert s['inter_arrival_s']['mean'] == 1.0
+
+
+def test_link_stats_per_device():
+    stats = LinkStats(window=64, reorder_s=5, pdr_warn=0.8)
+    a, result = stats.update('a', 0, 0.0)
+    assert result == LinkTracker.NEW
+    stats.update('b', 5, 0.0)
+    stats.update('a', 1, 1.0)
+    assert stats.get('a') is a
+    assert sorted(t.device for t in stats) == ['a', 'b']
+    assert a.received == 2
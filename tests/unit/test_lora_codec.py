@@ -0,0 +1,63 @@
+import pytest
+
+import lora_codec
+
+
+def test_binary_round_trip():
+    raw = lora_codec.encode(1, 70000, status='fault', voltage=1.234, pressure_kpa=12.5)
+    assert len(raw) == 11
+    assert lora_codec.is_binary(raw)
+    assert lora_codec.decode(raw) == {
+        'device': 'esp32', 'sensor': 'PR12P210', 'status': 'fault',
+        'voltage': 1.234, 'pressure_kpa': 12.5, 'pkt': 70000 & 0xFFFF,
+    }
+
+
+def test_binary_without_crc():
+    raw = lora_codec.encode(7, 3, pressure_kpa=-1.0, crc=False)
+    assert len(raw) == 10
+    pkt = lora_codec.decode(raw)
+    assert pkt['device'] == 'node7'
+    assert pkt['pressure_kpa'] == -1.0
+
+
+def test_crc_mismatch():
+    raw = bytearray(lora_codec.encode(1, 42, pressure_kpa=10.0))
+    raw[8] ^= 0x01
+    with pytest.raises(ValueError, match='CRC'):
+        lora_codec.decode(bytes(raw))
+
+
+def test_short_and_unknown_version():
+    raw = lora_codec.encode(1, 42)
+    with pytest.raises(ValueError, match='too short'):
+        lora_codec.decode(raw[:9])
+    with pytest.raises(ValueError, match='version'):
+        lora_codec.decode(bytes([raw[0] & ~lora_codec.VERSION_MASK | 2]) + raw[1:])
+
+
+def test_json_fallback():
+    text = '{"device":"esp32","sensor":"PR12P210","status":"ok","voltage":1.5,"pressure_kpa":8.25,"pkt":9}'
+    expected = {'device': 'esp32', 'sensor': 'PR12P210', 'status': 'ok',
+                'voltage': 1.5, 'pressure_kpa': 8.25, 'pkt': 9}
+    assert lora_codec.decode(text) == expected
+    assert lora_codec.decode(text.encode() + b'\x00\x00') == expected
+    assert not lora_codec.is_binary(text.encode())
+
+
+def test_json_errors():
+    with pytest.raises(ValueError):
+        lora_codec.decode(b'{"device": "esp')
+    with pytest.raises(ValueError, match='not an object'):
+        lora_codec.decode('[1, 2]')
+
+
+def test_crc8_reference():
+    # CRC-8/SMBUS check value
+    assert lora_codec.crc8(b'123456789') == 0xF4
+
+
+def test_describe():
+    raw = lora_codec.encode(1, 1)
+    assert lora_codec.describe(raw) == raw.hex()
+    assert lora_codec.describe(b'{"a":1}\x00\n') == '{"a":1}'
@@ -0,0 +1,104 @@
+import csv
+
+import pytest
+
+import lora_csv_receiver
+from lora_csv_receiver import CSV_HEADER, PacketCsvLogger
+
+PACKET = {'device': 'esp32', 'sensor': 'PR12P210', 'status': 'ok',
+          'voltage_v': 1.2, 'pressure_kpa': 10.5, 'pkt': 1}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(lora_csv_receiver.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def _rows(path):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+
+def _logger(path, **kwargs):
+    log = PacketCsvLogger(str(path), **kwargs)
+    log.initialize()
+    return log
+
+
+def test_commit_after_flush_rows(tmp_path, clock):
+    path = tmp_path / 'packets.csv'
+    log = _logger(path, flush_rows=3, flush_s=60, durability='os')
+    for _ in range(2):
+        log.write_packet(PACKET, rssi=-60, snr=9.0)
+    assert _rows(path) == [CSV_HEADER]
+    log.write_packet(PACKET, rssi=-60, snr=9.0)
+    assert len(_rows(path)) == 4
+    assert log.commits == 1
+    log.close()
+
+
+def test_commit_after_flush_s(tmp_path, clock):
+    path = tmp_path / 'packets.csv'
+    log = _logger(path, flush_rows=100, flush_s=5.0, durability='os')
+    log.write_packet(PACKET)
+    clock[0] += 4.9
+    log.flush_if_due()
+    assert log.commits == 0
+    clock[0] += 0.1
+    log.flush_if_due()
+    assert log.commits == 1
+    assert len(_rows(path)) == 2
+    # Nothing pending: no empty commits
+    clock[0] += 10
+    log.flush_if_due()
+    assert log.commits == 1
+    log.close()
+
+
+def test_row_durability_commits_every_row(tmp_path, clock):
+    path = tmp_path / 'packets.csv'
+    log = _logger(path, flush_rows=100, flush_s=60, durability='row')
+    log.write_packet(PACKET)
+    log.write_packet(PACKET)
+    assert log.commits == 2
+    assert len(_rows(path)) == 3
+    log.close()
+
+
+def test_close_commits_pending(tmp_path, clock):
+    path = tmp_path / 'packets.csv'
+    log = _logger(path, flush_rows=100, flush_s=60, durability='fsync')
+    log.write_packet(PACKET)
+    log.close()
+    assert log.commits == 1
+    assert len(_rows(path)) == 2
+
+
+def test_raw_payload_errors_only(tmp_path, clock):
+    path = tmp_path / 'packets.csv'
+    log = _logger(path, flush_rows=1, raw_payload='errors')
+    log.write_packet(PACKET, raw_payload='c109')
+    log.write_packet(None, raw_payload='zz', parse_error='bad frame')
+    log.close()
+    raw = CSV_HEADER.index('raw_payload')
+    assert [r[raw] for r in _rows(path)[1:]] == ['', 'zz']
+
+
+def test_header_written_once(tmp_path, clock):
+    path = tmp_path / 'packets.csv'
+    for _ in range(2):
+        log = _logger(path, flush_rows=1)
+        log.write_packet(PACKET)
+        log.close()
+    rows = _rows(path)
+    assert rows[0] == CSV_HEADER
+    assert len(rows) == 3
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        PacketCsvLogger('x.csv', durability='sometimes')
+    with pytest.raises(ValueError):
+        PacketCsvLogger('x.csv', raw_payload='maybe')
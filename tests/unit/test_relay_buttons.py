@@ -0,0 +1,69 @@
+from relay_control import FakeGPIO, RelayController, _Button
+
+
+def _button():
+    return _Button(pin=5, debounce_s=0.2, long_press_s=3.0)
+
+
+def test_short_press_reported_on_release():
+    b = _button()
+    b.feed(True, 0.0)
+    assert b.update(0.5) == []
+    assert b.update(1.0) == []
+    b.feed(False, 1.2)
+    assert b.update(1.3) == ['press']
+    assert b.update(2.0) == []
+
+
+def test_bounce_ignored():
+    b = _button()
+    b.feed(True, 0.0)
+    b.feed(False, 0.05)
+    b.feed(True, 0.08)
+    b.feed(False, 0.1)
+    assert b.update(1.0) == []
+
+
+def test_hold_gives_only_long():
+    b = _button()
+    b.feed(True, 0.0)
+    assert b.update(1.0) == []
+    assert b.update(3.1) == ['long']
+    assert b.update(4.0) == []
+    b.feed(False, 5.0)
+    assert b.update(5.1) == []
+
+
+def test_presses_between_polls():
+    b = _button()
+    b.feed(True, 0.0)
+    b.feed(False, 0.5)
+    b.feed(True, 1.0)
+    b.feed(False, 4.5)
+    assert b.update(5.0) == ['press', 'long']
+
+
+def test_relay_controller_override_events():
+    gpio, t = FakeGPIO(), [0.0]
+    relay = RelayController(pump_pin=17, valve_pin=None, active_low=True,
+                            btn_on_pin=5, btn_off_pin=6, led_pin=None,
+                            debounce_ms=200, long_press_ms=3000,
+                            gpio=gpio, clock=lambda: t[0])
+    relay.initialize()
+
+    def hold(pin, seconds):
+        gpio.press(pin)
+        for _ in range(int(seconds * 10)):
+            t[0] += 0.1
+            events.extend(relay.poll_buttons())
+        gpio.release(pin)
+        t[0] += 0.1
+        events.extend(relay.poll_buttons())
+
+    events = []
+    hold(5, 0.5)
+    assert events == ['ON']
+    events = []
+    hold(6, 4.0)
+    assert events == ['AUTO']
+    relay.cleanup()
@@ -0,0 +1,179 @@
+import math
+import time
+
+import numpy as np
+import pytest
+
+import clock
+from sensor_reader import ACS712_SENSITIVITY, FakeAdcBackend, SensorReader, whole_cycle_window
+
+AMPS, VOLTS, PF = 6.5, 230.0, 0.85
+
+
+@pytest.fixture
+def vclock():
+    vc = clock.VirtualClock()
+    clock.install(vc)
+    yield vc
+    clock.install(None)
+
+
+def _reader(interleaved=False, amps=AMPS, noise_v=0.0, **kwargs):
+    """SensorReader on a FakeAdcBackend: ACS712-30A on A0, ZMPT101B (cal 1.0) on A1."""
+    backend = FakeAdcBackend(data_rate=860, seed=1)
+    backend.set_signal(0, offset_v=2.5, amplitude_v=amps * math.sqrt(2) * ACS712_SENSITIVITY['30A'],
+                       phase_rad=-math.acos(PF), noise_v=noise_v)
+    backend.set_signal(1, offset_v=2.5, amplitude_v=VOLTS * math.sqrt(2), noise_v=noise_v)
+    reader = SensorReader(acs_model='30A', data_rate=860, mains_hz=50,
+                          interleaved=interleaved, backend=backend, **kwargs)
+    assert reader.initialize()
+    return reader
+
+
+# ── Whole-cycle windows ─────────────────────────────────────
+
+def test_whole_cycle_window_exact():
+    assert whole_cycle_window(860, 50, 10, 1024) == 172      # 17.2 samples per cycle
+    assert whole_cycle_window(860, 50, 5, 1024) == 86
+    assert whole_cycle_window(430, 50, 10, 1024) == 86       # interleaved pairs
+    assert whole_cycle_window(1000, 60, 3, 1024) == 50
+
+
+def test_whole_cycle_window_closest_fit():
+    n = whole_cycle_window(333, 50, 10, 1024)
+    cycles = n * 50 / 333
+    assert abs(cycles - round(cycles)) < 0.01
+    assert round(cycles) >= 10
+
+
+def test_whole_cycle_window_capped():
+    assert whole_cycle_window(860, 50, 100, 1024) == 1024
+    assert whole_cycle_window(333, 50, 10, 100) <= 100
+
+
+def test_reader_windows():
+    reader = _reader()
+    assert reader.active_window == 172
+    assert reader.idle_window == 86
+    assert _reader(interleaved=True).active_window == 86
+
+
+# ── RMS ─────────────────────────────────────────────────────
+
+@pytest.mark.parametrize('interleaved', [False, True])
+def test_rms_current_and_voltage(interleaved):
+    cv = _reader(interleaved=interleaved).read_all()
+    assert cv['available']
+    assert cv['current_amps'] == pytest.approx(AMPS, abs=0.02)
+    assert cv['voltage_ac'] == pytest.approx(VOLTS, abs=0.5)
+    assert cv['apparent_power_va'] == pytest.approx(AMPS * VOLTS, rel=0.005)
+
+
+def test_rms_with_noise_and_offset():
+    reader = _reader(noise_v=0.004)
+    assert reader.read_current_rms() == pytest.approx(AMPS, abs=0.05)
+    assert reader.read_voltage_rms() == pytest.approx(VOLTS, abs=0.5)
+    # Block mean is the sensor's DC offset
+    assert reader.dc_offset == pytest.approx([2.5, 2.5], abs=0.001)
+
+
+def test_pump_off_reads_zero_current():
+    cv = _reader(amps=0.0).read_all()
+    assert cv['current_amps'] == 0.0
+    assert cv['voltage_ac'] == pytest.approx(VOLTS, abs=0.5)
+
+
+def test_unavailable_reader():
+    reader = SensorReader(backend=None)
+    reader.available = False
+    assert reader.read_current_rms() is None
+    assert reader.read_all() == dict(SensorReader._EMPTY, available=False)
+
+
+def test_rms_helper():
+    x = np.array([1.0, -1.0, 1.0, -1.0])
+    assert SensorReader._rms(x) == 1.0
+
+
+# ── Background sampler ──────────────────────────────────────
+
+def _wait_for(cond, timeout_s=2.0):
+    deadline = time.monotonic() + timeout_s
+    while not cond():
+        assert time.monotonic() < deadline, "sampler produced no snapshot"
+        time.sleep(0.005)
+
+
+def test_sampler_publishes_snapshots(vclock):
+    reader = _reader()
+    reader.start()
+    try:
+        _wait_for(lambda: reader.read_all()['current_amps'] is not None)
+        cv = reader.read_all()
+        assert cv['current_amps'] == pytest.approx(AMPS, abs=0.02)
+        assert cv['voltage_ac'] == pytest.approx(VOLTS, abs=0.5)
+        assert reader._snapshot['samples'] == reader.idle_window
+
+        # A snapshot older than max_age_s is not served
+        vclock.advance(reader.max_age_s + 1)
+        assert reader.read_all()['current_amps'] is None
+    finally:
+        reader.stop()
+
+
+def test_sampler_switches_to_active_window(vclock):
+    reader = _reader()
+    reader.start()
+    try:
+        _wait_for(lambda: reader._snapshot is not None)
+        reader.set_pump_running(True)
+        _wait_for(lambda: reader._snapshot is not None
+                  and reader._snapshot['samples'] == reader.active_window)
+        assert reader.read_all()['current_amps'] == pytest.approx(AMPS, abs=0.02)
+    finally:
+        reader.stop()
+    # Stopped: read_all() samples synchronously again
+    assert reader._group is None
+    assert reader.read_all()['current_amps'] == pytest.approx(AMPS, abs=0.02)
+
+
+# ── Interleaved power and energy ────────────────────────────
+
+def test_real_power_and_power_factor():
+    cv = _reader(interleaved=True).read_all()
+    assert cv['real_power_w'] == pytest.approx(AMPS * VOLTS * PF, rel=0.01)
+    assert cv['power_factor'] == pytest.approx(PF, abs=0.01)
+
+
+def test_power_factor_needs_interleaved():
+    cv = _reader(interleaved=False).read_all()
+    assert cv['real_power_w'] is None
+    assert cv['power_factor'] is None
+    assert cv['energy_kwh'] is None
+
+
+def test_energy_accumulates(vclock):
+    reader = _reader(interleaved=True)
+    watts = reader.read_all()['real_power_w']
+    assert reader.energy_kwh == 0.0             # first window only sets the start time
+
+    vclock.advance(3600)
+    cv = reader.read_all()
+    assert cv['energy_kwh'] == pytest.approx(watts / 1000.0, rel=0.01)
+    assert cv['run_energy_kwh'] == cv['energy_kwh']
+
+    # A pump start restarts the run total but not the cumulative one
+    reader.set_pump_running(True)
+    vclock.advance(1800)
+    cv = reader.read_all()
+    assert cv['run_energy_kwh'] == pytest.approx(watts / 2000.0, rel=0.01)
+    assert cv['energy_kwh'] == pytest.approx(1.5 * watts / 1000.0, rel=0.01)
+
+
+def test_no_energy_without_current(vclock):
+    reader = _reader(interleaved=True, amps=0.0)
+    reader.read_all()
+    vclock.advance(3600)
+    cv = reader.read_all()
+    assert cv['real_power_w'] == pytest.approx(0.0, abs=1.0)
+    assert cv['energy_kwh'] == pytest.approx(0.0, abs=0.001)